@@ -0,0 +1,301 @@
+import os
+import math
+import time
+import json
+import asyncio
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
+from dotenv import load_dotenv
+import metrics
+
+load_dotenv()
+
+# Concurrent holders per resource and worker process: a browser is one Chrome, an llm slot
+# one OpenAI call
+ADMISSION_LIMITS = {
+    "browser": int(os.getenv('ADMISSION_BROWSERS', 4)),
+    "llm": int(os.getenv('ADMISSION_LLM_CALLS', 16)),
+}
+# Requests waiting per resource before new ones are turned away
+ADMISSION_QUEUE_SIZE = int(os.getenv('ADMISSION_QUEUE_SIZE', 32))
+# Seconds an API request may wait for any one slot, counted from when it starts waiting
+ADMISSION_WAIT_TIMEOUT = float(os.getenv('ADMISSION_WAIT_TIMEOUT', 30))
+# A new browser only starts while the machine has this much memory available (one always may)
+ADMISSION_MIN_FREE_MB = float(os.getenv('ADMISSION_MIN_FREE_MB', 1024))
+ADMISSION_LIMITS.update(json.loads(os.getenv('ADMISSION_LIMITS', '{}')))
+
+MEMORY_RESOURCES = {"browser"}
+# How often waiters for memory look again, nothing signals memory being freed
+MEMORY_POLL_INTERVAL = 0.5
+
+_lock = threading.Lock()
+_resources = {}
+# seconds the current request may wait per slot, None waits as long as it takes (queued jobs)
+_wait_timeout = contextvars.ContextVar("admission_wait_timeout", default=None)
+# resource -> asyncio.Lock the coroutines of the current request take turns in line with, see queue_once()
+_request_lines = contextvars.ContextVar("admission_request_lines", default=None)
+
+
+class Rejected(Exception):
+    """No slot within the wait timeout; the API answers 429 with Retry-After."""
+
+    def __init__(self, resource, reason, retry_after):
+        super().__init__(f"Too busy: no {resource} slot available ({reason}), retry in {retry_after}s")
+        self.resource = resource
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Resource:
+    def __init__(self, name, limit):
+        self.name = name
+        self.limit = limit
+        self.in_use = 0
+        self.waiters = deque()
+        self.condition = threading.Condition(_lock)
+        # ticket -> wake() of the coroutines in line; threads wait on the condition
+        self.wakers = {}
+        self.admitted = 0
+        self.rejected = {}
+        self.max_waiting = 0
+        self.waits = deque(maxlen=1000)
+        self.holds = deque(maxlen=100)
+
+    def can_start(self):
+        if self.in_use >= self.limit:
+            return False
+        return self.name not in MEMORY_RESOURCES or self.in_use == 0 or memory_available()
+
+    def retry_after(self):
+        # time for the queue ahead to drain at the recent hold time
+        hold = sum(self.holds) / len(self.holds) if self.holds else 5
+        return min(300, max(1, math.ceil(hold * (len(self.waiters) + 1) / max(1, self.limit))))
+
+
+def memory_available():
+    """Whether MemAvailable is above ADMISSION_MIN_FREE_MB (always true off Linux)."""
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) / 1024 >= ADMISSION_MIN_FREE_MB
+    except OSError:
+        pass
+    return True
+
+
+def _get_resource(name):
+    resource = _resources.get(name)
+    if not resource:
+        resource = _resources[name] = _Resource(name, ADMISSION_LIMITS.get(name, 1))
+    return resource
+
+
+def set_wait_timeout(seconds=ADMISSION_WAIT_TIMEOUT):
+    """Bound each slot wait of the current request (and threads copying its context).
+
+    Every acquire gets the full timeout from its own start, so a request that has been
+    running for minutes is not turned away at its last step.
+    """
+    _wait_timeout.set(seconds or None)
+
+
+def queue_once():
+    """Let the coroutines of the current request stand in each line one at a time.
+
+    A request fanning its calls out (asgi.py) then takes one place in line, like a thread of
+    app.py, instead of filling the queue and turning other requests away. While none of its
+    calls waits, the others still take free slots at once.
+    """
+    _request_lines.set({})
+
+
+def _get_deadline(start):
+    timeout = _wait_timeout.get()
+    return start + timeout if timeout is not None else None
+
+
+def _reject(resource, reason):
+    resource.rejected[reason] = resource.rejected.get(reason, 0) + 1
+    metrics.inc("admission_rejected_total", resource=resource.name, reason=reason)
+    return Rejected(resource.name, reason, resource.retry_after())
+
+
+def _enter(resource, deadline):
+    """Take a free slot at once (returns None) or join the line (returns the ticket)."""
+    if not resource.waiters and resource.can_start():
+        resource.in_use += 1
+        resource.admitted += 1
+        resource.waits.append(0.0)
+        return None
+    if deadline is not None and len(resource.waiters) >= ADMISSION_QUEUE_SIZE:
+        raise _reject(resource, "queue_full")
+    ticket = object()
+    resource.waiters.append(ticket)
+    resource.max_waiting = max(resource.max_waiting, len(resource.waiters))
+    return ticket
+
+
+def _ready(resource, ticket, deadline):
+    """Whether the ticket's turn has come with a free slot; raises Rejected past the deadline."""
+    # first come first served: only the head of the line takes a free slot
+    if resource.waiters[0] is ticket and resource.can_start():
+        return True
+    if deadline is not None and deadline <= time.monotonic():
+        # a free slot held back by low memory
+        raise _reject(resource, "memory" if resource.in_use < resource.limit else "timeout")
+    return False
+
+
+def _waker(event):
+    """Thread-safe wake() setting an asyncio.Event on its own event loop."""
+    loop = asyncio.get_running_loop()
+
+    def wake():
+        try:
+            loop.call_soon_threadsafe(event.set)
+        except RuntimeError:
+            # loop closed
+            pass
+    return wake
+
+
+def _wake(resource):
+    """Signal the waiting threads and the coroutine at the head of the line (the only one that can proceed)."""
+    resource.condition.notify_all()
+    if resource.waiters:
+        wake = resource.wakers.get(resource.waiters[0])
+        if wake:
+            wake()
+
+
+def _admit(resource, waited):
+    resource.in_use += 1
+    resource.admitted += 1
+    resource.waits.append(waited)
+    metrics.observe("admission_wait_seconds", waited, resource=resource.name)
+
+
+def acquire(name):
+    """Wait in line for a slot of `name`; raises Rejected when the queue is full or the wait times out."""
+    start = time.monotonic()
+    deadline = _get_deadline(start)
+    with _lock:
+        resource = _get_resource(name)
+        ticket = _enter(resource, deadline)
+        if ticket is None:
+            return
+        try:
+            while not _ready(resource, ticket, deadline):
+                timeout = MEMORY_POLL_INTERVAL if name in MEMORY_RESOURCES else None
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    timeout = min(timeout or remaining, remaining)
+                resource.condition.wait(timeout)
+        finally:
+            resource.waiters.remove(ticket)
+            _wake(resource)
+        _admit(resource, time.monotonic() - start)
+
+
+async def aacquire(name):
+    """acquire() for coroutines: same line and timeout, woken on the event loop when their turn may have come."""
+    start = time.monotonic()
+    lines = _request_lines.get()
+    if lines is None:
+        return await _aacquire(name, start)
+    # the wait behind the request's own coroutine counts towards the timeout
+    async with lines.setdefault(name, asyncio.Lock()):
+        await _aacquire(name, start)
+
+
+async def _aacquire(name, start):
+    deadline = _get_deadline(start)
+    event = asyncio.Event()
+    with _lock:
+        resource = _get_resource(name)
+        ticket = _enter(resource, deadline)
+        if ticket is None:
+            return
+        resource.wakers[ticket] = _waker(event)
+    try:
+        while True:
+            with _lock:
+                if _ready(resource, ticket, deadline):
+                    _admit(resource, time.monotonic() - start)
+                    break
+                event.clear()
+            timeout = MEMORY_POLL_INTERVAL if name in MEMORY_RESOURCES else None
+            if deadline is not None:
+                remaining = max(0, deadline - time.monotonic())
+                timeout = min(timeout or remaining, remaining)
+            try:
+                await asyncio.wait_for(event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        with _lock:
+            resource.waiters.remove(ticket)
+            del resource.wakers[ticket]
+            _wake(resource)
+
+
+def release(name, held=None):
+    with _lock:
+        resource = _get_resource(name)
+        resource.in_use -= 1
+        if held is not None:
+            resource.holds.append(held)
+        _wake(resource)
+
+
+@contextmanager
+def slot(name):
+    """Hold one slot of `name` for the block."""
+    acquire(name)
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        release(name, time.monotonic() - start)
+
+
+@asynccontextmanager
+async def aslot(name):
+    """slot() for coroutines."""
+    await aacquire(name)
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        release(name, time.monotonic() - start)
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)] if ordered else 0.0
+
+
+def get_stats():
+    """In use, queue depth and wait times per resource."""
+    with _lock:
+        for name in ADMISSION_LIMITS:
+            _get_resource(name)
+        return {
+            name: {
+                "limit": resource.limit,
+                "in_use": resource.in_use,
+                "waiting": len(resource.waiters),
+                "max_waiting": resource.max_waiting,
+                "admitted": resource.admitted,
+                "rejected": dict(resource.rejected),
+                "wait_p50": round(_percentile(resource.waits, 50), 3),
+                "wait_p95": round(_percentile(resource.waits, 95), 3),
+                "wait_max": round(max(resource.waits, default=0.0), 3),
+                "avg_hold": round(sum(resource.holds) / len(resource.holds), 3) if resource.holds else None,
+                "memory_available": memory_available() if name in MEMORY_RESOURCES else None,
+            }
+            for name, resource in _resources.items()
+        }
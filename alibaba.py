@@ -10,49 +10,68 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException, NoSuchElementException, ElementClickInterceptedException
 from selenium import webdriver
 from webdriver_manager.chrome import ChromeDriverManager
+from urllib.parse import urljoin
+from bs4 import BeautifulSoup
+import page_archive
+import domain_scheduler
+import metrics
 
 
-def fetch_alibaba_product_detail(product_url, driver):
-    driver.get(product_url)
-    time.sleep(random.uniform(2, 5))
-    try:
-        try:
-            title = driver.find_element(
-                By.CSS_SELECTOR, ".product-title-container h1").text
-        except:
-            title = "N/A"
+# Resolves relative image srcs when the page URL is unknown (benchmarks, parser checks)
+BASE_URL = "https://www.alibaba.com/"
+
+
+def _select_text(soup, selector):
+    element = soup.select_one(selector)
+    return element.get_text(" ", strip=True) if element else "N/A"
+
+
+def _image_url(img, page_url):
+    """Absolute URL of an <img>, as the browser resolves it; lazy images only carry data-src."""
+    src = img.get("src")
+    if not src or src.startswith("data:"):
+        src = img.get("data-src")
+    return urljoin(page_url, src) if src else None
+
 
-        # Extract product price
-        try:
-            price = driver.find_element(
-                By.CSS_SELECTOR, ".product-price .price-item .price span").text
-        except:
-            price = "N/A"
+def parse_alibaba_html(html, product_url=BASE_URL):
+    """Extract the product fields from an Alibaba product page."""
+    soup = BeautifulSoup(html, 'html.parser')
 
-        # Extract product description (usually in a div element)
-        try:
-            description = driver.find_element(
-                By.CSS_SELECTOR, "div.product-description").text
-        except:
-            description = "N/A"
+    title = _select_text(soup, ".product-title-container h1")
 
-        # Extract product images
-        images = []
-        try:
-            image_elements = driver.find_elements(
-                By.CSS_SELECTOR, '.module_productImage div[data-com="ProductImageView"] img')
-            for img in image_elements:
-                images.append(img.get_attribute("src"))
-        except:
-            images = []
+    # Extract product price
+    price = _select_text(soup, ".product-price .price-item .price span")
 
-        # Return the scraped product data
-        found_data = {
-            "title": title,
-            "price": price,
-            "description": description,
-            "images": images
-        }
+    # Extract product description (usually in a div element)
+    description = _select_text(soup, "div.product-description")
+
+    # Extract product images
+    images = [url for url in (_image_url(img, product_url) for img in
+                              soup.select('.module_productImage div[data-com="ProductImageView"] img')) if url]
+
+    return {
+        "title": title,
+        "price": price,
+        "description": description,
+        "images": images
+    }
+
+
+@metrics.timed("fetch", store="alibaba")
+def fetch_alibaba_product_detail(product_url, driver):
+    try:
+        with domain_scheduler.slot(product_url, driver=driver) as slot:
+            driver.get(product_url)
+            time.sleep(random.uniform(2, 5))
+            html = driver.page_source
+            # slider captcha ("punish") page
+            slot.blocked = "_____tmd_____" in driver.current_url
+        if slot.blocked:
+            # neither cached nor archived: the next request tries the page again
+            return {"success": 0, "message": "Blocked by the slider captcha."}
+        page_archive.save("alibaba", product_url, html)
+        found_data = parse_alibaba_html(html, product_url)
         output_data = {"success": 1, "data": found_data}
         return output_data
     except TimeoutException:
@@ -8,9 +8,69 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException, NoSuchElementException, ElementClickInterceptedException
 from selenium import webdriver
 from webdriver_manager.chrome import ChromeDriverManager
+from urllib.parse import urljoin
+from bs4 import BeautifulSoup
+import page_archive
+import domain_scheduler
+import metrics
 
 
+# Resolves relative image srcs when the page URL is unknown (benchmarks, parser checks)
+BASE_URL = "https://www.aliexpress.com/"
+
+
+def _select_text(soup, selector):
+    element = soup.select_one(selector)
+    return element.get_text(" ", strip=True) if element else "N/A"
+
+
+def _image_url(img, page_url):
+    """Absolute URL of an <img>, as the browser resolves it; lazy images only carry data-src."""
+    src = img.get("src")
+    if not src or src.startswith("data:"):
+        src = img.get("data-src")
+    return urljoin(page_url, src) if src else None
+
+
+def parse_aliexpress_html(html, product_url=BASE_URL):
+    """Extract the product fields from an AliExpress product page."""
+    soup = BeautifulSoup(html, 'html.parser')
+
+    title = _select_text(soup, 'h1[data-pl="product-title"]')
+
+    # Extract product price
+    price = _select_text(soup, ".product-price-value")
+
+    # Extract product description (usually in a div element)
+    description = _select_text(soup, "div.product-description")
+
+    # Extract product images
+    images = [url for url in (_image_url(img, product_url) for img in
+                              soup.select('.module_productImage div[data-com="ProductImageView"] img')) if url]
+
+    # Extract product variants (if any)
+    variants = [variant.get_text(strip=True) for variant in soup.select('div[data-sku-col] span')]
+
+    return {
+        'title': title,
+        'price': price,
+        'description': description,
+        'images': images,
+        'variants': variants
+    }
+
+
+@metrics.timed("fetch", store="aliexpress")
 def fetch_aliexpress_product_detail(product_url, driver):
+    with domain_scheduler.slot(product_url, driver=driver) as slot:
+        # an unsolved CAPTCHA ends in an error or a failed result
+        slot.blocked = True
+        output_data = _fetch_aliexpress_product_detail(product_url, driver)
+        slot.blocked = not output_data.get('success')
+    return output_data
+
+
+def _fetch_aliexpress_product_detail(product_url, driver):
     product_details = {}
     driver.get(product_url)
 
@@ -63,55 +123,17 @@ def fetch_aliexpress_product_detail(product_url, driver):
                 # print("Error banner not found, but URL did not change. outter")
                 recaptcha_solved = True
         
-        if recaptcha_solved or not is_recaptcha_on:
-            try:
-                title = driver.find_element(By.CSS_SELECTOR, 'h1[data-pl="product-title"]').text
-            except:
-                title = "N/A"
-            
-            # Extract product price
-            try:
-                price = driver.find_element(By.CSS_SELECTOR, ".product-price-value").text
-            except:
-                price = "N/A"
-
-            # Extract product description (usually in a div element)
-            try:
-                description = driver.find_element(By.CSS_SELECTOR, "div.product-description").text
-            except:
-                description = "N/A"
-            
-            # Extract product images
-            images = []
-            try:
-                image_elements = driver.find_elements(By.CSS_SELECTOR, '.module_productImage div[data-com="ProductImageView"] img')
-                for img in image_elements:
-                    images.append(img.get_attribute("src"))
-            except:
-                images = []
-
-            # Extract product variants (if any)
-            variants = []
-            try:
-                variant_elements = driver.find_elements(By.CSS_SELECTOR, 'div[data-sku-col] span')
-                for variant in variant_elements:
-                    variants.append(variant.text)
-            except:
-                variants = []
-
-            # Close the browser
+        if is_recaptcha_on and not recaptcha_solved:
             driver.quit()
+            return {'success': 0, 'message': "Failed to load the product page due to unsolved captcha."}
+
+        html = driver.page_source
+        page_archive.save("aliexpress", product_url, html)
+        found_data = parse_aliexpress_html(html, product_url)
 
-            # Return the scraped product data
-            found_data = {
-                'title': title,
-                'price': price,
-                'description': description,
-                'images': images,
-                'variants': variants
-            }
+        # Close the browser
+        driver.quit()
 
-       
         output_data = {'success':1,'data':found_data}
         return output_data
         
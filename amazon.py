@@ -7,6 +7,9 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException, NoSuchElementException, ElementClickInterceptedException
 from bs4 import BeautifulSoup
 import json
+import page_archive
+import domain_scheduler
+import metrics
 
 
 def to_snake_case(text):
@@ -15,6 +18,7 @@ def to_snake_case(text):
 # Function to solve captcha
 
 
+@metrics.timed("solve_captcha", store="amazon")
 def solve_captcha(driver, max_retries=3):
     for attempt in range(max_retries):
         print(f"Attempt {attempt + 1} to solve captcha")
@@ -51,49 +55,62 @@ def solve_captcha(driver, max_retries=3):
     return False
 
 
+def parse_amazon_html(html, product_url=None):
+    """Extract the product fields from an Amazon product page (its image URLs are absolute)."""
+    soup = BeautifulSoup(html, 'html.parser')
+
+    try:
+        title = soup.find('h1', {'id': 'title'}).text.strip()
+    except:
+        title = ""
+
+    try:
+        price = soup.find(
+            "span", {"class": "a-price"}).find("span").text
+    except:
+        price = ""
+
+    try:
+        images = re.findall('"hiRes":"(.+?)"', html)
+    except:
+        images = []
+
+    try:
+        description = soup.select_one(
+            '#productDescription').text.strip()
+    except:
+        description = ""
+
+    return {
+        "title": title,
+        "price": price,
+        "description": description,
+        "images": images
+    }
+
+
+@metrics.timed("fetch", store="amazon")
 def fetch_amazon_product_detail(product_url, driver):
-    # solve captcha
-    if solve_captcha(driver):
-        driver.get(product_url)
-        time.sleep(5)
-        html = driver.page_source
-        soup = BeautifulSoup(html, 'html.parser')
-
-        try:
-            title = soup.find('h1', {'id': 'title'}).text.strip()
-        except:
-            title = ""
-
-        try:
-            price = soup.find(
-                "span", {"class": "a-price"}).find("span").text
-        except:
-            price = ""
-
-        try:
-            images = re.findall('"hiRes":"(.+?)"', html)
-        except:
-            images = []
-
-        try:
-            description = soup.select_one(
-                '#productDescription').text.strip()
-        except:
-            description = ""
-
-        found_data = {
-            "title": title,
-            "price": price,
-            "description": description,
-            "images": images
-        }
+    with domain_scheduler.slot(product_url, driver=driver) as slot:
+        # solve captcha
+        is_solved = solve_captcha(driver)
+        if is_solved:
+            driver.get(product_url)
+            time.sleep(5)
+            html = driver.page_source
+        slot.blocked = not is_solved or 'captchacharacters' in html
+
+    if not slot.blocked:
+        page_archive.save("amazon", product_url, html)
+        found_data = parse_amazon_html(html)
 
         output_data = {"success": 1, "data": found_data}
         driver.quit()
         return output_data
 
     else:
-        message = "Failed to navigate to the product page due to unsolved captcha."
+        message = "Failed to navigate to the product page due to unsolved captcha." if not is_solved \
+            else "Blocked by the captcha page."
         output_data = {"success": 0, "message": message}
         driver.quit()
         return output_data
@@ -10,7 +10,7 @@ from amazon import fetch_amazon_product_detail
 from aliexpress import fetch_aliexpress_product_detail
 from alibaba import fetch_alibaba_product_detail
 from shopify import fetch_shopify_product_detail
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context, g
 
 import time
 import os
@@ -37,22 +37,139 @@ from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage
 
 from Schema.BlogPost import BlogPost
+import usage_tracker
+import schema_repair
+import length_constraints
+import model_router
+import job_queue
+import batch
+import singleflight
+import scrape_cache
+import domain_scheduler
+import proxy_pool
+import fingerprint
+import cassette
+import canonical_url
+import metrics
+import tracing
+import profiler
+import memory_monitor
+import admission
 
 
 # Load environment variables
 load_dotenv()
 
-# A list of different User-Agent strings to rotate between
-user_agents = [
-    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.36',
-    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_13_4) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/11.1 Safari/605.1.15',
-    'Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:52.0) Gecko/20100101 Firefox/52.0'
-]
-
+# Record or replay outbound traffic when CASSETTE_MODE is set
+cassette.install()
 
 app = Flask(__name__)
+_initialized_pid = None
+_chromedriver_path = None
+
+
+def create_app():
+    """Initialise the resources of this process and return the app.
+
+    Runs once per serving process: serve.py calls it in every worker after the fork, so
+    background threads and clients are never shared between workers.
+    """
+    global _initialized_pid
+    if _initialized_pid == os.getpid():
+        return app
+    _initialized_pid = os.getpid()
+    usage_tracker.start_dump_thread()
+    # kills Chrome processes left behind by drivers that were never quit
+    memory_monitor.start_reaper()
+    job_queue.init_db()
+    if not cassette.is_replaying():
+        try:
+            get_chromedriver_path()
+        except Exception as e:
+            print(f"Error resolving chromedriver: {e}")
+    return app
+
+
+def get_chromedriver_path():
+    # ChromeDriverManager looks up the matching driver online on every install(), resolve it once
+    global _chromedriver_path
+    if _chromedriver_path is None:
+        _chromedriver_path = ChromeDriverManager().install()
+    return _chromedriver_path
+
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    metrics.set_labels()
+    admission.set_wait_timeout()
+    # continues the caller's trace when it sends a traceparent header
+    g.trace_span, g.trace_token = tracing.start(f"{request.method} {request.path}", request.headers.get('traceparent'))
+    if profiler.should_profile(request.path, request.headers):
+        g.profile = profiler.Sampler().start()
+
+
+@app.after_request
+def record_request_time(response):
+    if 'request_start' in g:
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.observe("http_request_duration_seconds", time.perf_counter() - g.request_start,
+                        endpoint=endpoint, method=request.method, status=str(response.status_code))
+    if 'trace_span' in g and g.trace_span.trace_id:
+        g.trace_span.set(status_code=response.status_code)
+        response.headers['X-Trace-Id'] = g.trace_span.trace_id
+    if 'profile' in g:
+        save_profile(g.pop('profile'), response)
+    return response
+
+
+def save_profile(sampler, response):
+    sampler.stop()
+    data = request.get_json(silent=True) or {}
+    try:
+        path = sampler.save(profile_metadata(request.path, response.status_code, data))
+        response.headers['X-Profile'] = os.path.basename(path)
+    except OSError as e:
+        print(f"Error saving profile: {e}")
+
+
+def profile_metadata(path, status_code, data):
+    """meta.json fields of a request profile, `data` being the request's JSON payload."""
+    data = data if isinstance(data, dict) else {}
+    return {
+        "path": path,
+        "status_code": status_code,
+        "trace_id": tracing.current_trace_id(),
+        "store": data.get('store_name'),
+        "product_url": data.get('product_url'),
+        "template_id": data.get('template_id'),
+        "language": data.get('language'),
+        "is_generate": data.get('is_generate'),
+        "prompt": (data.get('prompt') or '')[:200] or None,
+    }
+
+
+@app.errorhandler(admission.Rejected)
+def too_busy(error):
+    return jsonify({"success": False, "message": str(error)}), 429, {"Retry-After": str(error.retry_after)}
 
-IMAGE_DIR = '/var/www/html/automated-stores/x-builder-core/img/product-images'
+
+@app.teardown_request
+def end_request_span(error=None):
+    if 'trace_span' in g:
+        try:
+            tracing.finish(g.trace_span, g.trace_token, error)
+        except ValueError:
+            # token created in another context (streamed responses)
+            pass
+
+
+IMAGE_DIR = os.getenv('IMAGE_DIR', '/var/www/html/automated-stores/x-builder-core/img/product-images')
+# Public URL the files of IMAGE_DIR are served under
+IMAGE_BASE_URL = os.getenv('IMAGE_BASE_URL', 'https://dev.xbuilder.ai/x-builder-core/img/product-images')
+BLOG_IMAGE_DIR = os.getenv('BLOG_IMAGE_DIR', '/var/www/html/automated-stores/x-builder-core/img/blogs')
+# Images and chat completions endpoints, e.g. pointed at a local stand-in by the benchmarks
+OPENAI_API_BASE = os.getenv('OPENAI_API_BASE', 'https://api.openai.com/v1')
 
 # Create the directory if it doesn't exist
 os.makedirs(IMAGE_DIR, exist_ok=True)
@@ -66,8 +183,9 @@ def slugify(string):
 def get_timestamp():
     return datetime.now().strftime('%Y%m%d_%H%M%S_%f')
 
+@metrics.timed("save_image")
 def save_image(image_url, filename):
-    response = requests.get(image_url)
+    response = proxy_pool.get(image_url)
     if response.status_code == 200:
         with open(os.path.join(IMAGE_DIR, filename), 'wb') as f:
             f.write(response.content)
@@ -76,8 +194,9 @@ def save_image(image_url, filename):
         print("Error downloading image:", response.content)
         return None
 
+@metrics.timed("generate_images")
 def generate_images(prompt, num_images=4):
-    dalle_url = 'https://api.openai.com/v1/images/generations'
+    dalle_url = f'{OPENAI_API_BASE}/images/generations'
     headers = {
         'Authorization': f"Bearer {os.getenv('OPENAI_API_KEY')}",
         'Content-Type': 'application/json'
@@ -88,7 +207,8 @@ def generate_images(prompt, num_images=4):
         'n': num_images,
         'size': '1024x1024'
     }
-    response = requests.post(dalle_url, headers=headers, json=data)
+    with admission.slot("llm"):
+        response = requests.post(dalle_url, headers=headers, json=data)
     if response.status_code == 200:
         images = [img['url'] for img in response.json().get('data', [])]
     else:
@@ -97,7 +217,7 @@ def generate_images(prompt, num_images=4):
 
 
 def generate_banner_image(prompt, title):
-    dalle_url = 'https://api.openai.com/v1/images/generations'
+    dalle_url = f'{OPENAI_API_BASE}/images/generations'
     headers = {
         'Authorization': f"Bearer {os.getenv('OPENAI_API_KEY')}",
         'Content-Type': 'application/json'
@@ -108,7 +228,11 @@ def generate_banner_image(prompt, title):
         'size': '1024x1024'
     }
     
-    response = requests.post(dalle_url, headers=headers, json=data)
+    start = time.time()
+    with admission.slot("llm"):
+        response = requests.post(dalle_url, headers=headers, json=data)
+    usage_tracker.record("banner", model="dall-e", images=1, latency=time.time() - start,
+                         success=response.status_code == 200)
     
     if response.status_code == 200:
         image_info = response.json().get('data', [])[0]
@@ -117,7 +241,7 @@ def generate_banner_image(prompt, title):
         if image_url:
             img_data = requests.get(image_url).content
             file_name = f"{slugify(title)}.png"
-            file_path = f"/var/www/html/automated-stores/x-builder-core/img/blogs/{file_name}"
+            file_path = os.path.join(BLOG_IMAGE_DIR, file_name)
             relative_path = f"img/blogs/{file_name}"
             
             # Ensure the directory exists
@@ -135,7 +259,7 @@ def generate_banner_image(prompt, title):
 def save_blog_banner(image_url, title):
     img_data = requests.get(image_url).content
     file_name = f"{slugify(title)}.png"
-    file_path = f"/var/www/html/automated-stores/x-builder-core/img/blogs/{file_name}"
+    file_path = os.path.join(BLOG_IMAGE_DIR, file_name)
     relative_path = f"img/blogs/{file_name}"
     
     # Ensure the directory exists
@@ -147,8 +271,9 @@ def save_blog_banner(image_url, title):
     
     return relative_path
 
+@metrics.timed("generate_variations")
 def generate_variations(image_urls):
-    dalle_variation_url = 'https://api.openai.com/v1/images/variations'
+    dalle_variation_url = f'{OPENAI_API_BASE}/images/variations'
     headers = {
         'Authorization': f"Bearer {os.getenv('OPENAI_API_KEY')}"
     }
@@ -168,7 +293,8 @@ def generate_variations(image_urls):
             "size": "1024x1024"
         }
 
-        response = requests.post(dalle_variation_url, headers=headers, files=files, data=data)
+        with admission.slot("llm"):
+            response = requests.post(dalle_variation_url, headers=headers, files=files, data=data)
 
         if response.status_code == 200:
             variations += [img['url'] for img in response.json().get('data', [])]
@@ -177,21 +303,71 @@ def generate_variations(image_urls):
     return variations
 
 
+def image_filename(filename_prefix, index):
+    return f"{filename_prefix}-{index}-{get_timestamp()}.png"
+
+
 def save_and_append_image(img_url, filename_prefix, image_list):
     """Helper function to save an image and append its URL to the image list."""
-    filename = f"{filename_prefix}-{len(image_list) + 1}-{get_timestamp()}.png"
-    saved_filename = save_image(img_url, filename)
+    saved_filename = save_image(img_url, image_filename(filename_prefix, len(image_list) + 1))
     if saved_filename:
-        image_list.append(f"https://dev.xbuilder.ai/x-builder-core/img/product-images/{saved_filename}")
+        image_list.append(f"{IMAGE_BASE_URL}/{saved_filename}")
+
+
+# Images a product ends up with, and how many of the supplier's are kept
+PRODUCT_IMAGES = 4
+SUPPLIER_IMAGES = 5
+
+
+def image_steps(data):
+    """The image steps of scrape_product for scraped `data`, without their I/O.
 
-def generate_required_images(product_title, num_images_needed, local_images):
-    """Generate and save images until the required count is met."""
-    prompt = f"Create a variation of {product_title}."
-    new_images = generate_images(prompt, num_images_needed)
-    for new_img_url in new_images:
-        save_and_append_image(new_img_url, f"generated-{product_title}-image", local_images)
-        if len(local_images) >= 4:
-            break
+    Yields (kind, argument, filename_prefix, limit): "save" the image URLs in argument,
+    "generate" argument = (prompt, count) images or "vary" the local images in argument, then
+    save the resulting URLs while fewer than `limit` local images exist. The caller sends the
+    local image URLs back after each step. asgi.py runs the same steps on the event loop.
+    """
+    title = data.get('title', 'product')
+    slug = slugify(title)
+    existing_images = data.get("images", [])[:SUPPLIER_IMAGES] if isinstance(data.get("images"), list) else []
+    local_images = yield "save", existing_images, f"{slug}-image", SUPPLIER_IMAGES
+
+    # If no images exist, generate the first one
+    if not local_images:
+        prompt = f"Create an image of {title}, which is {data.get('description', '')}."
+        local_images = yield "generate", (prompt, 1), f"created-{slug}-image", 1
+
+    # Generate variations, then new images, if less than 4 exist
+    if len(local_images) < PRODUCT_IMAGES:
+        num_images_needed = PRODUCT_IMAGES - len(local_images)
+        if local_images:
+            local_images = yield "vary", list(local_images), f"generated-{slug}-variation", PRODUCT_IMAGES
+        if len(local_images) < PRODUCT_IMAGES:
+            yield ("generate", (f"Create a variation of {slug}.", num_images_needed), f"generated-{slug}-image",
+                   PRODUCT_IMAGES)
+
+
+def collect_images(data):
+    """Run image_steps(data) and return the local image URLs."""
+    local_images = []
+    steps = image_steps(data)
+    step = next(steps)
+    while True:
+        kind, argument, filename_prefix, limit = step
+        if kind == "generate":
+            image_urls = generate_images(*argument)
+        elif kind == "vary":
+            image_urls = generate_variations(argument)
+        else:
+            image_urls = argument
+        for img_url in image_urls:
+            if len(local_images) >= limit:
+                break
+            save_and_append_image(img_url, filename_prefix, local_images)
+        try:
+            step = steps.send(local_images)
+        except StopIteration:
+            return local_images
 
 
 def get_db():
@@ -230,83 +406,215 @@ def test_db():
     return jsonify({"success": True})
 
 
-@app.route('/product-details', methods=['POST'])
-def product_details():
-    data = request.json
-    product_url = data.get('product_url')
-    language = data.get('language', 'English')
-    store_name = data.get('store_name')
-    is_generate = data.get('is_generate', False)
-    template_id = None
-
-    if is_generate:
+def validate_product_request(data):
+    """Return the error message for an invalid /product-details payload, or None."""
+    if data.get('is_generate', False):
         template_id = data.get('template_id')
         if not template_id or template_id == "":
-            return jsonify({"success": False, "message": "Template Id is required"})
+            return "Template Id is required"
 
+    store_name = data.get('store_name')
     if not store_name or store_name == "":
-        return jsonify({"success": False, "message": "Store Name is required"})
+        return "Store Name is required"
+
+    product_url = data.get('product_url')
+    if not isinstance(product_url, str) or not product_url.strip():
+        return "Product URL is required"
+
+    if not canonical_url.split_url(product_url)[0]:
+        return "Product URL is invalid"
+
+    return None
 
-    if not product_url or product_url == "":
-        return jsonify({"success": False, "message": "Product URL is required"})
 
-    driver = get_driver()
+def get_store_driver(product_url):
+    """Browser for a product page, with a proxy and a fingerprint profile picked for its site."""
+    proxy = proxy_pool.choose(product_url)
+    return get_driver(proxy=proxy, profile=fingerprint.choose(product_url, proxy))
 
-    response = {}
 
+def fetch_product_detail(store_name, product_url):
+    # browser stores wait for the site's politeness slot, then for a browser slot, and only then
+    # start their Chrome: a burst to one site does not fill the browser slots with idle Chromes
     match store_name:
         case "alibaba":
-            response = fetch_alibaba_product_detail(product_url, driver)
+            with domain_scheduler.hold(product_url), admission.slot("browser"):
+                return fetch_alibaba_product_detail(product_url, get_store_driver(product_url))
         case "shopify":
-            response = fetch_shopify_product_detail(product_url)
+            return fetch_shopify_product_detail(product_url)
         case "aliexpress":
-            response = fetch_aliexpress_product_detail(product_url, driver)
+            with domain_scheduler.hold(product_url), admission.slot("browser"):
+                return fetch_aliexpress_product_detail(product_url, get_store_driver(product_url))
         case "amazon":
-            response = fetch_amazon_product_detail(product_url, driver)
+            with domain_scheduler.hold(product_url), admission.slot("browser"):
+                return fetch_amazon_product_detail(product_url, get_store_driver(product_url))
         case _:
-            response = {"success": False, "message": "Store not supported"}
+            return {"success": False, "message": "Store not supported"}
 
-    # Main code starts here
-    local_images = []
-    product_title_slug = slugify(response['data'].get('title', 'product'))
-    existing_images = response['data'].get("images", [])[:5] if isinstance(response['data'].get("images"), list) else []
 
-    # Save existing images locally
-    for i, img_url in enumerate(existing_images):
-        save_and_append_image(img_url, f"{product_title_slug}-image", local_images)
+def scrape_product(store_name, product_url, progress, force_refresh=False):
+    """Scrape a product page and save its images locally, generating images when there are too few."""
+    progress("scrape", "running")
+    response = scrape_cache.get_or_fetch(store_name, product_url, fetch_product_detail, force_refresh)
+    progress("scrape", "done")
 
-    # If no images exist, generate the first one
-    if not local_images:
-        prompt = f"Create an image of {response['data'].get('title', 'product')}, which is {response['data'].get('description', '')}."
-        first_image = generate_images(prompt, 1)
-        if first_image:
-            save_and_append_image(first_image[0], f"created-{product_title_slug}-image", local_images)
-
-    # Generate additional images or variations if less than 4 exist
-    if len(local_images) < 4:
-        num_images_needed = 4 - len(local_images)
-        if local_images:
-            variations = generate_variations(local_images)
-            for variation_url in variations:
-                save_and_append_image(variation_url, f"generated-{product_title_slug}-variation", local_images)
-                if len(local_images) >= 4:
-                    break
+    if not response.get('success', False):
+        return response
 
-        # If still not enough images, generate new ones
-        if len(local_images) < 4:
-            generate_required_images(product_title_slug, num_images_needed, local_images)
+    progress("images", "running")
+    with tracing.span("images") as span:
+        local_images = collect_images(response['data'])
+        span.set(images=len(local_images))
 
     # Update response with local image URLs
     response['data']["images"] = local_images
+    progress("images", "done")
+    return response
+
+
+def run_product_details(data, progress=None):
+    """Run the /product-details pipeline for one payload and return the response dict.
+
+    `progress(stage, status)` is called as each stage starts and finishes. Scrapes come
+    from scrape_cache unless the payload sets "refresh". Concurrent
+    requests for the same product share one scrape, and one generation per template
+    and language.
+    """
+    progress = progress or (lambda stage, status: None)
+    message = validate_product_request(data)
+    if message:
+        return {"success": False, "message": message}
+
+    req = product_request(data)
+    metrics.set_labels(store=req["store_name"], template=req["template_id"])
+    with tracing.span("scrape", store=req["store_name"], product_url=req["product_url"]):
+        response = singleflight.do(req["scrape_key"], scrape_product, req["store_name"], req["product_url"],
+                                   progress, req["refresh"])
+
+    if not response.get('success', False):
+        return response
 
     # Generate product using OpenAI
-    if response.get('success', False) and is_generate:
-        product = generate_product_details(response['data'], template_id, language)
+    if req["is_generate"]:
+        progress("generate", "running")
+        with tracing.span("generate", template=req["template_id"], language=req["language"]):
+            product = singleflight.do(req["generate_key"], generate_product_details, response['data'],
+                                      req["template_id"], req["language"], progress)
         response['data'] = product
-        
-    print(jsonify(response))
-    # time.sleep(2)
-    return jsonify(response)
+        progress("generate", "done")
+
+    return response
+
+
+def product_request(data):
+    """The fields of a valid /product-details payload the pipeline runs on, with its singleflight keys."""
+    store_name = data.get('store_name')
+    language = data.get('language', 'English')
+    is_generate = bool(data.get('is_generate', False))
+    template_id = data.get('template_id') if is_generate else None
+    refresh = bool(data.get('refresh', False))
+    key = singleflight.product_key(store_name, data.get('product_url'))
+    return {
+        "store_name": store_name,
+        "product_url": data.get('product_url'),
+        "language": language,
+        "is_generate": is_generate,
+        "template_id": template_id,
+        "refresh": refresh,
+        # a refresh never joins a cached read in flight, only other refreshes
+        "scrape_key": ("scrape", key, refresh),
+        "generate_key": ("generate", key, str(template_id), language),
+    }
+
+
+@app.route('/product-details', methods=['POST'])
+def product_details():
+    data = request.json
+
+    # Job mode: queue the pipeline and let the workers run it
+    if data.get('async', False):
+        message = validate_product_request(data)
+        if message:
+            return jsonify({"success": False, "message": message})
+        job_id = job_queue.enqueue({**data, "traceparent": tracing.get_traceparent()})
+        return jsonify({"success": True, "job_id": job_id, "status_url": f"/jobs/{job_id}",
+                        "trace_id": tracing.current_trace_id()}), 202
+
+    response = run_product_details(data)
+    return jsonify({**response, "trace_id": tracing.current_trace_id()})
+
+
+@app.route('/product-details/batch', methods=['POST'])
+def product_details_batch():
+    data = request.json
+    items = data.get('items') if isinstance(data, dict) else data
+
+    if not isinstance(items, list) or not items:
+        return jsonify({"success": False, "message": "Items are required"})
+
+    if len(items) > batch.BATCH_MAX_ITEMS:
+        return jsonify({"success": False, "message": f"At most {batch.BATCH_MAX_ITEMS} items are allowed"})
+
+    # checked before streaming: a bad item found mid-stream could no longer change the 200
+    message = batch.validate_items(items)
+    if message:
+        return jsonify({"success": False, "message": message}), 400
+
+    def generate():
+        for result in batch.run_batch(items, run_product_details):
+            yield json.dumps(result) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = job_queue.get_job(job_id)
+    if not job:
+        return jsonify({"success": False, "message": "Job not found"}), 404
+    return jsonify({"success": True, "data": job})
+
+
+# Enhanced writing instructions
+BLOG_WRITING_INSTRUCTIONS = (
+    "You are a professional blog writer. Your task is to create a detailed, engaging, and SEO-optimized blog post. "
+    "Your writing should include:\n"
+    "- A catchy title that attracts readers\n"
+    "- Clear and informative sections with appropriate HTML headings (e.g., <h2>, <h3>)\n"
+    "- Bullet points for lists using <ul> and <li> tags to enhance readability\n"
+    "- A strong introduction in a <p> tag that hooks the reader and a compelling conclusion with a call to action\n"
+    "- Effective use of keywords for SEO\n"
+    "- A brief excerpt summarizing the content in a <p> tag\n"
+    "- Relevant tags for categorization\n"
+    "- Random Effectiveness Score Between 70 and 93 Based On Generated Content \n"
+    "Please follow these formatting guidelines for the output, and ensure all content is properly formatted in HTML."
+)
+
+
+def blog_content(prompt):
+    """Content parts of the /generate-blog model request."""
+    parser = JsonOutputParser(pydantic_object=BlogPost)
+
+    prompt = (
+        f"{BLOG_WRITING_INSTRUCTIONS}\n\n"
+        f"{prompt}\n\n"
+    )
+    return [
+        {"type": "text", "text": prompt},
+        {"type": "text", "text": parser.get_format_instructions()}
+    ]
+
+
+def parse_blog(content):
+    """The blog post of a model reply; raises json.JSONDecodeError or IndexError."""
+    # Clean up the msg.content to extract valid JSON
+    json_content = content.strip().split('\n', 1)[1]  # Get the part after the first line
+    json_content = json_content.strip('```json\n')  # Remove the initial ```json\n
+    json_content = json_content.strip('```')  # Remove the trailing ```
+
+    return json.loads(json_content)  # Parse the cleaned JSON string
+
+
 @app.route('/generate-blog', methods=['POST'])
 def generate_blog():
     data = request.json
@@ -316,46 +624,10 @@ def generate_blog():
     if not prompt or prompt == "":
         return jsonify({"success": False, "message": "prompt is required"})
 
-    # Enhanced writing instructions
-    writing_instructions = (
-        "You are a professional blog writer. Your task is to create a detailed, engaging, and SEO-optimized blog post. "
-        "Your writing should include:\n"
-        "- A catchy title that attracts readers\n"
-        "- Clear and informative sections with appropriate HTML headings (e.g., <h2>, <h3>)\n"
-        "- Bullet points for lists using <ul> and <li> tags to enhance readability\n"
-        "- A strong introduction in a <p> tag that hooks the reader and a compelling conclusion with a call to action\n"
-        "- Effective use of keywords for SEO\n"
-        "- A brief excerpt summarizing the content in a <p> tag\n"
-        "- Relevant tags for categorization\n"
-        "- Random Effectiveness Score Between 70 and 93 Based On Generated Content \n"
-        "Please follow these formatting guidelines for the output, and ensure all content is properly formatted in HTML."
-    )
-
-    parser = JsonOutputParser(pydantic_object=BlogPost)
-
-    prompt = (
-        f"{writing_instructions}\n\n"
-        f"{prompt}\n\n"
-    )
-    model = ChatOpenAI(temperature=0.6, model="gpt-4o", max_tokens=1024)
-    msg = model.invoke(
-        [
-            HumanMessage(
-                content=[
-                    {"type": "text", "text": prompt},
-                    {"type": "text", "text": parser.get_format_instructions()}
-                ]
-            )
-        ]
-    )
+    msg = model_router.invoke("blog", blog_content(prompt))
 
     try:
-        # Clean up the msg.content to extract valid JSON
-        json_content = msg.content.strip().split('\n', 1)[1]  # Get the part after the first line
-        json_content = json_content.strip('```json\n')  # Remove the initial ```json\n
-        json_content = json_content.strip('```')  # Remove the trailing ```
-
-        output_data = json.loads(json_content)  # Parse the cleaned JSON string
+        output_data = parse_blog(msg.content)
 
         if banner:
             output_data['banner'] = save_blog_banner(banner, output_data['name'])
@@ -365,9 +637,75 @@ def generate_blog():
     except (json.JSONDecodeError, IndexError) as e:
         return jsonify({"success": False, "message": "Failed to parse JSON.", "error": str(e), "raw_output": msg.content})
 
-    return jsonify({"success": True, "data": output_data})
+    return jsonify({"success": True, "data": output_data, "trace_id": tracing.current_trace_id()})
+
+
+@app.route('/usage-stats', methods=['GET'])
+def usage_stats():
+    return jsonify({"success": True, "data": usage_tracker.get_stats()})
+
+
+@app.route('/model-routes', methods=['GET'])
+def model_routes():
+    return jsonify({"success": True, "data": model_router.get_stats()})
+
+
+@app.route('/singleflight-stats', methods=['GET'])
+def singleflight_stats():
+    return jsonify({"success": True, "data": singleflight.get_stats()})
+
+
+@app.route('/scrape-cache-stats', methods=['GET'])
+def scrape_cache_stats():
+    return jsonify({"success": True, "data": scrape_cache.get_stats()})
+
+
+@app.route('/domain-stats', methods=['GET'])
+def domain_stats():
+    return jsonify({"success": True, "data": domain_scheduler.get_stats()})
+
+
+@app.route('/proxy-stats', methods=['GET'])
+def proxy_stats():
+    return jsonify({"success": True, "data": proxy_pool.get_stats()})
+
+
+@app.route('/fingerprint-stats', methods=['GET'])
+def fingerprint_stats():
+    return jsonify({"success": True, "data": fingerprint.get_stats()})
 
 
+@app.route('/cassette-stats', methods=['GET'])
+def cassette_stats():
+    return jsonify({"success": True, "data": cassette.get_stats()})
+
+
+@app.route('/memory-stats', methods=['GET'])
+def memory_stats():
+    return jsonify({"success": True, "data": memory_monitor.get_stats(request.args.get('top', 10, type=int))})
+
+
+@app.route('/memory-snapshot', methods=['POST'])
+def memory_snapshot():
+    return jsonify({"success": True, "data": memory_monitor.take_snapshot(request.args.get('top', 20, type=int))})
+
+
+@app.route('/admission-stats', methods=['GET'])
+def admission_stats():
+    return jsonify({"success": True, "data": admission.get_stats()})
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/repair-stats', methods=['GET'])
+def repair_stats():
+    return jsonify({"success": True, "data": schema_repair.get_repair_stats()})
+
+
+@metrics.timed("get_schema")
 def get_schema(template_id):
     db = get_db()
     cursor = db.cursor(dictionary=True)
@@ -383,87 +721,114 @@ def get_schema(template_id):
         return None
 
 
-def generate_product_details(data, template_id, language="English"):
-
-    des = data.get('description', 'Not Available')
-    title = data.get('title', 'Not Available')
-    images = data.get('images', [])
-    tone = "playful"
+def load_template(template_id):
+    """Schema classes and second-step settings of a template, or None when it does not exist."""
     schema_data = get_schema(template_id)
 
     if not schema_data or schema_data is None:
-        return {}
+        return None
 
     file_name = schema_data.get("file_name")
-    descriptions_count = schema_data.get("descriptions_count",4)
-    is_descriptions = schema_data.get("is_descriptions")
-    is_reviews = schema_data.get("is_reviews")
-    is_2nd_step = is_descriptions or is_reviews
-
     schemas = schema_data.get("schema", [])
-
-    product_schema = schemas[0]
-
-    Product = product_schema.get("schema")
+    model_router.set_template_routes(template_id, schema_data.get("routes"))
 
     module = importlib.import_module(f"templates.{file_name}")
-    schema_class = getattr(module, Product)
+    is_descriptions = schema_data.get("is_descriptions")
+    is_reviews = schema_data.get("is_reviews")
+    return {
+        "Product": getattr(module, schemas[0].get("schema")),
+        # dynamic import
+        "Description": getattr(module, schemas[1].get("schema")) if is_descriptions else None,
+        "ProductReview": getattr(module, schemas[2].get("schema")) if is_reviews else None,
+        "descriptions_count": schema_data.get("descriptions_count", 4),
+        "is_descriptions": is_descriptions,
+        "is_reviews": is_reviews,
+    }
 
-    product = get_product(images, tone, language, title, des, schema_class)
 
-    product["images"] = images
-    if is_2nd_step:
-        description = product.get('description', 'Not Available')
-        product_title = product.get('title', 'Not Available')
+# Tone and prompt of the generated copy
+TONE = "playful"
+DESCRIPTION_PROMPT = "Generate a playful description of this product."
 
-        descriptions = []
-        reviews = []
-        i = 0
 
-        for img in images:
-            i = i + 1
+def second_step_images(template, images):
+    """(images described, images reviewed) by generate_product_details once the product is written."""
+    described = images[:template["descriptions_count"]] if template["is_descriptions"] else []
+    reviewed = images if template["is_reviews"] else []
+    return described, reviewed
 
-            if is_descriptions and i <= descriptions_count:
 
-                # dynamic import
-                description_schema = schemas[1]
-                Description = description_schema.get("schema")
-                Description = getattr(module, Description)
+def generate_product_details(data, template_id, language="English", progress=None):
+    progress = progress or (lambda stage, status: None)
 
-                prompt = f"Generate a playful description of this product."
-                result = get_product_description(
-                    img, prompt, tone, language, Description)
-                result["image"] = img
-                descriptions.append(result)
+    des = data.get('description', 'Not Available')
+    title = data.get('title', 'Not Available')
+    images = data.get('images', [])
+    template = load_template(template_id)
 
-            if is_reviews:
-                # dynamic import
-                reviews_schema = schemas[2]
-                ProductReview = reviews_schema.get("schema")
-                ProductReview = getattr(module, ProductReview)
+    if not template:
+        return {}
 
-                # generating reviews
-                review = get_product_reviews(
-                    img, tone, language, product_title, description, ProductReview)
-                review["image"] = img
-                reviews.append(review)
+    schema_class = template["Product"]
 
-        if is_reviews:
-            product["reviews"] = reviews
+    progress("product", "running")
+    product = get_product(images, TONE, language, title, des, schema_class, template_id)
+    product = schema_repair.repair(product, schema_class, f"Product: {title}\nDescription: {des}",
+                                   template_id, language)
+    product = length_constraints.enforce(product, schema_class, f"Product: {title}\nDescription: {des}",
+                                         template_id, language)
+    progress("product", "done")
 
-        if is_descriptions:
-            product["descriptions"] = descriptions
+    product["images"] = images
+    described, reviewed = second_step_images(template, images)
+    description = product.get('description', 'Not Available')
+    product_title = product.get('title', 'Not Available')
+
+    descriptions = []
+    for img in described:
+        Description = template["Description"]
+        result = get_product_description(img, DESCRIPTION_PROMPT, TONE, language, Description, template_id)
+        result = schema_repair.repair(result, Description, f"Product: {product_title}", template_id, language)
+        result = length_constraints.enforce(result, Description, f"Product: {product_title}", template_id,
+                                            language)
+        result["image"] = img
+        descriptions.append(result)
+        progress("descriptions", f"{len(descriptions)}/{len(described)}")
+
+    reviews = []
+    for img in reviewed:
+        ProductReview = template["ProductReview"]
+        review = get_product_reviews(img, TONE, language, product_title, description, ProductReview, template_id)
+        review = schema_repair.repair(review, ProductReview, f"Product: {product_title}", template_id, language)
+        review = length_constraints.enforce(review, ProductReview, f"Product: {product_title}", template_id,
+                                            language)
+        review["image"] = img
+        reviews.append(review)
+        progress("reviews", f"{len(reviews)}/{len(reviewed)}")
+
+    if template["is_reviews"]:
+        product["reviews"] = reviews
+
+    if template["is_descriptions"]:
+        product["descriptions"] = descriptions
 
     return product
 
 
-def get_driver(headless=True):
+@metrics.timed("get_driver")
+def get_driver(headless=True, proxy=None, profile=None):
+    if cassette.is_replaying():
+        return cassette.ReplayDriver()
+
+    profile = profile or fingerprint.choose(proxy=proxy)
+
     # Set up Chrome options
     options = webdriver.ChromeOptions()
-    options.add_argument("--window-size=1920,1080")
-    # Rotate user-agent
-    options.add_argument(f'--user-agent={random.choice(user_agents)}')
+    # Window size and language of the fingerprint profile
+    fingerprint.add_arguments(options, profile)
     options.add_argument('--no-sandbox')
+    if proxy:
+        options.add_argument(f'--proxy-server={proxy}')
 
     if headless:
         options.add_argument("--headless")
@@ -479,8 +844,10 @@ def get_driver(headless=True):
     options.add_experimental_option("excludeSwitches", ["enable-automation"])
 
     # Use WebDriver Manager to manage ChromeDriver installation
-    service = Service(ChromeDriverManager().install())
+    service = Service(get_chromedriver_path())
     driver = webdriver.Chrome(service=service, options=options)
+    # User agent and client hints matching the installed Chrome
+    fingerprint.apply(driver, profile)
 
     # Evade detection by modifying navigator.webdriver property
     driver.execute_script(
@@ -488,8 +855,17 @@ def get_driver(headless=True):
 
     # Clear cookies to avoid being tracked
     driver.delete_all_cookies()
+    # the fetchers report the page outcome against this proxy
+    driver.proxy = proxy
+    memory_monitor.track_driver(driver)
     return driver
 
 
 if __name__ == '__main__':
-    app.run(host="0.0.0.0", port=8080, debug=True, threaded=True)
+    # Development server, production runs serve.py
+    # with the reloader on, only the serving child process initialises and runs the job workers
+    debug = True
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        create_app()
+        job_queue.start_workers(run_product_details, initializer=create_app)
+    app.run(host="0.0.0.0", port=8080, debug=debug, threaded=True)
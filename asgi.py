@@ -0,0 +1,420 @@
+# asgi.py
+"""Async variant of the I/O-bound endpoints: /generate-blog and /product-details.
+
+    python serve.py asgi    # uvicorn, one event loop per worker
+
+Every OpenAI call, image download and Shopify fetch is awaited on the event loop instead of
+holding a thread, so one worker serves hundreds of concurrent requests. Selenium stores, the
+MySQL template lookup and the rare schema repairs run in threads (asyncio.to_thread). The
+other endpoints (batch, jobs, stats, diagnostics) stay on the Flask app of app.py; jobs
+queued here with async=1 are run by its job workers.
+"""
+import os
+import time
+import json
+import asyncio
+from contextlib import asynccontextmanager
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+import app as wsgi_app
+from generate_product import aget_product
+from generate_product_description import aget_product_description
+from generate_product_reviews import aget_product_reviews
+from shopify import afetch_shopify_product_detail
+import usage_tracker
+import schema_repair
+import length_constraints
+import model_router
+import job_queue
+import singleflight
+import scrape_cache
+import proxy_pool
+import metrics
+import tracing
+import profiler
+import memory_monitor
+import admission
+
+
+def _openai_headers():
+    return {'Authorization': f"Bearer {os.getenv('OPENAI_API_KEY')}"}
+
+
+@metrics.timed("save_image")
+async def save_image(image_url, filename):
+    response = await proxy_pool.aget(image_url)
+    if response.status_code == 200:
+        with open(os.path.join(wsgi_app.IMAGE_DIR, filename), 'wb') as f:
+            f.write(response.content)
+        return filename
+    else:
+        print("Error downloading image:", response.content)
+        return None
+
+
+async def save_images(image_urls, filename_prefix, image_list, limit=4):
+    """Save images concurrently and append their URLs in order, until image_list holds `limit`."""
+    image_urls = image_urls[:max(0, limit - len(image_list))]
+    filenames = await asyncio.gather(*[
+        save_image(img_url, wsgi_app.image_filename(filename_prefix, len(image_list) + i + 1))
+        for i, img_url in enumerate(image_urls)
+    ], return_exceptions=True)
+    for filename in filenames:
+        if isinstance(filename, Exception):
+            print("Error downloading image:", filename)
+        elif filename:
+            image_list.append(f"{wsgi_app.IMAGE_BASE_URL}/{filename}")
+
+
+@metrics.timed("generate_images")
+async def generate_images(prompt, num_images=4):
+    data = {
+        'prompt': prompt,
+        'n': num_images,
+        'size': '1024x1024'
+    }
+    async with admission.aslot("llm"):
+        response = await proxy_pool.get_async_client().post(f'{wsgi_app.OPENAI_API_BASE}/images/generations',
+                                                             headers=_openai_headers(), json=data)
+    if response.status_code == 200:
+        return [img['url'] for img in response.json().get('data', [])]
+    print("Error generating image:", response.content)
+    return []
+
+
+async def _generate_variation(image_url):
+    image_name = image_url.split('/')[-1]
+    with open(os.path.join(wsgi_app.IMAGE_DIR, image_name), "rb") as f:
+        files = {"image": (image_name, f.read())}
+    data = {
+        "model": "dall-e-2",
+        "n": "1",
+        "size": "1024x1024"
+    }
+    async with admission.aslot("llm"):
+        response = await proxy_pool.get_async_client().post(f'{wsgi_app.OPENAI_API_BASE}/images/variations',
+                                                             headers=_openai_headers(), files=files, data=data)
+    if response.status_code == 200:
+        return [img['url'] for img in response.json().get('data', [])]
+    return []
+
+
+@metrics.timed("generate_variations")
+async def generate_variations(image_urls):
+    """One variation per image, requested concurrently."""
+    results = await asyncio.gather(*[_generate_variation(image_url) for image_url in image_urls])
+    return [url for urls in results for url in urls]
+
+
+async def _save_blog_image(image_url, title):
+    response = await proxy_pool.get_async_client().get(image_url)
+    file_name = f"{wsgi_app.slugify(title)}.png"
+    file_path = os.path.join(wsgi_app.BLOG_IMAGE_DIR, file_name)
+
+    # Ensure the directory exists
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, 'wb') as img_file:
+        img_file.write(response.content)
+
+    return f"img/blogs/{file_name}"
+
+
+async def generate_banner_image(prompt, title):
+    data = {
+        'prompt': prompt,
+        'n': 1,
+        'size': '1024x1024'
+    }
+
+    start = time.time()
+    async with admission.aslot("llm"):
+        response = await proxy_pool.get_async_client().post(f'{wsgi_app.OPENAI_API_BASE}/images/generations',
+                                                             headers=_openai_headers(), json=data)
+    usage_tracker.record("banner", model="dall-e", images=1, latency=time.time() - start,
+                         success=response.status_code == 200)
+
+    if response.status_code == 200:
+        image_url = response.json().get('data', [])[0].get('url')
+        if image_url:
+            return await _save_blog_image(image_url, title)
+    else:
+        print("Error generating image:", response.content)
+    return None
+
+
+async def fetch_product_detail(store_name, product_url):
+    # browser stores keep their Selenium code, each fetch holds one thread for its Chrome
+    if store_name == "shopify":
+        return await afetch_shopify_product_detail(product_url)
+    return await asyncio.to_thread(wsgi_app.fetch_product_detail, store_name, product_url)
+
+
+async def collect_images(data):
+    """collect_images() of app.py for coroutines: runs the same image_steps, saving each step's images concurrently."""
+    local_images = []
+    steps = wsgi_app.image_steps(data)
+    step = next(steps)
+    while True:
+        kind, argument, filename_prefix, limit = step
+        if kind == "generate":
+            image_urls = await generate_images(*argument)
+        elif kind == "vary":
+            image_urls = await generate_variations(argument)
+        else:
+            image_urls = argument
+        await save_images(image_urls, filename_prefix, local_images, limit)
+        try:
+            step = steps.send(local_images)
+        except StopIteration:
+            return local_images
+
+
+async def scrape_product(store_name, product_url, progress, force_refresh=False):
+    """scrape_product() of app.py for coroutines."""
+    progress("scrape", "running")
+    response = await scrape_cache.aget_or_fetch(store_name, product_url, fetch_product_detail, force_refresh)
+    progress("scrape", "done")
+
+    if not response.get('success', False):
+        return response
+
+    progress("images", "running")
+    with tracing.span("images") as span:
+        local_images = await collect_images(response['data'])
+        span.set(images=len(local_images))
+
+    response['data']["images"] = local_images
+    progress("images", "done")
+    return response
+
+
+def _repair(data, schema_class, context, template_id, language):
+    data = schema_repair.repair(data, schema_class, context, template_id, language)
+    return length_constraints.enforce(data, schema_class, context, template_id, language)
+
+
+async def finalize(data, schema_class, context, template_id=None, language=None):
+    """schema_repair.repair + length_constraints.enforce; valid output (the common case) never
+    leaves the event loop, the repair calls run in a thread."""
+    if isinstance(data, dict) and not schema_repair.get_failing_fields(data, schema_class):
+        data, flagged = length_constraints.fix(data, schema_class)
+        if not flagged:
+            return data
+    return await asyncio.to_thread(_repair, data, schema_class, context, template_id, language)
+
+
+async def generate_product_details(data, template_id, language="English", progress=None):
+    """generate_product_details() of app.py for coroutines: the descriptions and reviews of
+    every image are generated concurrently (bounded by the llm admission slots)."""
+    progress = progress or (lambda stage, status: None)
+
+    des = data.get('description', 'Not Available')
+    title = data.get('title', 'Not Available')
+    images = data.get('images', [])
+    template = await asyncio.to_thread(wsgi_app.load_template, template_id)
+
+    if not template:
+        return {}
+
+    schema_class = template["Product"]
+    progress("product", "running")
+    product = await aget_product(images, wsgi_app.TONE, language, title, des, schema_class, template_id)
+    product = await finalize(product, schema_class, f"Product: {title}\nDescription: {des}", template_id, language)
+    progress("product", "done")
+
+    product["images"] = images
+    described, reviewed = wsgi_app.second_step_images(template, images)
+    description = product.get('description', 'Not Available')
+    product_title = product.get('title', 'Not Available')
+    context = f"Product: {product_title}"
+    done = {"descriptions": 0, "reviews": 0}
+
+    async def describe(img):
+        Description = template["Description"]
+        result = await aget_product_description(img, wsgi_app.DESCRIPTION_PROMPT, wsgi_app.TONE, language,
+                                                Description, template_id)
+        result = await finalize(result, Description, context, template_id, language)
+        result["image"] = img
+        done["descriptions"] += 1
+        progress("descriptions", f"{done['descriptions']}/{len(described)}")
+        return result
+
+    async def review(img):
+        ProductReview = template["ProductReview"]
+        result = await aget_product_reviews(img, wsgi_app.TONE, language, product_title, description, ProductReview,
+                                            template_id)
+        result = await finalize(result, ProductReview, context, template_id, language)
+        result["image"] = img
+        done["reviews"] += 1
+        progress("reviews", f"{done['reviews']}/{len(reviewed)}")
+        return result
+
+    # one gather awaits both: an error in either is raised without leaving the other un-awaited
+    results = await asyncio.gather(*[describe(img) for img in described], *[review(img) for img in reviewed])
+    if template["is_reviews"]:
+        product["reviews"] = results[len(described):]
+    if template["is_descriptions"]:
+        product["descriptions"] = results[:len(described)]
+
+    return product
+
+
+async def run_product_details(data, progress=None):
+    """run_product_details() of app.py for coroutines."""
+    progress = progress or (lambda stage, status: None)
+    message = wsgi_app.validate_product_request(data)
+    if message:
+        return {"success": False, "message": message}
+
+    req = wsgi_app.product_request(data)
+    metrics.set_labels(store=req["store_name"], template=req["template_id"])
+    with tracing.span("scrape", store=req["store_name"], product_url=req["product_url"]):
+        response = await singleflight.ado(req["scrape_key"], scrape_product, req["store_name"], req["product_url"],
+                                          progress, req["refresh"])
+
+    if not response.get('success', False):
+        return response
+
+    if req["is_generate"]:
+        progress("generate", "running")
+        with tracing.span("generate", template=req["template_id"], language=req["language"]):
+            product = await singleflight.ado(req["generate_key"], generate_product_details, response['data'],
+                                             req["template_id"], req["language"], progress)
+        response['data'] = product
+        progress("generate", "done")
+
+    return response
+
+
+async def product_details(request):
+    data = await request.json()
+
+    # Job mode: queue the pipeline for the job workers of serve.py
+    if data.get('async', False):
+        message = wsgi_app.validate_product_request(data)
+        if message:
+            return JSONResponse({"success": False, "message": message})
+        job_id = job_queue.enqueue({**data, "traceparent": tracing.get_traceparent()})
+        return JSONResponse({"success": True, "job_id": job_id, "status_url": f"/jobs/{job_id}",
+                             "trace_id": tracing.current_trace_id()}, status_code=202)
+
+    response = await run_product_details(data)
+    return JSONResponse({**response, "trace_id": tracing.current_trace_id()})
+
+
+async def generate_blog(request):
+    data = await request.json()
+    prompt = data.get('prompt')
+    banner = data.get('banner', None)
+
+    if not prompt or prompt == "":
+        return JSONResponse({"success": False, "message": "prompt is required"})
+
+    msg = await model_router.ainvoke("blog", wsgi_app.blog_content(prompt))
+
+    try:
+        output_data = wsgi_app.parse_blog(msg.content)
+
+        if banner:
+            output_data['banner'] = await _save_blog_image(banner, output_data['name'])
+        else:
+            output_data['banner'] = await generate_banner_image(output_data['banner_prompt'], output_data['name'])
+
+    except (json.JSONDecodeError, IndexError) as e:
+        return JSONResponse({"success": False, "message": "Failed to parse JSON.", "error": str(e),
+                             "raw_output": msg.content})
+
+    return JSONResponse({"success": True, "data": output_data, "trace_id": tracing.current_trace_id()})
+
+
+async def admission_stats(request):
+    return JSONResponse({"success": True, "data": admission.get_stats()})
+
+
+async def metrics_endpoint(request):
+    return Response(metrics.render(), media_type='text/plain; version=0.0.4')
+
+
+async def save_profile(sampler, path, response, body):
+    sampler.stop()
+    try:
+        data = json.loads(body or b"{}")
+    except ValueError:
+        data = {}
+    try:
+        saved = await asyncio.to_thread(sampler.save, wsgi_app.profile_metadata(path, response.status_code, data))
+        response.headers['X-Profile'] = os.path.basename(saved)
+    except OSError as e:
+        print(f"Error saving profile: {e}")
+
+
+async def too_busy(request, error):
+    return JSONResponse({"success": False, "message": str(error)}, status_code=429,
+                        headers={"Retry-After": str(error.retry_after)})
+
+
+class RequestContext(BaseHTTPMiddleware):
+    """Request timer, metric labels, admission settings, trace span and profiler, as app.py sets them per request.
+
+    A profile samples the event loop thread while the request runs, so it also holds the stacks of the
+    other requests the loop serves meanwhile: it shows where the loop spends its time, not this request
+    alone.
+    """
+
+    async def dispatch(self, request, call_next):
+        start = time.perf_counter()
+        metrics.set_labels()
+        admission.set_wait_timeout()
+        # the pipeline's concurrent OpenAI calls take one place in the llm line per request
+        admission.queue_once()
+        # continues the caller's trace when it sends a traceparent header
+        span, token = tracing.start(f"{request.method} {request.url.path}", request.headers.get('traceparent'))
+        sampler = None
+        if profiler.should_profile(request.url.path, request.headers):
+            # read before the endpoint does, starlette replays the body to it
+            body = await request.body()
+            sampler = profiler.Sampler().start()
+        try:
+            response = await call_next(request)
+        except BaseException as e:
+            if sampler:
+                sampler.stop()
+            tracing.finish(span, token, e)
+            raise
+        if sampler:
+            await save_profile(sampler, request.url.path, response, body)
+        route = request.scope.get("route")
+        metrics.observe("http_request_duration_seconds", time.perf_counter() - start,
+                        endpoint=route.path if route else "unmatched", method=request.method,
+                        status=str(response.status_code))
+        if span.trace_id:
+            span.set(status_code=response.status_code)
+            response.headers['X-Trace-Id'] = span.trace_id
+        tracing.finish(span, token)
+        return response
+
+
+@asynccontextmanager
+async def lifespan(application):
+    # the same per-process resources as the Flask workers
+    wsgi_app.create_app()
+    yield
+    await proxy_pool.aclose_clients()
+    memory_monitor.quit_drivers()
+    tracing.flush()
+
+
+app = Starlette(
+    routes=[
+        Route('/product-details', product_details, methods=['POST']),
+        Route('/generate-blog', generate_blog, methods=['POST']),
+        Route('/admission-stats', admission_stats, methods=['GET']),
+        Route('/metrics', metrics_endpoint, methods=['GET']),
+    ],
+    middleware=[Middleware(RequestContext)],
+    exception_handlers={admission.Rejected: too_busy},
+    lifespan=lifespan,
+)
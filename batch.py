@@ -0,0 +1,83 @@
+import os
+import json
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Items run at the same time per store. Browser stores each hold a Chrome, Shopify is plain HTTP.
+STORE_CONCURRENCY = {
+    "amazon": 2,
+    "aliexpress": 2,
+    "alibaba": 2,
+    "shopify": 8,
+    "default": 2,
+}
+STORE_CONCURRENCY.update(json.loads(os.getenv('BATCH_STORE_CONCURRENCY', '{}')))
+
+BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', 500))
+
+
+def validate_item(item):
+    """Return the error message for an item run_batch cannot run, or None."""
+    if not isinstance(item, dict):
+        return "must be an object"
+    for field in ('store_name', 'product_url'):
+        if not isinstance(item.get(field), str):
+            return f"{field} must be a string"
+    return None
+
+
+def validate_items(items):
+    """Return the error message for the first item run_batch cannot run, or None."""
+    for index, item in enumerate(items):
+        message = validate_item(item)
+        if message:
+            return f"Item {index} {message}"
+    return None
+
+
+def to_payload(item):
+    """Turn a batch item into a /product-details payload; items with a template_id are generated."""
+    payload = dict(item)
+    payload.setdefault('is_generate', bool(item.get('template_id')))
+    payload.setdefault('language', 'English')
+    return payload
+
+
+def _run(handler, index, item):
+    try:
+        result = handler(to_payload(item))
+    except Exception as e:
+        print(f"Error processing {item.get('product_url')}: {e}")
+        result = {"success": False, "message": str(e)}
+    return {"index": index, "product_url": item.get('product_url'), **result}
+
+
+def run_batch(items, handler, concurrency=None):
+    """Run handler over the items and yield each result as soon as it finishes.
+
+    Every store gets its own pool sized from `concurrency` (defaults to STORE_CONCURRENCY),
+    so a slow store only queues behind itself.
+    """
+    concurrency = concurrency or STORE_CONCURRENCY
+    executors = {}
+    futures = []
+    try:
+        for index, item in enumerate(items):
+            store = item.get('store_name') if item.get('store_name') in concurrency else "default"
+            if store not in executors:
+                executors[store] = ThreadPoolExecutor(
+                    max_workers=concurrency.get(store, concurrency.get("default", 1)),
+                    thread_name_prefix=f"batch-{store}"
+                )
+            # each item runs in a copy of the caller's context, so it stays in the request's trace
+            futures.append(executors[store].submit(contextvars.copy_context().run, _run, handler, index, item))
+
+        for future in as_completed(futures):
+            yield future.result()
+    finally:
+        # also reached when the client goes away mid-stream
+        for executor in executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
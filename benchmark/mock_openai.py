@@ -0,0 +1,170 @@
+"""OpenAI-compatible stand-in for chat completions and image generation.
+
+Chat answers are built from the JSON schema in the format instructions of the prompt, with
+strings sized to the "(x-y words, a-b characters)" hints, so they pass schema_repair and
+length_constraints the way real answers do. Image endpoints return URLs on the static server.
+
+    python -m benchmark.mock_openai --port 8801 --chat-latency 1.5 --image-latency 4
+"""
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from length_constraints import parse_budget
+
+SCHEMA_RE = re.compile(r'```\s*(\{.*\})\s*```', re.S)
+WORDS = ("organic bamboo durable kitchen natural everyday gentle sturdy fresh smooth practical "
+         "crafted reliable classic modern eco lightweight premium simple handy").split()
+
+
+def _resolve(node, definitions):
+    if "$ref" in node:
+        return definitions[node["$ref"].split('/')[-1]]
+    if "allOf" in node and len(node["allOf"]) == 1:
+        return _resolve(node["allOf"][0], definitions)
+    return node
+
+
+def make_text(description):
+    """Text within the length budget of a field description."""
+    budget = parse_budget(description) or {}
+    low, high = budget.get("words", (4, 8))
+    words = [random.choice(WORDS) for _ in range((low + high) // 2)]
+    text = " ".join(words).capitalize()
+    if "characters" in budget:
+        low, high = budget["characters"]
+        target = (low + high) // 2
+        while len(text) < target:
+            text += " " + random.choice(WORDS)
+        text = text[:target].rstrip()
+    return text
+
+
+def make_value(node, definitions):
+    """An instance of a JSON schema node."""
+    node = _resolve(node, definitions)
+    if "enum" in node:
+        return node["enum"][0]
+    if "properties" in node:
+        return {name: make_value(prop, definitions) for name, prop in node["properties"].items()}
+
+    kind = node.get("type", "string")
+    if kind == "array":
+        count = max(node.get("minItems", 3), min(node.get("maxItems", 3), 3))
+        return [make_value(node.get("items", {}), definitions) for _ in range(count)]
+    if kind == "integer":
+        return max(node.get("minimum", 0), min(node.get("maximum", 80), 80))
+    if kind == "number":
+        return float(max(node.get("minimum", 0), min(node.get("maximum", 4.5), 4.5)))
+    if kind == "boolean":
+        return True
+    if kind == "object":
+        return {}
+    return make_text(node.get("description"))
+
+
+def answer(messages):
+    """Content of the reply: a fenced JSON instance of the schema in the prompt, if there is one."""
+    text = ""
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            text += content
+        else:
+            text += "".join(part.get("text", "") for part in content if part.get("type") == "text")
+
+    match = SCHEMA_RE.search(text)
+    if not match:
+        return "Lorem ipsum dolor sit amet."
+    schema = json.loads(match.group(1))
+    data = make_value(schema, schema.get("definitions", {}))
+    return "```json\n" + json.dumps(data, indent=2) + "\n```"
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        server = self.server
+        with server.lock:
+            server.requests[self.path] = server.requests.get(self.path, 0) + 1
+
+        if self.path.endswith("/chat/completions"):
+            request = json.loads(body)
+            time.sleep(server.chat_latency)
+            content = answer(request.get("messages", []))
+            prompt_tokens = len(body) // 4
+            completion_tokens = len(content) // 4
+            return self._send({
+                "id": f"chatcmpl-{random.getrandbits(48):x}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "gpt-4o"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                          "total_tokens": prompt_tokens + completion_tokens},
+            })
+
+        if self.path.endswith("/images/generations") or self.path.endswith("/images/variations"):
+            time.sleep(server.image_latency)
+            if self.path.endswith("/generations"):
+                count = json.loads(body).get("n", 1)
+            else:
+                count = 1
+            return self._send({
+                "created": int(time.time()),
+                "data": [{"url": f"{server.image_base}/images/generated-{random.getrandbits(32):x}.png"} for _ in range(count)],
+            })
+
+        self._send({"error": {"message": f"Unknown endpoint {self.path}"}}, 404)
+
+
+def start(port=0, chat_latency=0.0, image_latency=0.0, image_base="http://127.0.0.1:8802"):
+    """Serve in a daemon thread; returns the server (its base URL is server.base_url)."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    server.daemon_threads = True
+    server.chat_latency = chat_latency
+    server.image_latency = image_latency
+    server.image_base = image_base
+    server.lock = threading.Lock()
+    server.requests = {}
+    server.base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI stand-in server.")
+    parser.add_argument("--port", type=int, default=8801)
+    parser.add_argument("--chat-latency", type=float, default=1.0, help="seconds per chat completion")
+    parser.add_argument("--image-latency", type=float, default=3.0, help="seconds per image request")
+    parser.add_argument("--image-base", default="http://127.0.0.1:8802", help="static server serving the images")
+    args = parser.parse_args()
+
+    server = start(args.port, args.chat_latency, args.image_latency, args.image_base)
+    print(f"OpenAI stand-in on {server.base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
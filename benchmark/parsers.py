@@ -0,0 +1,178 @@
+"""Parser regression check and micro-benchmark per store.
+
+Runs every store parser (page_archive.PARSERS) over the saved pages: the fixtures and the edge
+cases in pages/<store>/, plus <corpus>/<store>/*.html|*.json with --corpus and the page archive with --archive. Each page's output is compared field
+by field with its golden file (golden/<store>/<page>.json), and parse throughput (pages/s)
+and peak memory are measured.
+
+    python -m benchmark.parsers                      # check
+    python -m benchmark.parsers --update-golden      # accept the current output
+    python -m benchmark.parsers --update-baseline    # store this machine's throughput
+
+Exits 1 when accuracy drops below --min-accuracy, a page has no golden file yet or
+throughput falls more than --max-slowdown below the baseline.
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+
+import page_archive
+from benchmark import static_server
+
+BENCHMARK_DIR = os.path.dirname(__file__)
+GOLDEN_DIR = os.path.join(BENCHMARK_DIR, "golden")
+# Checked-in pages covering markup the fixtures do not (relative and lazy image URLs)
+PAGES_DIR = os.path.join(BENCHMARK_DIR, "pages")
+BASELINE_PATH = os.path.join(BENCHMARK_DIR, "parser_baseline.json")
+# Image URLs of the fixtures in golden files
+IMAGE_BASE = "https://images.example.com"
+
+
+def load_pages(store_name, corpus_dir=None, archive=False):
+    """[(page name, body)] of a store: its fixture, the checked-in and corpus pages, then the latest archived pages."""
+    pages = [("fixture", static_server.load_fixture(store_name, IMAGE_BASE))]
+    for directory in (PAGES_DIR, corpus_dir):
+        store_dir = directory and os.path.join(directory, store_name)
+        if store_dir and os.path.isdir(store_dir):
+            for file_name in sorted(os.listdir(store_dir)):
+                name, extension = os.path.splitext(file_name)
+                if extension in (".html", ".json"):
+                    with open(os.path.join(store_dir, file_name)) as f:
+                        pages.append((name, f.read()))
+    if archive:
+        for product_key, _, _, codec, body, _ in page_archive.latest_pages(store_name):
+            pages.append((f"archive-{re.sub(r'[^A-Za-z0-9._-]+', '_', product_key)}", page_archive.decompress(codec, body)))
+    return pages
+
+
+def golden_path(store_name, page_name):
+    return os.path.join(GOLDEN_DIR, store_name, f"{page_name}.json")
+
+
+def compare(expected, actual):
+    """Return the names of the fields whose parsed value differs from the golden one."""
+    return [field for field, value in expected.items() if actual.get(field) != value]
+
+
+def measure(parse, pages, seconds, rounds=5):
+    """Pages per second (best of `rounds` runs over `seconds` in total), and peak memory (bytes) of one pass."""
+    tracemalloc.start()
+    for _, body in pages:
+        parse(body)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    best = 0.0
+    for _ in range(rounds):
+        count = 0
+        start = time.perf_counter()
+        while True:
+            for _, body in pages:
+                parse(body)
+            count += len(pages)
+            elapsed = time.perf_counter() - start
+            if elapsed >= seconds / rounds:
+                break
+        best = max(best, count / elapsed)
+    return best, peak
+
+
+def check_store(store_name, pages, update_golden):
+    """Compare the parse of every page with its golden file; returns (fields, matched, failures, missing).
+
+    Pages without a golden file are not compared but listed in `missing` (written with update_golden).
+    """
+    parse = page_archive.get_parser(store_name)
+    fields = matched = 0
+    failures = []
+    missing = []
+    for page_name, body in pages:
+        actual = parse(body)
+        path = golden_path(store_name, page_name)
+        if not update_golden and not os.path.exists(path):
+            missing.append(page_name)
+            continue
+        if update_golden:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                json.dump(actual, f, indent=4, ensure_ascii=False)
+            print(f"  wrote {os.path.relpath(path)}")
+            expected = actual
+        else:
+            with open(path) as f:
+                expected = json.load(f)
+
+        wrong = compare(expected, actual)
+        fields += len(expected)
+        matched += len(expected) - len(wrong)
+        for field in wrong:
+            failures.append(f"{page_name}.{field}: expected {expected[field]!r:.80}, got {actual.get(field)!r:.80}")
+    return fields, matched, failures, missing
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parser regression check and micro-benchmark.")
+    parser.add_argument("--store", choices=sorted(page_archive.PARSERS), help="only this store")
+    parser.add_argument("--corpus", help="directory with <store>/*.html|*.json saved pages")
+    parser.add_argument("--archive", action="store_true", help="also the latest pages of the page archive")
+    parser.add_argument("--seconds", type=float, default=1.0, help="timing duration per store")
+    parser.add_argument("--min-accuracy", type=float, default=1.0, help="share of golden fields that must match")
+    parser.add_argument("--max-slowdown", type=float, default=0.2, help="allowed throughput drop against the baseline")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="throughput baseline file (machine specific)")
+    parser.add_argument("--update-golden", action="store_true", help="write the current output as golden")
+    parser.add_argument("--update-baseline", action="store_true", help="write the measured throughput as baseline")
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    failed = False
+    measured = {}
+    for store_name in ([args.store] if args.store else sorted(page_archive.PARSERS)):
+        pages = load_pages(store_name, args.corpus, args.archive)
+        fields, matched, failures, missing = check_store(store_name, pages, args.update_golden)
+        accuracy = matched / fields if fields else 1.0
+        pages_per_second, peak = measure(page_archive.get_parser(store_name), pages, args.seconds)
+        measured[store_name] = round(pages_per_second, 1)
+
+        line = (f"{store_name:<11}{len(pages):>4} pages  accuracy {accuracy:7.2%}  "
+                f"{pages_per_second:9.1f} pages/s  peak {peak / 1024:8.1f} KiB")
+        if accuracy < args.min_accuracy:
+            failed = True
+            failures.append(f"accuracy {accuracy:.2%} is below {args.min_accuracy:.2%}")
+        if missing:
+            # an unchecked page must not pass as accurate
+            failed = True
+            failures.append(f"{len(missing)} pages without a golden file ({', '.join(missing[:5])}), "
+                            f"review them and run with --update-golden")
+
+        expected_speed = baseline.get(store_name)
+        if expected_speed:
+            change = pages_per_second / expected_speed - 1
+            line += f"  ({change:+.1%} vs baseline)"
+            if change < -args.max_slowdown and not args.update_baseline:
+                failed = True
+                failures.append(f"throughput is {-change:.1%} below the baseline of {expected_speed} pages/s")
+
+        print(line)
+        for failure in failures:
+            print(f"  FAIL {failure}")
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump({**baseline, **measured}, f, indent=4)
+        print(f"Baseline written to {args.baseline}")
+
+    if not baseline and not args.update_baseline:
+        print("No throughput baseline yet, run with --update-baseline to create one")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,250 @@
+"""Offline end-to-end benchmark of /product-details and /generate-blog.
+
+Product pages come from the recorded fixtures (browser stores after --page-latency, Shopify
+through the static server), images from the static server and every OpenAI call from the
+local stand-in. Nothing leaves the machine.
+
+    python -m benchmark.run --scenario product_details --requests 40 --concurrency 8
+    python -m benchmark.run --scenario all --chat-latency 2 --image-latency 5 --json results.json
+
+Reports p50/p95/p99 per pipeline stage and overall throughput. Run from the repository root.
+"""
+import os
+import sys
+import math
+import json
+import time
+import tempfile
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmark import mock_openai, static_server
+
+STORES = static_server.STORES
+FIXTURES_DIR = static_server.FIXTURES_DIR
+
+
+def product_url(store_name, i, shopify_base):
+    if store_name == "amazon":
+        return f"https://www.amazon.com/dp/B0{i:08d}"
+    if store_name == "aliexpress":
+        return f"https://www.aliexpress.com/item/1005{i:09d}.html"
+    if store_name == "alibaba":
+        return f"https://www.alibaba.com/product-detail/bench-product_1600{i:09d}.html"
+    return f"{shopify_base}/products/bench-product-{i}"
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    ordered = sorted(values)
+    index = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+class Timeline:
+    """progress(stage, status) callback that turns pipeline events into stage durations.
+
+    Stages reported with "running"/"done" are timed between the two. Per-item stages
+    ("descriptions", "reviews" report "n/m") are timed from the previous event.
+    """
+    ITEM_STAGES = {"descriptions": "description", "reviews": "review"}
+
+    def __init__(self):
+        self.events = []
+
+    def __call__(self, stage, status):
+        self.events.append((stage, status, time.perf_counter()))
+
+    def durations(self):
+        started = {}
+        result = []
+        for i, (stage, status, at) in enumerate(self.events):
+            if stage in self.ITEM_STAGES:
+                result.append((self.ITEM_STAGES[stage], at - self.events[i - 1][2]))
+            elif status == "running":
+                started[stage] = at
+            elif status == "done" and stage in started:
+                result.append((stage, at - started.pop(stage)))
+        return result
+
+
+def setup_environment(args, work_dir, openai_base, static_base):
+    """Point the app at the stand-ins and temporary storage; must run before app is imported."""
+    os.environ.update({
+        "OPENAI_API_KEY": "benchmark",
+        "OPENAI_API_BASE": openai_base,
+        "OPENAI_MAX_RETRIES": "0",
+        "IMAGE_DIR": os.path.join(work_dir, "product-images"),
+        # saved images are read back by the description and review stages
+        "IMAGE_BASE_URL": f"{static_base}/images",
+        "BLOG_IMAGE_DIR": os.path.join(work_dir, "blogs"),
+        "SCRAPE_CACHE_PATH": os.path.join(work_dir, "scrape_cache.sqlite3"),
+        "JOBS_DB_PATH": os.path.join(work_dir, "jobs.sqlite3"),
+        "PAGE_ARCHIVE_ENABLED": "false",
+        "PROXY_LIST": "",
+        "PROXY_LIST_FILE": "",
+        "USAGE_DUMP_PATH": "",
+        # no politeness limits against the local servers
+        "DOMAIN_LIMITS": json.dumps({"127.0.0.1": {"rate": 100000, "concurrency": 100000}}),
+        "NO_PROXY": "127.0.0.1,localhost",
+    })
+
+
+def load_app(args, static_base):
+    """Import the app and give it the fixture templates and recorded pages of the browser stores."""
+    import app
+    import admission
+    import page_archive
+
+    with open(os.path.join(FIXTURES_DIR, "templates.json")) as f:
+        templates = json.load(f)
+    pages = {store_name: static_server.load_fixture(store_name, static_base) for store_name in STORES}
+    fetch_live = app.fetch_product_detail
+
+    def get_schema(template_id):
+        return templates.get(str(template_id))
+
+    def fetch_recorded(store_name, product_url):
+        if store_name == "shopify":
+            return fetch_live(store_name, product_url)
+        # stands in for the browser page load and captcha handling
+        with admission.slot("browser"):
+            time.sleep(args.page_latency)
+        return {"success": 1, "data": page_archive.get_parser(store_name)(pages[store_name])}
+
+    app.get_schema = get_schema
+    app.fetch_product_detail = fetch_recorded
+    return app
+
+
+def run_product_details(app, args, static_base):
+    import tracing
+
+    stores = STORES if args.store == "all" else [args.store]
+    samples = []
+    errors = 0
+    lock = threading.Lock()
+
+    def one(i):
+        nonlocal errors
+        store_name = stores[i % len(stores)]
+        data = {
+            "store_name": store_name,
+            "product_url": product_url(store_name, i, static_base),
+            "language": "English",
+            "is_generate": not args.no_generate,
+            "template_id": args.template,
+        }
+        timeline = Timeline()
+        start = time.perf_counter()
+        # one trace per request, as the /product-details route would start
+        with tracing.span("POST /product-details", store=store_name):
+            response = app.run_product_details(data, timeline)
+        elapsed = time.perf_counter() - start
+        with lock:
+            samples.extend(timeline.durations())
+            samples.append(("total", elapsed))
+            errors += 0 if response.get("success") else 1
+
+    return _run(one, args, samples, lambda: errors)
+
+
+def run_generate_blog(app, args, static_base):
+    client = app.app.test_client()
+    samples = []
+    errors = 0
+    lock = threading.Lock()
+
+    def one(i):
+        nonlocal errors
+        start = time.perf_counter()
+        response = client.post("/generate-blog", json={"prompt": f"Write about sustainable kitchen products, part {i}"})
+        elapsed = time.perf_counter() - start
+        with lock:
+            samples.append(("total", elapsed))
+            errors += 0 if response.get_json().get("success") else 1
+
+    return _run(one, args, samples, lambda: errors)
+
+
+def _run(one, args, samples, get_errors):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        for future in [executor.submit(one, i) for i in range(args.requests)]:
+            future.result()
+    wall = time.perf_counter() - start
+
+    stages = {}
+    for stage, duration in samples:
+        stages.setdefault(stage, []).append(duration)
+    return {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "errors": get_errors(),
+        "wall_time": round(wall, 3),
+        "throughput": round(args.requests / wall, 3),
+        "stages": {
+            stage: {
+                "count": len(values),
+                "p50": round(percentile(values, 50), 3),
+                "p95": round(percentile(values, 95), 3),
+                "p99": round(percentile(values, 99), 3),
+                "max": round(max(values), 3),
+            }
+            for stage, values in stages.items()
+        },
+    }
+
+
+def print_report(name, result):
+    print(f"\n{name}: {result['requests']} requests at concurrency {result['concurrency']}, "
+          f"{result['errors']} errors, {result['wall_time']}s, {result['throughput']} req/s")
+    print(f"  {'stage':<14}{'count':>7}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    for stage, stats in result["stages"].items():
+        print(f"  {stage:<14}{stats['count']:>7}{stats['p50']:>9.3f}{stats['p95']:>9.3f}{stats['p99']:>9.3f}{stats['max']:>9.3f}")
+
+
+SCENARIOS = {
+    "product_details": run_product_details,
+    "generate_blog": run_generate_blog,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark.")
+    parser.add_argument("--scenario", choices=[*SCENARIOS, "all"], default="product_details")
+    parser.add_argument("--store", choices=[*STORES, "all"], default="all", help="store of the product pages")
+    parser.add_argument("-n", "--requests", type=int, default=20)
+    parser.add_argument("-c", "--concurrency", type=int, default=4)
+    parser.add_argument("--template", default="1", help="template id from fixtures/templates.json")
+    parser.add_argument("--no-generate", action="store_true", help="scrape and images only")
+    parser.add_argument("--chat-latency", type=float, default=1.0, help="seconds per chat completion")
+    parser.add_argument("--image-latency", type=float, default=3.0, help="seconds per image generation")
+    parser.add_argument("--page-latency", type=float, default=3.0, help="seconds per browser page load")
+    parser.add_argument("--cdn-latency", type=float, default=0.05, help="seconds per image download")
+    parser.add_argument("--image-size", type=int, default=150000, help="bytes per supplier image")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    static = static_server.start(latency=args.cdn_latency, image_size=args.image_size)
+    openai = mock_openai.start(chat_latency=args.chat_latency, image_latency=args.image_latency,
+                               image_base=static.base_url)
+    work_dir = tempfile.mkdtemp(prefix="benchmark-")
+    setup_environment(args, work_dir, openai.base_url, static.base_url)
+    app = load_app(args, static.base_url)
+
+    results = {}
+    for name in (SCENARIOS if args.scenario == "all" else [args.scenario]):
+        results[name] = SCENARIOS[name](app, args, static.base_url)
+        print_report(name, results[name])
+    print(f"\nOpenAI stand-in requests: {openai.requests}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return 1 if any(result["errors"] for result in results.values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
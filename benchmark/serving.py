@@ -0,0 +1,219 @@
+"""Threaded Flask server vs the async ASGI app under high concurrency.
+
+Both servers run in this process against the local stand-ins of benchmark.run (OpenAI,
+supplier CDN, Shopify store), which run in subprocesses so the thread counts are the
+server's own: the Flask app of app.py under werkzeug with a thread per
+request, and asgi.py under uvicorn. An asyncio client keeps --concurrency requests in
+flight against each in turn.
+
+    python -m benchmark.serving --scenario generate_blog --requests 256 --concurrency 64
+    python -m benchmark.serving --scenario shopify --requests 64 --concurrency 64
+
+Reports throughput, latency percentiles, errors (429s from admission control counted
+apart) and the peak thread count per server. Admission runs with its configured limits,
+the ADMISSION_* environment variables change them.
+Run from the repository root.
+"""
+import sys
+import json
+import time
+import socket
+import asyncio
+import tempfile
+import argparse
+import threading
+import subprocess
+
+import httpx
+
+from benchmark.run import setup_environment, load_app, product_url, percentile
+
+SERVERS = ["flask", "asgi"]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_process(module, port, *options):
+    """Run a stand-in server module in a subprocess and wait until it accepts connections."""
+    process = subprocess.Popen([sys.executable, "-m", module, "--port", str(port), *map(str, options)],
+                               stdout=subprocess.DEVNULL)
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return process
+        except OSError:
+            if process.poll() is not None:
+                raise RuntimeError(f"{module} exited with {process.returncode}")
+            time.sleep(0.05)
+
+
+def start_flask(app):
+    from werkzeug.serving import make_server, WSGIRequestHandler
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server("127.0.0.1", free_port(), app.app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", server.shutdown
+
+
+def start_asgi():
+    import uvicorn
+    import asgi
+
+    port = free_port()
+    # no lifespan: create_app() would resolve chromedriver online, the pipeline does not need it here
+    server = uvicorn.Server(uvicorn.Config(asgi.app, host="127.0.0.1", port=port, lifespan="off",
+                                           log_level="warning", backlog=4096))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+
+    def stop():
+        server.should_exit = True
+
+    return f"http://127.0.0.1:{port}", stop
+
+
+def make_request(scenario, i, args, static_base):
+    """(path, payload) of the i-th request."""
+    if scenario == "generate_blog":
+        return "/generate-blog", {"prompt": f"Write about sustainable kitchen products, part {i}"}
+    # distinct products per request, the scrape cache and singleflight would share them
+    return "/product-details", {
+        "store_name": "shopify",
+        "product_url": product_url("shopify", i, static_base),
+        "language": "English",
+        "is_generate": True,
+        "template_id": args.template,
+    }
+
+
+class ThreadPeak:
+    """Highest threading.active_count() while running."""
+
+    def __init__(self, interval=0.02):
+        self.interval = interval
+        self.peak = threading.active_count()
+        self._stop = threading.Event()
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, threading.active_count())
+
+
+async def fire(base_url, scenario, args, static_base, offset):
+    latencies = []
+    errors = 0
+    rejected = 0
+    semaphore = asyncio.Semaphore(args.concurrency)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=None, limits=limits) as client:
+        async def one(i):
+            nonlocal errors, rejected
+            path, payload = make_request(scenario, offset + i, args, static_base)
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    response = await client.post(path, json=payload)
+                    ok = response.status_code == 200 and response.json().get("success")
+                    rejected += response.status_code == 429
+                except httpx.HTTPError:
+                    ok = False
+                latencies.append(time.perf_counter() - start)
+            errors += 0 if ok else 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*[one(i) for i in range(args.requests)])
+        wall = time.perf_counter() - start
+
+    return {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "errors": errors,
+        "rejected": rejected,
+        "wall_time": round(wall, 3),
+        "throughput": round(args.requests / wall, 3),
+        "p50": round(percentile(latencies, 50), 3),
+        "p95": round(percentile(latencies, 95), 3),
+        "p99": round(percentile(latencies, 99), 3),
+    }
+
+
+def run_server(name, app, args, static_base, offset):
+    base_url, stop = start_flask(app) if name == "flask" else start_asgi()
+    idle = threading.active_count()
+    try:
+        with ThreadPeak() as threads:
+            result = asyncio.run(fire(base_url, args.scenario, args, static_base, offset))
+    finally:
+        stop()
+    return {**result, "idle_threads": idle, "peak_threads": threads.peak}
+
+
+def print_report(name, result):
+    print(f"\n{name}: {result['requests']} requests at concurrency {result['concurrency']}, "
+          f"{result['errors']} errors ({result['rejected']} rejected), {result['wall_time']}s, {result['throughput']} req/s")
+    print(f"  latency p50 {result['p50']:.3f}s  p95 {result['p95']:.3f}s  p99 {result['p99']:.3f}s")
+    print(f"  threads {result['idle_threads']} idle, {result['peak_threads']} peak")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Threaded vs async serving benchmark.")
+    parser.add_argument("--scenario", choices=["generate_blog", "shopify"], default="generate_blog")
+    parser.add_argument("--server", choices=[*SERVERS, "both"], default="both")
+    parser.add_argument("-n", "--requests", type=int, default=256)
+    parser.add_argument("-c", "--concurrency", type=int, default=64)
+    parser.add_argument("--template", default="1", help="template id from fixtures/templates.json")
+    parser.add_argument("--chat-latency", type=float, default=1.0, help="seconds per chat completion")
+    parser.add_argument("--image-latency", type=float, default=3.0, help="seconds per image generation")
+    parser.add_argument("--cdn-latency", type=float, default=0.05, help="seconds per image download")
+    parser.add_argument("--image-size", type=int, default=150000, help="bytes per supplier image")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    static_port, openai_port = free_port(), free_port()
+    static_base = f"http://127.0.0.1:{static_port}"
+    processes = [
+        start_process("benchmark.static_server", static_port, "--latency", args.cdn_latency,
+                      "--image-size", args.image_size),
+        start_process("benchmark.mock_openai", openai_port, "--chat-latency", args.chat_latency,
+                      "--image-latency", args.image_latency, "--image-base", static_base),
+    ]
+    work_dir = tempfile.mkdtemp(prefix="benchmark-")
+    setup_environment(args, work_dir, f"http://127.0.0.1:{openai_port}/v1", static_base)
+    app = load_app(args, static_base)
+
+    results = {}
+    try:
+        for i, name in enumerate(SERVERS if args.server == "both" else [args.server]):
+            results[name] = run_server(name, app, args, static_base, i * args.requests)
+            print_report(name, results[name])
+    finally:
+        for process in processes:
+            process.terminate()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=4)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
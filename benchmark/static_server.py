@@ -0,0 +1,93 @@
+"""Local stand-in for supplier CDNs and Shopify stores.
+
+/images/<name> returns an image of --image-size bytes, /products/<handle>.json the recorded
+Shopify product. Image URLs in the fixtures point back at this server.
+
+    python -m benchmark.static_server --port 8802 --latency 0.05
+"""
+import os
+import time
+import zlib
+import struct
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+STORES = ["amazon", "aliexpress", "alibaba", "shopify"]
+
+
+def load_fixture(store_name, image_base):
+    """Recorded page of a store with its image URLs pointed at image_base."""
+    file_name = f"{store_name}.json" if store_name == "shopify" else f"{store_name}.html"
+    with open(os.path.join(FIXTURES_DIR, file_name)) as f:
+        return f.read().replace("{image_base}", image_base)
+
+
+def make_png(size):
+    """A valid grey PNG of roughly size bytes (incompressible pixel noise makes up the bulk)."""
+    side = max(1, int((size / 3) ** 0.5))
+    rows = b"".join(b"\x00" + os.urandom(side * 3) for _ in range(side))
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    header = struct.pack(">IIBBBBB", side, side, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(rows, 0)) + chunk(b"IEND", b"")
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, body, content_type, status=200):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        time.sleep(server.latency)
+        path = self.path.split("?")[0]
+
+        if path.startswith("/images/"):
+            return self._send(server.image, "image/png")
+        if path.startswith("/products/") and path.endswith(".json"):
+            return self._send(server.shopify, "application/json")
+        self._send(b"Not Found", "text/plain", 404)
+
+
+def start(port=0, latency=0.0, image_size=150000):
+    """Serve in a daemon thread; returns the server (its base URL is server.base_url)."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    server.image = make_png(image_size)
+    server.shopify = load_fixture("shopify", server.base_url).encode()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Static image and Shopify stand-in server.")
+    parser.add_argument("--port", type=int, default=8802)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per request")
+    parser.add_argument("--image-size", type=int, default=150000, help="bytes per image")
+    args = parser.parse_args()
+
+    server = start(args.port, args.latency, args.image_size)
+    print(f"Static server on {server.base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
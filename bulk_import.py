@@ -0,0 +1,97 @@
+import os
+import sys
+import json
+import time
+import argparse
+import batch
+
+
+def read_items(path):
+    """Return (line_number, item) for every valid request line of a JSONL file."""
+    items = []
+    with open(path) as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f"Skipping line {line_number}: {e}")
+                continue
+            message = batch.validate_item(item)
+            if message:
+                print(f"Skipping line {line_number}: item {message}")
+                continue
+            items.append((line_number, item))
+    return items
+
+
+def read_checkpoint(output_path, retry_failed=False):
+    """Return the input line numbers already written to the output file."""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path) as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+                if result.get("success") or not retry_failed:
+                    done.add(result["line"])
+            except (json.JSONDecodeError, KeyError):
+                # last line of a crashed run can be cut off
+                continue
+    return done
+
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run /product-details for every request of a JSONL file.")
+    parser.add_argument("input", help="JSONL file, one {product_url, store_name, template_id, language} per line")
+    parser.add_argument("-o", "--output", help="JSONL file results are appended to (default: <input>.out.jsonl)")
+    parser.add_argument("-w", "--workers", type=int, default=4, help="number of items processed at the same time")
+    parser.add_argument("--retry-failed", action="store_true", help="run lines whose earlier result failed again")
+    args = parser.parse_args()
+
+    output_path = args.output or f"{os.path.splitext(args.input)[0]}.out.jsonl"
+
+    # the output file is the checkpoint: lines already in it are not run again
+    done = read_checkpoint(output_path, args.retry_failed)
+    items = [(line_number, item) for line_number, item in read_items(args.input) if line_number not in done]
+    if done:
+        print(f"Resuming: {len(done)} already done, {len(items)} left")
+    if not items:
+        return 0
+
+    # imported here so --help works without the app's environment
+    from app import run_product_details
+
+    line_numbers = [line_number for line_number, _ in items]
+    start = time.time()
+    failed = 0
+    with open(output_path, 'a') as out:
+        for count, result in enumerate(batch.run_batch([item for _, item in items], run_product_details,
+                                                       {"default": args.workers}), start=1):
+            result["line"] = line_numbers[result.pop("index")]
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+            failed += 0 if result.get("success") else 1
+
+            elapsed = time.time() - start
+            rate = count / elapsed
+            eta = (len(items) - count) / rate
+            print(f"[{count}/{len(items)}] line {result['line']} "
+                  f"{'ok' if result.get('success') else 'failed'} | "
+                  f"{rate * 60:.1f} items/min | ETA {format_duration(eta)}")
+
+    print(f"Done: {len(items) - failed} ok, {failed} failed in {format_duration(time.time() - start)}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
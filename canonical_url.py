@@ -0,0 +1,137 @@
+import re
+import sys
+import time
+import random
+import string
+
+# Regexes instead of urlparse: this runs for every request and over whole catalogs.
+URL_RE = re.compile(r'^\s*(?:[a-zA-Z][a-zA-Z0-9+.-]*:)?//(?:[^@/?#]*@)?([^/?#:]+)(?::\d+)?([^?#]*)(?:\?([^#]*))?')
+
+AMAZON_HOST_RE = re.compile(r'(?:^|\.)amazon\.([a-z.]+)$')
+ASIN_RE = re.compile(r'/(?:dp|gp/product|gp/aw/d|exec/obidos/asin|o/asin|product)/([A-Z0-9]{10})(?=[/?#]|$)', re.I)
+
+ALIEXPRESS_ITEM_RE = re.compile(r'/(?:item|i)/(?:[^/]*/)?(\d+)\.html')
+ALIEXPRESS_QUERY_RE = re.compile(r'(?:^|&)productId=(\d+)')
+
+ALIBABA_ITEM_RE = re.compile(r'[_-](\d{6,})\.html|/product/(\d{6,})')
+
+SHOPIFY_HANDLE_RE = re.compile(r'/products/([^/]+)')
+
+
+def split_url(product_url):
+    """Return (host, path, query) of a URL, host lower-cased without "www."; host is "" when there is none."""
+    match = URL_RE.match(product_url)
+    if not match:
+        # no scheme, e.g. "amazon.com/dp/B000000000"
+        match = URL_RE.match(f"//{product_url.strip()}")
+    if not match:
+        # blank or hostless, e.g. "   " or "/products/x"
+        return "", product_url.strip() or "/", ""
+    host, path, query = match.groups()
+    host = host.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    return host, path or "/", query or ""
+
+
+def detect_store(host):
+    if AMAZON_HOST_RE.search(host):
+        return "amazon"
+    if "aliexpress." in host:
+        return "aliexpress"
+    if "alibaba." in host:
+        return "alibaba"
+    return "shopify"
+
+
+def get_shopify_handle(path):
+    """Handle of /products/<handle> and /collections/<x>/products/<handle> paths, or None."""
+    match = SHOPIFY_HANDLE_RE.search(path)
+    if not match:
+        return None
+    handle = match.group(1).lower()
+    for suffix in (".json", ".js"):
+        if handle.endswith(suffix):
+            handle = handle[:-len(suffix)]
+    return handle or None
+
+
+def parse_product_url(product_url, store_name=None):
+    """Return (store, product id) for a product URL, or (store, None) when no id is found.
+
+    Ids are the ASIN (prefixed with the marketplace outside amazon.com), the AliExpress
+    item id, the Alibaba product id and "<domain>/<handle>" for Shopify.
+    """
+    host, path, query = split_url(product_url)
+    store = store_name or detect_store(host)
+
+    if store == "amazon":
+        match = ASIN_RE.search(path)
+        if not match:
+            return store, None
+        asin = match.group(1).upper()
+        marketplace = AMAZON_HOST_RE.search(host)
+        if marketplace and marketplace.group(1) != "com":
+            return store, f"{marketplace.group(1)}/{asin}"
+        return store, asin
+
+    if store == "aliexpress":
+        match = ALIEXPRESS_ITEM_RE.search(path) or ALIEXPRESS_QUERY_RE.search(query)
+        return store, match.group(1) if match else None
+
+    if store == "alibaba":
+        match = ALIBABA_ITEM_RE.search(path)
+        return store, (match.group(1) or match.group(2)) if match else None
+
+    if store == "shopify":
+        handle = get_shopify_handle(path)
+        return store, f"{host}/{handle}" if handle else None
+
+    return store, None
+
+
+def canonicalize(product_url, store_name=None):
+    """Stable key of a product URL, e.g. "amazon:B07XJ8C8F5" or "shopify:shop.com/blue-shirt".
+
+    URLs without a recognizable id fall back to "<store>:<host><path>".
+    """
+    store, product_id = parse_product_url(product_url, store_name)
+    if product_id:
+        return f"{store}:{product_id}"
+    host, path, _ = split_url(product_url)
+    return f"{store}:{host}{path.rstrip('/')}"
+
+
+def _random_urls(count):
+    def word(n):
+        return "".join(random.choices(string.ascii_lowercase, k=n))
+
+    def asin():
+        return "B0" + "".join(random.choices(string.ascii_uppercase + string.digits, k=8))
+
+    def digits(n):
+        return "".join(random.choices(string.digits, k=n))
+
+    forms = [
+        lambda: f"https://www.amazon.com/{word(8)}-{word(6)}/dp/{asin()}/ref=sr_1_3?keywords={word(5)}&qid={digits(10)}",
+        lambda: f"https://amazon.com/gp/product/{asin()}?th=1&psc=1",
+        lambda: f"https://www.amazon.co.uk/dp/{asin()}",
+        lambda: f"https://www.aliexpress.com/item/1005{digits(9)}.html?spm=a2g0o.{digits(6)}&pdp_npi=4",
+        lambda: f"https://www.alibaba.com/product-detail/{word(7)}-{word(5)}_1600{digits(9)}.html?spm=a2700.{digits(7)}",
+        lambda: f"https://{word(8)}.myshopify.com/collections/{word(6)}/products/{word(5)}-{word(4)}?variant={digits(14)}",
+        lambda: f"https://{word(6)}.com/products/{word(7)}",
+    ]
+    return [random.choice(forms)() for _ in range(count)]
+
+
+def benchmark(count=1000000):
+    urls = _random_urls(count)
+    start = time.perf_counter()
+    for url in urls:
+        canonicalize(url)
+    elapsed = time.perf_counter() - start
+    print(f"{count} URLs in {elapsed:.2f}s: {count / elapsed:,.0f} URLs/s, {elapsed / count * 1e6:.2f} us/URL")
+
+
+if __name__ == '__main__':
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
@@ -0,0 +1,433 @@
+"""Record/replay of outbound traffic: requests, httpx (the OpenAI client) and Selenium page loads.
+
+CASSETTE_MODE=record runs against the real sites and appends every exchange to CASSETTE_PATH
+(JSON lines). CASSETTE_MODE=replay serves the same exchanges from the file without network or
+Chrome, sleeping the recorded latency times CASSETTE_LATENCY_SCALE. Requests are matched by
+normalized URL and body hash, with the timestamps of saved image file names masked (they
+differ on every run); repeated requests replay their recordings in order. Misses fail
+like a network error and are listed by get_stats() and at exit.
+"""
+import os
+import re
+import json
+import time
+import atexit
+import base64
+import hashlib
+import threading
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CASSETTE_MODE = os.getenv('CASSETTE_MODE', '').lower()
+CASSETTE_PATH = os.getenv('CASSETTE_PATH', 'cassette.jsonl')
+CASSETTE_LATENCY_SCALE = float(os.getenv('CASSETTE_LATENCY_SCALE', 1.0))
+# Query parameters that change on every visit and are left out of the match
+CASSETTE_IGNORE_PARAMS = set(os.getenv('CASSETTE_IGNORE_PARAMS', 'spm,scm,qid,pdp_npi,_t,timestamp').split(','))
+
+# Hop-by-hop and encoding headers; bodies are stored decoded
+DROP_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection"}
+BOUNDARY_RE = re.compile(r'boundary=([^;\s]+)')
+# app.get_timestamp() in the names of saved images, which end up in URLs, uploads and prompts
+TIMESTAMP_RE = re.compile(r'\d{8}_\d{6}_\d{6}')
+TIMESTAMP_BYTES_RE = re.compile(TIMESTAMP_RE.pattern.encode())
+
+_lock = threading.Lock()
+_mode = None
+_path = None
+_index = {}
+_played = {}
+_pending = {}
+_stats = {"recorded": 0, "replayed": 0, "misses": 0}
+_missed = []
+
+
+class CassetteMiss(Exception):
+    """A replayed request that is not in the cassette."""
+
+
+def normalize_url(url):
+    """Lower-case scheme and host, drop the fragment, default ports and volatile parameters, sort the query,
+    mask file name timestamps."""
+    parts = urlsplit(url)
+    host = (parts.hostname or "").lower()
+    if parts.port and (parts.scheme, parts.port) not in (("http", 80), ("https", 443)):
+        host = f"{host}:{parts.port}"
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k not in CASSETTE_IGNORE_PARAMS)
+    path = TIMESTAMP_RE.sub("TIMESTAMP", parts.path or "/")
+    return urlunsplit((parts.scheme.lower(), host, path, urlencode(query), ""))
+
+
+def body_hash(body, content_type=None):
+    """sha256 of a request body; JSON is hashed with sorted keys, multipart without its random boundary, and
+    file name timestamps are masked."""
+    if not body:
+        return ""
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    if content_type and "json" in content_type:
+        try:
+            body = json.dumps(json.loads(body), sort_keys=True, separators=(',', ':')).encode('utf-8')
+        except ValueError:
+            pass
+    elif content_type and "multipart" in content_type:
+        boundary = BOUNDARY_RE.search(content_type)
+        if boundary:
+            body = body.replace(boundary.group(1).encode(), b"")
+    body = TIMESTAMP_BYTES_RE.sub(b"TIMESTAMP", body)
+    return hashlib.sha256(body).hexdigest()[:32]
+
+
+def _key(kind, method, url, digest):
+    return (kind, method.upper(), normalize_url(url), digest)
+
+
+def _write(entry):
+    with _lock:
+        with open(_path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+        _stats["recorded"] += 1
+
+
+def _lookup(kind, method, url, digest):
+    """Next recording of a request, in recording order (the last one repeats), or raise CassetteMiss."""
+    key = _key(kind, method, url, digest)
+    with _lock:
+        entries = _index.get(key)
+        if not entries:
+            _stats["misses"] += 1
+            _missed.append(f"{kind} {method.upper()} {key[2]} {digest}".strip())
+            raise CassetteMiss(f"Not in cassette: {method.upper()} {url}")
+        played = _played.get(key, 0)
+        _played[key] = played + 1
+        _stats["replayed"] += 1
+        entry = entries[min(played, len(entries) - 1)]
+    time.sleep(entry.get("latency", 0) * CASSETTE_LATENCY_SCALE)
+    return entry
+
+
+def load(path):
+    index = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                entry = json.loads(line)
+                index.setdefault((entry["kind"], entry["method"], entry["key_url"], entry["body_hash"]), []).append(entry)
+    return index
+
+
+def _clean_headers(headers):
+    return {k: v for k, v in headers.items() if k.lower() not in DROP_HEADERS}
+
+
+# requests
+
+def _patch_requests():
+    import requests
+    from requests.structures import CaseInsensitiveDict
+
+    send = requests.Session.send
+
+    def record_send(self, request, **kwargs):
+        start = time.time()
+        response = send(self, request, **kwargs)
+        _write({
+            "kind": "http", "method": request.method, "url": request.url, "key_url": normalize_url(request.url),
+            "body_hash": body_hash(request.body, request.headers.get("Content-Type")),
+            "status": response.status_code, "headers": _clean_headers(response.headers),
+            "body": base64.b64encode(response.content).decode(), "latency": round(time.time() - start, 4),
+        })
+        return response
+
+    def replay_send(self, request, **kwargs):
+        try:
+            entry = _lookup("http", request.method, request.url, body_hash(request.body, request.headers.get("Content-Type")))
+        except CassetteMiss as e:
+            raise requests.ConnectionError(str(e), request=request)
+        response = requests.Response()
+        response.status_code = entry["status"]
+        response.headers = CaseInsensitiveDict(entry["headers"])
+        response._content = base64.b64decode(entry["body"])
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response.url = request.url
+        response.request = request
+        return response
+
+    requests.Session.send = record_send if _mode == "record" else replay_send
+
+
+# httpx, used by the OpenAI client
+
+def _patch_httpx():
+    import httpx
+
+    send = httpx.Client.send
+    async_send = httpx.AsyncClient.send
+
+    def _record(request, response, start):
+        _write({
+            "kind": "http", "method": request.method, "url": str(request.url), "key_url": normalize_url(str(request.url)),
+            "body_hash": body_hash(request.content, request.headers.get("Content-Type")),
+            "status": response.status_code, "headers": _clean_headers(response.headers),
+            "body": base64.b64encode(response.content).decode(), "latency": round(time.time() - start, 4),
+        })
+
+    def _replay(request):
+        try:
+            entry = _lookup("http", request.method, str(request.url), body_hash(request.content, request.headers.get("Content-Type")))
+        except CassetteMiss as e:
+            raise httpx.ConnectError(str(e), request=request)
+        return httpx.Response(entry["status"], headers=entry["headers"], content=base64.b64decode(entry["body"]), request=request)
+
+    def record_send(self, request, **kwargs):
+        start = time.time()
+        response = send(self, request, **kwargs)
+        response.read()
+        _record(request, response, start)
+        return response
+
+    async def record_async_send(self, request, **kwargs):
+        start = time.time()
+        response = await async_send(self, request, **kwargs)
+        await response.aread()
+        _record(request, response, start)
+        return response
+
+    def replay_send(self, request, **kwargs):
+        return _replay(request)
+
+    async def replay_async_send(self, request, **kwargs):
+        return _replay(request)
+
+    if _mode == "record":
+        httpx.Client.send, httpx.AsyncClient.send = record_send, record_async_send
+    else:
+        httpx.Client.send, httpx.AsyncClient.send = replay_send, replay_async_send
+
+
+# Selenium: page loads and clicks are recorded with the URL and page source they led to
+
+def _locator_hash(by, value):
+    return body_hash(f"{by}={value}")
+
+
+def _flush(driver):
+    entry = _pending.pop(id(driver), None)
+    if entry:
+        _write(entry)
+
+
+def _patch_selenium():
+    from selenium.webdriver.remote.webdriver import WebDriver
+    from selenium.webdriver.remote.webelement import WebElement
+
+    get = WebDriver.get
+    quit = WebDriver.quit
+    find_element = WebDriver.find_element
+    click = WebElement.click
+    page_source = WebDriver.page_source.fget
+    current_url = WebDriver.current_url.fget
+
+    def record_get(self, url):
+        _flush(self)
+        start = time.time()
+        get(self, url)
+        _pending[id(self)] = {
+            "kind": "webdriver", "method": "GET", "url": url, "key_url": normalize_url(url), "body_hash": "",
+            "current_url": current_url(self), "page_source": page_source(self), "latency": round(time.time() - start, 4),
+        }
+
+    def record_page_source(self):
+        source = page_source(self)
+        # pages keep rendering after load: keep the latest source the fetcher saw
+        if id(self) in _pending:
+            _pending[id(self)]["page_source"] = source
+            _pending[id(self)]["current_url"] = current_url(self)
+        return source
+
+    def record_find_element(self, by="id", value=None):
+        element = find_element(self, by, value)
+        element._cassette_locator = (by, value)
+        return element
+
+    def record_click(self):
+        driver = self.parent
+        _flush(driver)
+        url = current_url(driver)
+        start = time.time()
+        click(self)
+        by, value = getattr(self, "_cassette_locator", ("", ""))
+        _pending[id(driver)] = {
+            "kind": "webdriver", "method": "CLICK", "url": url, "key_url": normalize_url(url),
+            "body_hash": _locator_hash(by, value), "current_url": current_url(driver),
+            "page_source": page_source(driver), "latency": round(time.time() - start, 4),
+        }
+
+    def record_quit(self):
+        _flush(self)
+        quit(self)
+
+    WebDriver.get = record_get
+    WebDriver.page_source = property(record_page_source)
+    WebDriver.find_element = record_find_element
+    WebElement.click = record_click
+    WebDriver.quit = record_quit
+
+
+class _SwitchTo:
+    def frame(self, frame_reference):
+        pass
+
+    def default_content(self):
+        pass
+
+
+class ReplayElement:
+    def __init__(self, driver, node, locator):
+        self.driver = driver
+        self.node = node
+        self.locator = locator
+
+    @property
+    def text(self):
+        return self.node.get_text(" ", strip=True) if self.node else ""
+
+    def get_attribute(self, name):
+        if not self.node:
+            return None
+        value = self.node.get(name)
+        return " ".join(value) if isinstance(value, list) else value
+
+    def is_displayed(self):
+        return True
+
+    def send_keys(self, *value):
+        pass
+
+    def click(self):
+        self.driver._replay("CLICK", self.driver.current_url, _locator_hash(*self.locator))
+
+
+XPATH_RE = re.compile(r"^//(\w+|\*)((?:\[@[\w-]+=['\"][^'\"]*['\"]\])*)$")
+XPATH_ATTR_RE = re.compile(r"\[@([\w-]+)=['\"]([^'\"]*)['\"]\]")
+
+
+def _to_css(by, value):
+    """CSS selector for a Selenium locator; simple //tag[@attr="value"] XPaths only."""
+    if by == "id":
+        return f"#{value}"
+    if by == "class name":
+        return f".{value}"
+    if by in ("tag name", "css selector"):
+        return value
+    if by == "name":
+        return f'[name="{value}"]'
+    if by == "xpath":
+        match = XPATH_RE.match(value)
+        if match:
+            tag = "" if match.group(1) == "*" else match.group(1)
+            return tag + "".join(f'[{k}="{v}"]' for k, v in XPATH_ATTR_RE.findall(match.group(2))) or "*"
+    return None
+
+
+class ReplayDriver:
+    """Stands in for a Chrome WebDriver in replay mode; pages come from the cassette."""
+
+    def __init__(self):
+        self.current_url = "about:blank"
+        self.page_source = "<html><head></head><body></body></html>"
+        self.capabilities = {"browserVersion": ""}
+        self.switch_to = _SwitchTo()
+        self.proxy = None
+        self.profile = None
+        self._soup = None
+
+    def _replay(self, method, url, digest=""):
+        from selenium.common.exceptions import WebDriverException
+        try:
+            entry = _lookup("webdriver", method, url, digest)
+        except CassetteMiss as e:
+            if method == "CLICK":
+                # a click that was not recorded did not navigate
+                return
+            raise WebDriverException(str(e))
+        self.current_url = entry["current_url"]
+        self.page_source = entry["page_source"]
+        self._soup = None
+
+    def get(self, url):
+        self._replay("GET", url)
+
+    @property
+    def title(self):
+        node = self._get_soup().title
+        return node.get_text(strip=True) if node else ""
+
+    def _get_soup(self):
+        if self._soup is None:
+            from bs4 import BeautifulSoup
+            self._soup = BeautifulSoup(self.page_source, "html.parser")
+        return self._soup
+
+    def find_elements(self, by="id", value=None):
+        selector = _to_css(by, value)
+        if selector is None:
+            # unsupported XPath: only elements whose click was recorded exist
+            key = _key("webdriver", "CLICK", self.current_url, _locator_hash(by, value))
+            return [ReplayElement(self, None, (by, value))] if key in _index else []
+        return [ReplayElement(self, node, (by, value)) for node in self._get_soup().select(selector)]
+
+    def find_element(self, by="id", value=None):
+        from selenium.common.exceptions import NoSuchElementException
+        elements = self.find_elements(by, value)
+        if not elements:
+            raise NoSuchElementException(f"{by}={value}")
+        return elements[0]
+
+    def execute_script(self, script, *args):
+        return None
+
+    def execute_cdp_cmd(self, cmd, cmd_args):
+        return {}
+
+    def delete_all_cookies(self):
+        pass
+
+    def quit(self):
+        pass
+
+
+def is_replaying():
+    return _mode == "replay"
+
+
+def install(mode=None, path=None):
+    """Patch requests, httpx and Selenium for CASSETTE_MODE ("record" or "replay"); no-op otherwise."""
+    global _mode, _path, _index
+    mode = (mode or CASSETTE_MODE).lower()
+    if _mode or mode not in ("record", "replay"):
+        return
+    _mode, _path = mode, path or CASSETTE_PATH
+    if mode == "replay":
+        _index = load(_path)
+    _patch_requests()
+    _patch_httpx()
+    if mode == "record":
+        _patch_selenium()
+    atexit.register(_at_exit)
+
+
+def get_stats():
+    with _lock:
+        return {"mode": _mode, "path": _path, **_stats, "missed": _missed[-50:]}
+
+
+def _at_exit():
+    if _mode == "record":
+        for driver_id in list(_pending):
+            _write(_pending.pop(driver_id))
+    elif _stats["misses"]:
+        print(f"Cassette {_path}: {_stats['misses']} misses")
+        for miss in _missed[-50:]:
+            print(f"  {miss}")
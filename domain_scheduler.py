@@ -0,0 +1,284 @@
+import os
+import json
+import time
+import asyncio
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
+from dotenv import load_dotenv
+import canonical_url
+import metrics
+
+load_dotenv()
+
+# Requests per second and requests in flight allowed per domain. The rate adapts between
+# min_rate and rate: it halves when a request gets blocked (captcha, 429, 503) and grows
+# again after RAMP_UP_AFTER clean requests in a row.
+DOMAIN_LIMITS = {
+    "amazon.com": {"rate": 0.5, "min_rate": 0.05, "concurrency": 2},
+    "aliexpress.com": {"rate": 0.5, "min_rate": 0.05, "concurrency": 2},
+    "alibaba.com": {"rate": 0.5, "min_rate": 0.05, "concurrency": 2},
+    "default": {"rate": 2, "min_rate": 0.1, "concurrency": 4},
+}
+for domain, limits in json.loads(os.getenv('DOMAIN_LIMITS', '{}')).items():
+    DOMAIN_LIMITS[domain] = {**DOMAIN_LIMITS.get(domain, DOMAIN_LIMITS["default"]), **limits}
+
+RAMP_UP_AFTER = int(os.getenv('DOMAIN_RAMP_UP_AFTER', 10))
+# Outcomes the block rate is computed over
+BLOCK_WINDOW = 50
+
+# Second-level labels under which registrable domains have three labels (amazon.co.uk)
+SECOND_LEVEL = {"co", "com", "org", "net", "ac", "gov", "edu"}
+
+_lock = threading.Lock()
+# domain -> Slot held by the current request through hold()
+_held = contextvars.ContextVar("domain_scheduler_held", default={})
+_domains = {}
+
+
+class _Domain:
+    def __init__(self, limits):
+        self.max_rate = limits["rate"]
+        self.min_rate = limits["min_rate"]
+        self.max_concurrency = limits["concurrency"]
+        self.rate = self.max_rate
+        self.concurrency = self.max_concurrency
+        self.tokens = 1.0
+        self.refilled_at = time.monotonic()
+        self.in_flight = 0
+        self.clean_streak = 0
+        self.outcomes = deque(maxlen=BLOCK_WINDOW)
+        self.started = deque()
+        self.condition = threading.Condition(_lock)
+        # wake() of the coroutines waiting for a release, oldest first; threads wait on the condition
+        self.wakers = deque()
+
+
+class Slot:
+    """Handed to the fetcher; set `blocked` when the site answered with a captcha or block page."""
+    def __init__(self, domain):
+        self.domain = domain
+        self.blocked = False
+
+
+def get_domain(product_url):
+    host, _, _ = canonical_url.split_url(product_url)
+    labels = host.split(".")
+    if labels[-1].isdigit():
+        # IP address
+        return host
+    if len(labels) > 2 and labels[-2] in SECOND_LEVEL and len(labels[-1]) == 2:
+        return ".".join(labels[-3:])
+    return ".".join(labels[-2:])
+
+
+def _get_state(domain):
+    state = _domains.get(domain)
+    if not state:
+        limits = DOMAIN_LIMITS.get(domain) or DOMAIN_LIMITS.get(domain.split(".")[0] + ".com") or DOMAIN_LIMITS["default"]
+        state = _domains[domain] = _Domain(limits)
+    return state
+
+
+def _take(state):
+    """Take a concurrency slot and a rate token if both are free.
+
+    Returns (taken, seconds until a token is due, None when waiting for a release).
+    """
+    now = time.monotonic()
+    state.tokens = min(1.0, state.tokens + (now - state.refilled_at) * state.rate)
+    state.refilled_at = now
+
+    if state.in_flight < state.concurrency and state.tokens >= 1:
+        state.tokens -= 1
+        state.in_flight += 1
+        state.started.append(now)
+        while now - state.started[0] > 60:
+            state.started.popleft()
+        return True, 0
+
+    return False, None if state.in_flight >= state.concurrency else (1 - state.tokens) / state.rate
+
+
+def _waker(event):
+    """Thread-safe wake() setting an asyncio.Event on its own event loop."""
+    loop = asyncio.get_running_loop()
+
+    def wake():
+        try:
+            loop.call_soon_threadsafe(event.set)
+        except RuntimeError:
+            # loop closed
+            pass
+    return wake
+
+
+def _wake_one(state):
+    if state.wakers:
+        state.wakers.popleft()()
+
+
+def acquire(domain):
+    """Block until the domain has a free concurrency slot and a rate token."""
+    with _lock:
+        state = _get_state(domain)
+        while True:
+            taken, wait = _take(state)
+            if taken:
+                return
+            state.condition.wait(wait)
+
+
+async def aacquire(domain):
+    """acquire() for coroutines: sleeps until a token is due, or until a release wakes it."""
+    event = asyncio.Event()
+    wake = _waker(event)
+    while True:
+        with _lock:
+            state = _get_state(domain)
+            taken, wait = _take(state)
+            if taken:
+                # a ramp-up may have freed more than one slot
+                if state.in_flight < state.concurrency:
+                    _wake_one(state)
+                return
+            event.clear()
+            if wait is None:
+                state.wakers.append(wake)
+        try:
+            await asyncio.wait_for(event.wait(), wait)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            with _lock:
+                if wake in state.wakers:
+                    state.wakers.remove(wake)
+                elif event.is_set():
+                    # woken for a release it will not take, pass it on
+                    _wake_one(state)
+            raise
+
+
+def release(domain, blocked=False):
+    """Free the slot and adapt the domain's rate to the outcome."""
+    with _lock:
+        state = _get_state(domain)
+        state.in_flight -= 1
+        state.outcomes.append(blocked)
+
+        if blocked:
+            state.clean_streak = 0
+            state.rate = max(state.min_rate, state.rate / 2)
+            state.concurrency = max(1, state.concurrency - 1)
+        else:
+            state.clean_streak += 1
+            if state.clean_streak >= RAMP_UP_AFTER:
+                state.clean_streak = 0
+                state.rate = min(state.max_rate, state.rate + state.max_rate / 10)
+                state.concurrency = min(state.max_concurrency, state.concurrency + 1)
+
+        state.condition.notify_all()
+        _wake_one(state)
+
+
+@contextmanager
+def slot(product_url, proxy=None, driver=None):
+    """Hold a politeness slot for the domain of product_url while the block runs.
+
+    with domain_scheduler.slot(url, driver=driver) as s:
+        driver.get(url)
+        s.blocked = "captcha" in driver.current_url
+
+    The outcome is also reported to the proxy pool for the proxy in use and, for browser
+    fetches, to the fingerprint profile of the driver.
+    """
+    import proxy_pool
+    import fingerprint
+
+    if driver is not None:
+        proxy = getattr(driver, "proxy", None)
+    domain = get_domain(product_url)
+    held = _held.get().get(domain)
+    current = held or Slot(domain)
+    if not held:
+        with metrics.timer("domain_wait"):
+            acquire(domain)
+    start = time.time()
+    outcome = "failed"
+    try:
+        yield current
+        outcome = "captcha" if current.blocked else "ok"
+    finally:
+        if not held:
+            release(current.domain, current.blocked)
+        duration = time.time() - start
+        proxy_pool.report(proxy, product_url, duration, outcome)
+        if driver is not None:
+            fingerprint.report(getattr(driver, "profile", None), proxy, product_url, duration, outcome != "ok")
+
+
+@contextmanager
+def hold(product_url):
+    """Take the politeness slot for the domain of product_url before the resources a fetch needs.
+
+    with domain_scheduler.hold(url), admission.slot("browser"):
+        fetch(url, get_driver())
+
+    slot() for the same domain inside the block uses this slot instead of waiting again, and
+    it is released with their outcome when the block ends.
+    """
+    current = Slot(get_domain(product_url))
+    with metrics.timer("domain_wait"):
+        acquire(current.domain)
+    token = _held.set({**_held.get(), current.domain: current})
+    try:
+        yield current
+    finally:
+        _held.reset(token)
+        release(current.domain, current.blocked)
+
+
+@asynccontextmanager
+async def aslot(product_url, proxy=None):
+    """slot() for coroutines (HTTP fetches, no driver)."""
+    import proxy_pool
+
+    current = Slot(get_domain(product_url))
+    with metrics.timer("domain_wait"):
+        await aacquire(current.domain)
+    start = time.time()
+    outcome = "failed"
+    try:
+        yield current
+        outcome = "captcha" if current.blocked else "ok"
+    finally:
+        release(current.domain, current.blocked)
+        proxy_pool.report(proxy, product_url, time.time() - start, outcome)
+
+
+def get_stats():
+    """Per domain: allowed and observed request rate, concurrency and block rate."""
+    stats = {}
+    with _lock:
+        now = time.monotonic()
+        for domain, state in _domains.items():
+            while state.started and now - state.started[0] > 60:
+                state.started.popleft()
+            stats[domain] = {
+                "rate": round(state.rate, 3),
+                "max_rate": state.max_rate,
+                "observed_rate": round(len(state.started) / 60, 3),
+                "concurrency": state.concurrency,
+                "in_flight": state.in_flight,
+                "block_rate": round(sum(state.outcomes) / len(state.outcomes), 3) if state.outcomes else 0.0,
+            }
+    return stats
+
+
+def _gauges():
+    return [(f"domain_{name}", {"domain": domain}, value)
+            for domain, stats in get_stats().items() for name, value in stats.items()]
+
+
+metrics.add_collector(_gauges)
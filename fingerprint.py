@@ -0,0 +1,157 @@
+import random
+import threading
+from collections import deque
+import domain_scheduler
+
+# Platforms the browser can present as. User agent, navigator.platform and the client hints
+# all come from the same entry, and the Chrome version always is the installed one.
+PLATFORMS = {
+    "windows": {
+        "ua_platform": "Windows NT 10.0; Win64; x64",
+        "navigator_platform": "Win32",
+        "hint_platform": "Windows",
+        "platform_version": "10.0.0",
+    },
+    "mac": {
+        "ua_platform": "Macintosh; Intel Mac OS X 10_15_7",
+        "navigator_platform": "MacIntel",
+        "hint_platform": "macOS",
+        "platform_version": "14.5.0",
+    },
+    "linux": {
+        "ua_platform": "X11; Linux x86_64",
+        "navigator_platform": "Linux x86_64",
+        "hint_platform": "Linux",
+        "platform_version": "6.5.0",
+    },
+}
+# Common desktop screen sizes per platform
+VIEWPORTS = {
+    "windows": [(1920, 1080), (1536, 864), (1366, 768)],
+    "mac": [(1440, 900), (1680, 1050)],
+    "linux": [(1920, 1080), (1366, 768)],
+}
+LANGUAGES = [["en-US", "en"], ["en-GB", "en"]]
+
+# Outcomes a profile is scored over per site, and the fetch time (seconds) that halves its score
+SCORE_WINDOW = 30
+DURATION_SCALE = 20.0
+
+_lock = threading.Lock()
+_outcomes = {}
+_sessions = {}
+
+
+def build_profiles():
+    profiles = {}
+    for platform, viewports in VIEWPORTS.items():
+        for width, height in viewports:
+            for languages in LANGUAGES:
+                profile_id = f"{platform}-{width}x{height}-{languages[0]}"
+                profiles[profile_id] = {
+                    "id": profile_id,
+                    "platform": platform,
+                    "width": width,
+                    "height": height,
+                    "languages": languages,
+                }
+    return profiles
+
+
+PROFILES = build_profiles()
+
+
+def get_user_agent(profile, version):
+    major = version.split(".")[0]
+    ua_platform = PLATFORMS[profile["platform"]]["ua_platform"]
+    # Chrome sends the reduced user agent: only the major version, the rest zeroed
+    return f"Mozilla/5.0 ({ua_platform}) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/{major}.0.0.0 Safari/537.36"
+
+
+def get_user_agent_override(profile, version):
+    """Parameters of the CDP Network.setUserAgentOverride command for profile and a Chrome version."""
+    platform = PLATFORMS[profile["platform"]]
+    major = version.split(".")[0]
+    brands = [("Not)A;Brand", "99"), ("Google Chrome", major), ("Chromium", major)]
+    return {
+        "userAgent": get_user_agent(profile, version),
+        "acceptLanguage": ",".join(profile["languages"]),
+        "platform": platform["navigator_platform"],
+        "userAgentMetadata": {
+            "brands": [{"brand": brand, "version": v} for brand, v in brands],
+            "fullVersionList": [{"brand": brand, "version": version if v == major else f"{v}.0.0.0"} for brand, v in brands],
+            "fullVersion": version,
+            "platform": platform["hint_platform"],
+            "platformVersion": platform["platform_version"],
+            "architecture": "x86",
+            "model": "",
+            "mobile": False,
+            "bitness": "64",
+            "wow64": False,
+        },
+    }
+
+
+def add_arguments(options, profile):
+    """Launch options of profile: window size and language."""
+    options.add_argument(f"--window-size={profile['width']},{profile['height']}")
+    options.add_argument(f"--lang={profile['languages'][0]}")
+
+
+def apply(driver, profile):
+    """Present the profile from the running browser: user agent, client hints and platform."""
+    version = driver.capabilities.get("browserVersion", "")
+    driver.execute_cdp_cmd("Network.setUserAgentOverride", get_user_agent_override(profile, version))
+    driver.profile = profile["id"]
+
+
+def _score(outcomes):
+    # untried profiles score as perfect so they get explored
+    if not outcomes:
+        return 1.0
+    clean = [duration for blocked, duration in outcomes if not blocked]
+    if not clean:
+        return 0.0
+    return len(clean) / len(outcomes) / (1 + sum(clean) / len(clean) / DURATION_SCALE)
+
+
+def choose(product_url=None, proxy=None):
+    """Profile for a browser session on the site of product_url through proxy.
+
+    The same site and proxy keep their profile until it hits a captcha, a new one is then
+    picked at random weighted by how fast each profile got through on that site.
+    """
+    site = domain_scheduler.get_domain(product_url) if product_url else None
+    with _lock:
+        profile_id = _sessions.get((site, proxy))
+        if not profile_id:
+            ids = list(PROFILES)
+            weights = [_score(_outcomes.get((profile_id, site), ())) + 0.01 for profile_id in ids]
+            profile_id = _sessions[(site, proxy)] = random.choices(ids, weights=weights)[0]
+    return PROFILES[profile_id]
+
+
+def report(profile_id, proxy, product_url, duration, blocked):
+    """Record a fetch made with a profile; a captcha unpins the profile from its session."""
+    if not profile_id:
+        return
+    site = domain_scheduler.get_domain(product_url)
+    with _lock:
+        _outcomes.setdefault((profile_id, site), deque(maxlen=SCORE_WINDOW)).append((blocked, duration))
+        if blocked and _sessions.get((site, proxy)) == profile_id:
+            del _sessions[(site, proxy)]
+
+
+def get_stats():
+    """Per site and profile: score, fetches, captcha rate and mean clean fetch time."""
+    stats = {}
+    with _lock:
+        for (profile_id, site), outcomes in _outcomes.items():
+            clean = [duration for blocked, duration in outcomes if not blocked]
+            stats.setdefault(site or "default", {})[profile_id] = {
+                "score": round(_score(outcomes), 3),
+                "fetches": len(outcomes),
+                "captcha_rate": round(1 - len(clean) / len(outcomes), 3),
+                "duration": round(sum(clean) / len(clean), 2) if clean else None,
+            }
+    return stats
@@ -2,13 +2,17 @@ from pydantic.v1 import BaseModel, Field
 from typing import List, Dict, Optional
 from enum import Enum
 import base64
+import asyncio
 import requests
 from langchain_core.output_parsers import JsonOutputParser
 from langchain.chains import TransformChain
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import HumanMessage
-from langchain_core.runnables import chain
+from langchain_core.runnables import RunnableLambda
 from dotenv import load_dotenv
+from prompt_compiler import CompactJsonOutputParser
+import model_router
+import metrics
+import tracing
+import proxy_pool
 
 
 # Load environment variables
@@ -20,7 +24,8 @@ def load_images(image_urls: List[str]) -> List[Optional[str]]:
     images_base64 = []
     for image_url in image_urls:
         try:
-            response = requests.get(image_url)
+            with tracing.span("image_download", url=image_url):
+                response = requests.get(image_url)
             image_base64 = base64.b64encode(response.content).decode('utf-8')
             images_base64.append(image_base64)
         except Exception as e:
@@ -30,45 +35,64 @@ def load_images(image_urls: List[str]) -> List[Optional[str]]:
     return images_base64
 
 
+async def _aload_image(image_url):
+    try:
+        with tracing.span("image_download", url=image_url):
+            response = await proxy_pool.get_async_client().get(image_url)
+        return base64.b64encode(response.content).decode('utf-8')
+    except Exception as e:
+        print(
+            f"Error fetching or encoding the image from {image_url}: {e}")
+        return None
+
+
+async def aload_images(image_urls: List[str]) -> List[Optional[str]]:
+    """load_images() for coroutines, downloading the images concurrently."""
+    return list(await asyncio.gather(*[_aload_image(image_url) for image_url in image_urls]))
+
+
+async def _atransform(inputs):
+    return {"images": await aload_images(inputs['image_urls'])}
+
+
 load_image_chain = TransformChain(
     input_variables=['image_urls'],
     output_variables=["images"],
-    transform=lambda inputs: {"images": load_images(inputs['image_urls'])}
+    transform=lambda inputs: {"images": load_images(inputs['image_urls'])},
+    atransform=_atransform
 )
 
 
-@chain
-def image_model(inputs: dict, parser: JsonOutputParser):
-    """Invoke model with images and prompt."""
-    model = ChatOpenAI(temperature=0.5, model="gpt-4o", max_tokens=1024)
+def _model_request(inputs: dict, parser: JsonOutputParser):
     image_urls = inputs.get("images", [])
+    content = [
+        {"type": "text", "text": inputs["prompt"]},
+        {"type": "text", "text": parser.get_format_instructions()},
+        *[
+            {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{img}"}} for img in image_urls if img
+        ],
+    ]
+    return content, {"template_id": inputs.get("template_id"), "language": inputs.get("language"),
+                     "images": image_urls}
 
-    msg = model.invoke(
-        [
-            HumanMessage(
-                content=[
-                    {"type": "text", "text": inputs["prompt"]},
-                    {"type": "text", "text": parser.get_format_instructions()},
-                    *[
-                        {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{img}"}} for img in image_urls if img
-                    ],
-                ]
-            )
-        ]
-    )
-    return msg.content
 
+def invoke_model(inputs: dict, parser: JsonOutputParser):
+    """Invoke model with images and prompt."""
+    content, options = _model_request(inputs, parser)
+    return model_router.invoke("product", content, **options).content
 
-def get_product(
-    image_urls: Optional[List[str]],
-    tone: str,
-    lang: str,
-    existingTitle: str,
-    description: str,
-    Product
-) -> dict:
-    parser = JsonOutputParser(pydantic_object=Product)
-    """Generate product details based on inputs."""
+
+async def ainvoke_model(inputs: dict, parser: JsonOutputParser):
+    content, options = _model_request(inputs, parser)
+    return (await model_router.ainvoke("product", content, **options)).content
+
+
+# chain.ainvoke() runs the async versions of the steps
+image_model = RunnableLambda(invoke_model, afunc=ainvoke_model, name="image_model")
+
+
+def _build_chain(image_urls, tone, lang, existingTitle, description, Product, template_id):
+    parser = CompactJsonOutputParser(pydantic_object=Product)
 
     prompt = f"""
         Given the images of a product, rewrite the product details in {lang} Language:
@@ -85,7 +109,40 @@ def get_product(
         | image_model.bind(parser=parser)  # Pass the parser correctly
         | parser
     )
-    return generate_product_chain.invoke({
+    return generate_product_chain, {
         'image_urls': image_urls if image_urls else [],
-        'prompt': prompt
-    })
+        'prompt': prompt,
+        'template_id': template_id,
+        'language': lang
+    }
+
+
+@metrics.timed("get_product")
+def get_product(
+    image_urls: Optional[List[str]],
+    tone: str,
+    lang: str,
+    existingTitle: str,
+    description: str,
+    Product,
+    template_id=None
+) -> dict:
+    """Generate product details based on inputs."""
+    generate_product_chain, inputs = _build_chain(image_urls, tone, lang, existingTitle, description, Product,
+                                                  template_id)
+    return generate_product_chain.invoke(inputs)
+
+
+@metrics.timed("get_product")
+async def aget_product(
+    image_urls: Optional[List[str]],
+    tone: str,
+    lang: str,
+    existingTitle: str,
+    description: str,
+    Product,
+    template_id=None
+) -> dict:
+    generate_product_chain, inputs = _build_chain(image_urls, tone, lang, existingTitle, description, Product,
+                                                  template_id)
+    return await generate_product_chain.ainvoke(inputs)
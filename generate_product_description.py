@@ -1,10 +1,13 @@
 from langchain_core.output_parsers import JsonOutputParser
 from langchain.chains import TransformChain
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import HumanMessage
 import base64
-from langchain_core.runnables import chain
+from langchain_core.runnables import RunnableLambda
 from dotenv import load_dotenv
+from prompt_compiler import CompactJsonOutputParser
+import model_router
+import metrics
+import tracing
+import proxy_pool
 import requests
 
 load_dotenv()
@@ -13,7 +16,21 @@ load_dotenv()
 def load_image(inputs: dict) -> dict:
     try:
         image_file = inputs["image_path"]
-        response = requests.get(image_file)
+        with tracing.span("image_download", url=image_file):
+            response = requests.get(image_file)
+        image_base64 = base64.b64encode(response.content).decode('utf-8')
+        return {"image": image_base64}
+
+    except Exception as e:
+        print(f"Error fetching or encoding the image: {e}")
+        return None
+
+
+async def aload_image(inputs: dict) -> dict:
+    try:
+        image_file = inputs["image_path"]
+        with tracing.span("image_download", url=image_file):
+            response = await proxy_pool.get_async_client().get(image_file)
         image_base64 = base64.b64encode(response.content).decode('utf-8')
         return {"image": image_base64}
 
@@ -25,29 +42,39 @@ def load_image(inputs: dict) -> dict:
 load_image_chain = TransformChain(
     input_variables=['image_path'],
     output_variables=["image"],
-    transform=load_image
+    transform=load_image,
+    atransform=aload_image
 )
 
 
-@chain
-def image_model(inputs: dict, parser: JsonOutputParser):
+def _model_request(inputs: dict, parser: JsonOutputParser):
+    content = [
+        {"type": "text", "text": inputs["prompt"]},
+        {"type": "text", "text": parser.get_format_instructions()},
+        {"type": "image_url",
+         "image_url": {"url": f"data:image/jpeg;base64,{inputs['image']}"}},
+    ]
+    return content, {"template_id": inputs.get("template_id"), "language": inputs.get("language"),
+                     "images": [inputs['image']]}
+
+
+def invoke_model(inputs: dict, parser: JsonOutputParser):
     """Invoke model with image and prompt."""
-    model = ChatOpenAI(temperature=0.5, model="gpt-4o", max_tokens=1024)
-    msg = model.invoke(
-        [
-            HumanMessage(
-                content=[
-                    {"type": "text", "text": inputs["prompt"]},
-                    {"type": "text", "text": parser.get_format_instructions()},
-                    {"type": "image_url",
-                     "image_url": {"url": f"data:image/jpeg;base64,{inputs['image']}"}},
-                ])]
-    )
-    return msg.content
-
-
-def get_product_description(image_path: str, customPrompt: str, tone: str, lang: str, Description) -> dict:
-    parser = JsonOutputParser(pydantic_object=Description)
+    content, options = _model_request(inputs, parser)
+    return model_router.invoke("description", content, **options).content
+
+
+async def ainvoke_model(inputs: dict, parser: JsonOutputParser):
+    content, options = _model_request(inputs, parser)
+    return (await model_router.ainvoke("description", content, **options)).content
+
+
+# chain.ainvoke() runs the async versions of the steps
+image_model = RunnableLambda(invoke_model, afunc=ainvoke_model, name="image_model")
+
+
+def _build_chain(image_path, customPrompt, tone, lang, Description, template_id):
+    parser = CompactJsonOutputParser(pydantic_object=Description)
     prompt = f"""
       Given the image of a product, provide the following information in {lang} Language:
       - Product Hook
@@ -57,4 +84,17 @@ def get_product_description(image_path: str, customPrompt: str, tone: str, lang:
       """
     generate_product_chain = load_image_chain | image_model.bind(
         parser=parser) | parser
-    return generate_product_chain.invoke({'image_path': image_path, 'prompt': prompt})
+    return generate_product_chain, {'image_path': image_path, 'prompt': prompt,
+                                    'template_id': template_id, 'language': lang}
+
+
+@metrics.timed("get_product_description")
+def get_product_description(image_path: str, customPrompt: str, tone: str, lang: str, Description, template_id=None) -> dict:
+    generate_product_chain, inputs = _build_chain(image_path, customPrompt, tone, lang, Description, template_id)
+    return generate_product_chain.invoke(inputs)
+
+
+@metrics.timed("get_product_description")
+async def aget_product_description(image_path: str, customPrompt: str, tone: str, lang: str, Description, template_id=None) -> dict:
+    generate_product_chain, inputs = _build_chain(image_path, customPrompt, tone, lang, Description, template_id)
+    return await generate_product_chain.ainvoke(inputs)
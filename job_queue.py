@@ -0,0 +1,252 @@
+import os
+import json
+import time
+import uuid
+import signal
+import sqlite3
+import traceback
+import multiprocessing
+from datetime import datetime
+from dotenv import load_dotenv
+import tracing
+import memory_monitor
+
+load_dotenv()
+
+JOBS_DB_PATH = os.getenv('JOBS_DB_PATH', 'jobs.sqlite3')
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 2))
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', 1))
+# A job is given up after this many attempts (a worker dying mid-job counts as one)
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 3))
+# Seconds stop_workers() lets running jobs finish before killing the workers
+JOB_DRAIN_TIMEOUT = float(os.getenv('JOB_DRAIN_TIMEOUT', 300))
+
+_workers = []
+
+
+def get_connection():
+    connection = sqlite3.connect(JOBS_DB_PATH, timeout=30, isolation_level=None)
+    connection.row_factory = sqlite3.Row
+    connection.execute("PRAGMA journal_mode=WAL")
+    return connection
+
+
+def init_db():
+    connection = get_connection()
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            progress TEXT NOT NULL DEFAULT '{}',
+            result TEXT,
+            error TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            worker_pid INTEGER,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+    """)
+    connection.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+    connection.close()
+
+
+def _now():
+    return datetime.now().isoformat()
+
+
+def enqueue(payload):
+    """Store a job for the workers and return its id."""
+    init_db()
+    job_id = uuid.uuid4().hex
+    connection = get_connection()
+    connection.execute(
+        "INSERT INTO jobs (id, status, payload, created_at, updated_at) VALUES (?, 'queued', ?, ?, ?)",
+        (job_id, json.dumps(payload), _now(), _now())
+    )
+    connection.close()
+    return job_id
+
+
+def claim(connection):
+    """Atomically move the oldest queued job to running and return it, or None."""
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        row = connection.execute(
+            "SELECT id, payload FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+        ).fetchone()
+        if row:
+            connection.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, worker_pid = ?, updated_at = ? WHERE id = ?",
+                (os.getpid(), _now(), row['id'])
+            )
+        connection.execute("COMMIT")
+    except Exception:
+        connection.execute("ROLLBACK")
+        raise
+    return (row['id'], json.loads(row['payload'])) if row else None
+
+
+def set_progress(connection, job_id, stage, status):
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        row = connection.execute("SELECT progress FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        progress = json.loads(row['progress']) if row else {}
+        progress[stage] = status
+        connection.execute(
+            "UPDATE jobs SET progress = ?, updated_at = ? WHERE id = ?",
+            (json.dumps(progress), _now(), job_id)
+        )
+        connection.execute("COMMIT")
+    except Exception:
+        connection.execute("ROLLBACK")
+        raise
+
+
+def finish(connection, job_id, result=None, error=None):
+    connection.execute(
+        "UPDATE jobs SET status = ?, result = ?, error = ?, worker_pid = NULL, updated_at = ? WHERE id = ?",
+        ('failed' if error else 'done', json.dumps(result) if result is not None else None, error, _now(), job_id)
+    )
+
+
+def _is_alive(pid):
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    # a crashed child the supervisor has not joined yet
+    stat = f"/proc/{pid}/stat"
+    if os.path.exists(stat):
+        with open(stat) as f:
+            return f.read().rpartition(")")[2].split()[0] != "Z"
+    return True
+
+
+def requeue_interrupted():
+    """Put jobs whose worker process is gone back in the queue, or fail them past JOB_MAX_ATTEMPTS.
+
+    Jobs of live workers (this service's or another one's on the same machine) are left alone.
+    """
+    init_db()
+    connection = get_connection()
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        rows = connection.execute("SELECT id, attempts, worker_pid FROM jobs WHERE status = 'running'").fetchall()
+        orphaned = [row for row in rows if not _is_alive(row['worker_pid'])]
+        for row in orphaned:
+            if row['attempts'] >= JOB_MAX_ATTEMPTS:
+                connection.execute(
+                    "UPDATE jobs SET status = 'failed', error = 'Too many attempts', worker_pid = NULL, updated_at = ? "
+                    "WHERE id = ?",
+                    (_now(), row['id'])
+                )
+            else:
+                connection.execute(
+                    "UPDATE jobs SET status = 'queued', worker_pid = NULL, updated_at = ? WHERE id = ?",
+                    (_now(), row['id'])
+                )
+        connection.execute("COMMIT")
+    except Exception:
+        connection.execute("ROLLBACK")
+        raise
+    finally:
+        connection.close()
+    return sum(1 for row in orphaned if row['attempts'] < JOB_MAX_ATTEMPTS)
+
+
+def get_job(job_id):
+    init_db()
+    connection = get_connection()
+    row = connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    connection.close()
+    if not row:
+        return None
+    return {
+        "id": row['id'],
+        "status": row['status'],
+        "progress": json.loads(row['progress']),
+        "result": json.loads(row['result']) if row['result'] else None,
+        "error": row['error'],
+        "attempts": row['attempts'],
+        "created_at": row['created_at'],
+        "updated_at": row['updated_at'],
+    }
+
+
+def worker_loop(handler, initializer=None):
+    """Claim and run jobs until SIGTERM, which lets the running job finish first.
+
+    handler(payload, progress) returns the job result; initializer() sets up the worker process.
+    """
+    if initializer:
+        initializer()
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+    connection = get_connection()
+    while not stopping:
+        job = claim(connection)
+        if not job:
+            time.sleep(JOB_POLL_INTERVAL)
+            continue
+
+        job_id, payload = job
+        try:
+            # continue the trace of the request that queued the job
+            with tracing.span("job", payload.pop('traceparent', None), job_id=job_id):
+                result = handler(payload, lambda stage, status: set_progress(connection, job_id, stage, status))
+            finish(connection, job_id, result=result)
+        except Exception as e:
+            traceback.print_exc()
+            finish(connection, job_id, error=str(e))
+
+    # worker processes exit without running atexit handlers
+    memory_monitor.quit_drivers()
+    tracing.flush()
+
+
+def start_workers(handler, count=JOB_WORKERS, initializer=None):
+    """Start the worker processes, after requeueing jobs a previous run did not finish.
+
+    initializer() runs first in every worker, e.g. app.create_app for its own background threads.
+    """
+    if _workers:
+        return _workers
+    requeued = requeue_interrupted()
+    if requeued:
+        print(f"Requeued {requeued} interrupted jobs")
+
+    for _ in range(count):
+        start_worker(handler, initializer)
+    return _workers
+
+
+def start_worker(handler, initializer=None):
+    """Start one more worker process, e.g. in place of one that died."""
+    process = multiprocessing.Process(target=worker_loop, args=(handler, initializer), daemon=True)
+    process.start()
+    process.started_at = time.time()
+    _workers.append(process)
+    return process
+
+
+def stop_workers(timeout=JOB_DRAIN_TIMEOUT):
+    """Ask the workers to stop after their running job and wait for them.
+
+    Workers still busy after `timeout` are killed and their jobs requeued.
+    """
+    for process in _workers:
+        process.terminate()
+    deadline = time.time() + timeout
+    for process in _workers:
+        process.join(max(0, deadline - time.time()))
+        if process.is_alive():
+            print(f"Killing job worker {process.pid} after {timeout}s")
+            process.kill()
+            process.join()
+    _workers.clear()
+    requeue_interrupted()
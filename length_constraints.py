@@ -0,0 +1,172 @@
+import os
+import re
+from typing import get_type_hints, get_args, get_origin
+from pydantic.v1 import BaseModel
+from dotenv import load_dotenv
+from prompt_compiler import get_length_hint
+import schema_repair
+
+load_dotenv()
+
+# Copy may be this much shorter than the lower bound before it is sent back for regeneration
+LENGTH_TOLERANCE = float(os.getenv('LENGTH_TOLERANCE', 0.1))
+
+WORDS_RE = re.compile(r'(\d+)\s*-\s*(\d+)\s*words')
+CHARACTERS_RE = re.compile(r'(\d+)\s*-\s*(\d+)\s*characters')
+SENTENCE_END_RE = re.compile(r'[.!?](?=\s|$)')
+BULLET_PREFIX_RE = re.compile(r'^\s*(?:[-*•]|\d+[.)])\s+')
+TRAILING_PUNCTUATION = " ,;:-–—"
+
+_tables = {}
+
+
+def parse_budget(description):
+    """Parse "(3-5 words, 20-25 characters)" into {"words": (3, 5), "characters": (20, 25)}."""
+    hint = get_length_hint(description)
+    if not hint:
+        return None
+    budget = {}
+    words = WORDS_RE.search(hint)
+    if words:
+        budget["words"] = (int(words.group(1)), int(words.group(2)))
+    characters = CHARACTERS_RE.search(hint)
+    if characters:
+        budget["characters"] = (int(characters.group(1)), int(characters.group(2)))
+    return budget or None
+
+
+def _collect(schema_class, prefix, table):
+    hints = get_type_hints(schema_class)
+    for name, field in schema_class.__fields__.items():
+        path = f"{prefix}{name}"
+        budget = parse_budget(field.field_info.description)
+        if budget:
+            table[path] = budget
+
+        # nested template models, e.g. features: List[ProductFeature]
+        declared = hints.get(name)
+        for arg in (declared, *get_args(declared)):
+            if isinstance(arg, type) and issubclass(arg, BaseModel):
+                _collect(arg, f"{path}[]." if get_origin(declared) is list else f"{path}.", table)
+
+
+def get_constraints(schema_class):
+    """Return the length budgets of a template class, parsed once from its Field descriptions.
+
+    Keys are field paths: "title", "bullet_points", "features[].description".
+    """
+    if schema_class not in _tables:
+        table = {}
+        _collect(schema_class, "", table)
+        _tables[schema_class] = table
+    return _tables[schema_class]
+
+
+def truncate(text, max_chars, min_chars=0):
+    """Shorten text to max_chars, at a sentence end if that keeps min_chars, otherwise at a word boundary."""
+    if len(text) <= max_chars:
+        return text
+
+    head = text[:max_chars + 1]
+    sentence_ends = [m.end() for m in SENTENCE_END_RE.finditer(head)]
+    if sentence_ends and sentence_ends[-1] >= min_chars:
+        return head[:sentence_ends[-1]].strip()
+
+    cut = head.rfind(" ")
+    head = head[:cut] if cut > 0 else text[:max_chars]
+    return head.rstrip(TRAILING_PUNCTUATION)
+
+
+def _get_unit(budget):
+    # character budgets win over word budgets, they are what the template layout depends on
+    return "characters" if "characters" in budget else "words"
+
+
+def _count(text, unit):
+    return len(text) if unit == "characters" else len(text.split())
+
+
+def check(text, budget):
+    """Return the problem of text against its budget, or None."""
+    unit = _get_unit(budget)
+    low, high = budget[unit]
+    count = _count(text, unit)
+    if count > high:
+        return f"{count} {unit}, at most {high} allowed"
+    if count < low * (1 - LENGTH_TOLERANCE):
+        return f"{count} {unit}, at least {low} needed"
+    return None
+
+
+def fix_text(text, budget, is_bullet=False):
+    """Apply local fixes to one string and return (text, problem left or None)."""
+    if is_bullet:
+        text = BULLET_PREFIX_RE.sub("", text)
+    text = text.strip()
+
+    unit = _get_unit(budget)
+    low, high = budget[unit]
+    if _count(text, unit) > high:
+        if unit == "characters":
+            text = truncate(text, high, int(low * (1 - LENGTH_TOLERANCE)))
+        else:
+            text = " ".join(text.split()[:high]).rstrip(TRAILING_PUNCTUATION)
+    return text, check(text, budget)
+
+
+def _fix_value(value, path, table, problems, is_bullet=False):
+    if isinstance(value, dict):
+        for key in value:
+            value[key] = _fix_value(value[key], f"{path}.{key}", table, problems)
+        return value
+
+    if isinstance(value, list):
+        # a budget on a list of strings applies to every item, e.g. bullet_points
+        if path in table:
+            return [_fix_value(item, path, table, problems, is_bullet=True) for item in value]
+        return [_fix_value(item, f"{path}[]", table, problems) for item in value]
+
+    if isinstance(value, str) and path in table:
+        value, problem = fix_text(value, table[path], is_bullet)
+        if problem:
+            problems.append(f"{path}: {problem}")
+    return value
+
+
+def fix(data, schema_class):
+    """Fix copy fields in place against the template budgets.
+
+    Returns (data, flagged) where flagged maps top-level fields that could not be fixed
+    locally (too short) to their problems.
+    """
+    flagged = {}
+    if not isinstance(data, dict):
+        return data, flagged
+
+    table = get_constraints(schema_class)
+    for name in schema_class.__fields__:
+        if name in data:
+            problems = []
+            data[name] = _fix_value(data[name], name, table, problems)
+            if problems:
+                flagged[name] = problems
+    return data, flagged
+
+
+def enforce(data, schema_class, context="", template_id=None, language=None):
+    """Fix copy lengths locally and regenerate only the fields that cannot be fixed."""
+    data, flagged = fix(data, schema_class)
+    if not flagged:
+        return data
+
+    for field_name, problems in flagged.items():
+        try:
+            data[field_name] = schema_repair.regenerate_field(
+                data, schema_class, field_name, problems, context, template_id, language)
+        except Exception as e:
+            print(f"Error regenerating field {field_name}: {e}")
+
+    data, flagged = fix(data, schema_class)
+    for field_name, problems in flagged.items():
+        print(f"Length constraints not met for {field_name}: {problems}")
+    return data
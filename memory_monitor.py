@@ -0,0 +1,310 @@
+import os
+import gc
+import sys
+import time
+import signal
+import argparse
+import threading
+import tracemalloc
+import weakref
+from datetime import datetime
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Start tracemalloc at import (costs CPU and memory on every allocation); otherwise it starts
+# with the first snapshot
+MEMORY_TRACEMALLOC = os.getenv('MEMORY_TRACEMALLOC', 'false').lower() in ('1', 'true', 'yes')
+MEMORY_TRACE_FRAMES = int(os.getenv('MEMORY_TRACE_FRAMES', 10))
+MEMORY_SNAPSHOT_DIR = os.getenv('MEMORY_SNAPSHOT_DIR', 'memory-snapshots')
+# Seconds between reaper runs, 0 disables the reaper
+REAPER_INTERVAL = float(os.getenv('REAPER_INTERVAL', 60))
+# Processes younger than this are left alone, get_driver may not have registered them yet
+REAPER_MIN_AGE = float(os.getenv('REAPER_MIN_AGE', 120))
+
+CHROME_NAMES = ('chrome', 'chromium', 'headless_shell')
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+# drivers returned by get_driver that have not been garbage collected
+_drivers = weakref.WeakSet()
+_lock = threading.Lock()
+_last_snapshot = None
+_reaped = 0
+_reaper_pid = None
+
+if MEMORY_TRACEMALLOC:
+    tracemalloc.start(MEMORY_TRACE_FRAMES)
+
+
+def track_driver(driver):
+    """Register a driver so the reaper leaves its chromedriver and Chrome processes alone."""
+    _drivers.add(driver)
+
+
+def _owned_pids():
+    """chromedriver pids of the live drivers of this process."""
+    pids = set()
+    for driver in list(_drivers):
+        process = getattr(getattr(driver, 'service', None), 'process', None)
+        if process is not None and process.poll() is None:
+            pids.add(process.pid)
+    return pids
+
+
+def _read(path):
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def list_processes():
+    """{pid: {"name", "ppid", "rss", "age", "uid"}} of every process, read from /proc (Linux only)."""
+    uptime = float((_read('/proc/uptime') or b'0').split()[0])
+    processes = {}
+    for entry in os.listdir('/proc') if os.path.isdir('/proc') else []:
+        if not entry.isdigit():
+            continue
+        stat = _read(f'/proc/{entry}/stat')
+        if not stat:
+            continue
+        # the name is in parentheses and may contain spaces
+        name, _, rest = stat.decode(errors='replace').partition(' (')[2].rpartition(') ')
+        fields = rest.split()
+        try:
+            uid = os.stat(f'/proc/{entry}').st_uid
+        except OSError:
+            continue
+        processes[int(entry)] = {
+            "name": name,
+            "ppid": int(fields[1]),
+            "age": uptime - int(fields[19]) / CLOCK_TICKS,
+            "rss": int(fields[21]) * PAGE_SIZE,
+            "uid": uid,
+        }
+    return processes
+
+
+def _is_chrome(process):
+    return process["name"].lower().startswith(CHROME_NAMES)
+
+
+def _descendants(processes, pid):
+    children = {}
+    for child, process in processes.items():
+        children.setdefault(process["ppid"], []).append(child)
+    found = []
+    stack = list(children.get(pid, []))
+    while stack:
+        child = stack.pop()
+        found.append(child)
+        stack.extend(children.get(child, []))
+    return found
+
+
+def _is_automation(pid):
+    # Chrome started by chromedriver, not someone's desktop browser
+    cmdline = _read(f'/proc/{pid}/cmdline') or b''
+    return b'--test-type=webdriver' in cmdline or b'--remote-debugging-port' in cmdline
+
+
+def find_orphans(processes=None):
+    """Chrome / chromedriver processes no live driver owns, as [(pid, name)].
+
+    Those are the chromedriver children of this process whose driver was dropped without
+    quit() (not those of its child worker processes), and automation Chromes or chromedrivers of this user left behind by a dead worker
+    (re-parented to init).
+    """
+    processes = processes if processes is not None else list_processes()
+    owned = set()
+    for pid in _owned_pids():
+        owned.add(pid)
+        owned.update(_descendants(processes, pid))
+
+    orphans = []
+    # only direct children: chromedrivers under a forked job worker belong to that worker's drivers
+    for pid, process in processes.items():
+        if (process["ppid"] == os.getpid() and process["name"].startswith("chromedriver") and pid not in owned
+                and process["age"] > REAPER_MIN_AGE):
+            orphans.append((pid, process["name"]))
+    for pid, process in processes.items():
+        if (process["ppid"] == 1 and _is_chrome(process) and process["uid"] == os.getuid()
+                and process["age"] > REAPER_MIN_AGE and pid not in owned
+                and (process["name"].startswith("chromedriver") or _is_automation(pid))):
+            orphans.append((pid, process["name"]))
+    return orphans
+
+
+def reap(dry_run=False):
+    """Kill the orphaned Chrome process trees; returns the killed [(pid, name)]."""
+    global _reaped
+    processes = list_processes()
+    orphans = find_orphans(processes)
+    killed = []
+    for pid, name in orphans:
+        for target in [*_descendants(processes, pid), pid]:
+            if dry_run:
+                killed.append((target, processes[target]["name"]))
+                continue
+            try:
+                os.kill(target, signal.SIGKILL)
+                killed.append((target, processes[target]["name"]))
+            except OSError:
+                pass
+    if killed and not dry_run:
+        with _lock:
+            _reaped += len(killed)
+        print(f"Reaped {len(killed)} orphaned Chrome processes: {', '.join(f'{name}:{pid}' for pid, name in killed)}")
+    return killed
+
+
+def quit_drivers():
+    """Quit every live driver, then kill the Chrome processes still under this process (shutdown)."""
+    for driver in list(_drivers):
+        try:
+            driver.quit()
+        except Exception as e:
+            print(f"Error quitting driver: {e}")
+    processes = list_processes()
+    for pid in _descendants(processes, os.getpid()):
+        if _is_chrome(processes[pid]):
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except OSError:
+                pass
+
+
+def _reaper_loop(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            reap()
+        except Exception as e:
+            print(f"Error reaping Chrome processes: {e}")
+
+
+def start_reaper(interval=REAPER_INTERVAL):
+    """Start the background reaper unless REAPER_INTERVAL is 0."""
+    global _reaper_pid
+    # one per process: a forked worker does not inherit the parent's thread
+    if not interval or _reaper_pid == os.getpid() or not os.path.isdir('/proc'):
+        return None
+    _reaper_pid = os.getpid()
+    reaper_thread = threading.Thread(target=_reaper_loop, args=(interval,), daemon=True)
+    reaper_thread.start()
+    return reaper_thread
+
+
+def _mb(size):
+    return round(size / 1024 / 1024, 1)
+
+
+def _peak_rss():
+    try:
+        import resource
+    except ImportError:
+        return None
+    # kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _format_stats(stats, limit):
+    return [{
+        "location": "; ".join(f"{os.path.basename(frame.filename)}:{frame.lineno}" for frame in stat.traceback[:3]),
+        "size_kb": round(stat.size / 1024, 1),
+        "count": stat.count,
+        **({"size_diff_kb": round(stat.size_diff / 1024, 1), "count_diff": stat.count_diff}
+           if hasattr(stat, "size_diff") else {}),
+    } for stat in stats[:limit]]
+
+
+def get_stats(top=10):
+    """Process RSS, the Chrome processes under this worker and the tracemalloc top allocations."""
+    processes = list_processes()
+    me = processes.get(os.getpid(), {})
+    chrome = [pid for pid in _descendants(processes, os.getpid()) if _is_chrome(processes[pid])]
+    stats = {
+        "pid": os.getpid(),
+        "rss_mb": _mb(me.get("rss", 0)),
+        "peak_rss_mb": _mb(_peak_rss() or 0),
+        "threads": threading.active_count(),
+        "gc_counts": gc.get_count(),
+        "drivers": len(_owned_pids()),
+        # shared pages are counted once per process, so this overstates the Chrome total
+        "chrome": {
+            "processes": len(chrome),
+            "rss_mb": _mb(sum(processes[pid]["rss"] for pid in chrome)),
+            "orphaned": len(find_orphans(processes)),
+            "reaped": _reaped,
+        },
+        "tracemalloc": {"tracing": tracemalloc.is_tracing()},
+    }
+    if tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        stats["tracemalloc"].update({
+            "current_mb": _mb(current),
+            "peak_mb": _mb(peak),
+            "top": _format_stats(tracemalloc.take_snapshot().statistics("lineno"), top),
+        })
+    return stats
+
+
+def take_snapshot(top=20):
+    """Dump a tracemalloc snapshot to MEMORY_SNAPSHOT_DIR and diff it with the previous one.
+
+    Starts tracemalloc on first use, so the first snapshot is only the baseline.
+    """
+    global _last_snapshot
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(MEMORY_TRACE_FRAMES)
+    snapshot = tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+    ])
+    os.makedirs(MEMORY_SNAPSHOT_DIR, exist_ok=True)
+    path = os.path.join(MEMORY_SNAPSHOT_DIR, f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{os.getpid()}.snapshot")
+    snapshot.dump(path)
+
+    with _lock:
+        previous, _last_snapshot = _last_snapshot, snapshot
+    result = {"snapshot": path, "total_mb": _mb(sum(stat.size for stat in snapshot.statistics("filename")))}
+    if previous is not None:
+        result["diff"] = _format_stats(snapshot.compare_to(previous, "lineno"), top)
+    else:
+        result["top"] = _format_stats(snapshot.statistics("lineno"), top)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory diagnostics.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    diff_parser = subparsers.add_parser("diff", help="compare two saved snapshots")
+    diff_parser.add_argument("old")
+    diff_parser.add_argument("new")
+    diff_parser.add_argument("-n", type=int, default=20)
+    diff_parser.add_argument("--traceback", action="store_true", help="group by full traceback")
+    reap_parser = subparsers.add_parser("reap", help="kill orphaned automation Chromes of this user")
+    reap_parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    if args.command == "diff":
+        old = tracemalloc.Snapshot.load(args.old)
+        new = tracemalloc.Snapshot.load(args.new)
+        for stat in new.compare_to(old, "traceback" if args.traceback else "lineno")[:args.n]:
+            print(stat)
+            if args.traceback:
+                for line in stat.traceback.format():
+                    print(f"    {line}")
+        return 0
+
+    if args.command == "reap":
+        killed = reap(dry_run=args.dry_run)
+        for pid, name in killed:
+            print(f"{'would kill' if args.dry_run else 'killed'} {name} {pid}")
+        return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,172 @@
+import time
+import inspect
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager
+import tracing
+
+# Histogram buckets in seconds: from image downloads up to full generations
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+PREFIX = "scraper_"
+
+HELP = {
+    "stage_duration_seconds": "Duration of an instrumented pipeline stage.",
+    "stage_calls_total": "Calls of an instrumented pipeline stage by outcome.",
+    "http_request_duration_seconds": "Duration of HTTP requests to the API.",
+    "admission_wait_seconds": "Time spent waiting for an admission slot.",
+    "admission_rejected_total": "Requests turned away by admission control.",
+    "domain_rate": "Requests per second currently allowed to a domain.",
+    "domain_max_rate": "Requests per second a domain is allowed at most.",
+    "domain_observed_rate": "Requests per second started to a domain over the last minute.",
+    "domain_concurrency": "Requests allowed in flight to a domain.",
+    "domain_in_flight": "Requests in flight to a domain.",
+    "domain_block_rate": "Share of recent requests to a domain that were blocked.",
+}
+
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+# functions returning [(name, labels, value)] of the gauges read at render time
+_collectors = []
+# store / template of the request the current thread is working on
+_labels = contextvars.ContextVar("metrics_labels", default={})
+
+
+def set_labels(**labels):
+    """Labels (store, template) added to every measurement of the current request."""
+    _labels.set({key: str(value) for key, value in labels.items() if value is not None})
+
+
+def get_labels():
+    return dict(_labels.get())
+
+
+def observe(name, value, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        histogram = _histograms.get(key)
+        if not histogram:
+            histogram = _histograms[key] = {"buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0}
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                histogram["buckets"][i] += 1
+        histogram["sum"] += value
+        histogram["count"] += 1
+
+
+def inc(name, amount=1, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def add_collector(collect):
+    """Export the gauges collect() returns as [(name, labels dict, value)] on every render()."""
+    _collectors.append(collect)
+
+
+def _status(result):
+    # fetchers report failures as {"success": 0, ...} rather than raising
+    if isinstance(result, dict) and "success" in result and not result["success"]:
+        return "failed"
+    return "ok"
+
+
+class _Timer:
+    def __init__(self):
+        self.result = None
+
+
+@contextmanager
+def timer(stage, **labels):
+    """Time a block as `stage` (also traced as a span); set .result on the yielded object to count failed fetches."""
+    labels = {"store": "", "template": "", **get_labels(), **labels}
+    current = _Timer()
+    trace_span, token = tracing.start(stage, **labels)
+    start = time.perf_counter()
+    status = "error"
+    error = None
+    try:
+        yield current
+        status = _status(current.result)
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        labels = {**labels, "stage": stage, "status": status}
+        observe("stage_duration_seconds", time.perf_counter() - start, **labels)
+        inc("stage_calls_total", **labels)
+        trace_span.set(status=status)
+        tracing.finish(trace_span, token, error)
+
+
+def timed(stage, **labels):
+    """Decorator form of timer(), for functions and coroutine functions."""
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with timer(stage, **labels) as current:
+                    current.result = await fn(*args, **kwargs)
+                    return current.result
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timer(stage, **labels) as current:
+                current.result = fn(*args, **kwargs)
+                return current.result
+        return wrapper
+    return decorator
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=()):
+    items = [*labels, *extra]
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in items) + "}"
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    with _lock:
+        histograms = {key: {**value, "buckets": list(value["buckets"])} for key, value in _histograms.items()}
+        counters = dict(_counters)
+
+    lines = []
+    described = set()
+    for (name, labels), histogram in sorted(histograms.items()):
+        full_name = PREFIX + name
+        if name not in described:
+            described.add(name)
+            lines.append(f"# HELP {full_name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {full_name} histogram")
+        for bound, count in zip(BUCKETS, histogram["buckets"]):
+            lines.append(f"{full_name}_bucket{_format_labels(labels, [('le', bound)])} {count}")
+        lines.append(f"{full_name}_bucket{_format_labels(labels, [('le', '+Inf')])} {histogram['count']}")
+        lines.append(f"{full_name}_sum{_format_labels(labels)} {histogram['sum']:.6f}")
+        lines.append(f"{full_name}_count{_format_labels(labels)} {histogram['count']}")
+
+    for (name, labels), value in sorted(counters.items()):
+        full_name = PREFIX + name
+        if name not in described:
+            described.add(name)
+            lines.append(f"# HELP {full_name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {full_name} counter")
+        lines.append(f"{full_name}{_format_labels(labels)} {value}")
+
+    gauges = sorted((name, tuple(sorted(labels.items())), value)
+                    for collect in _collectors for name, labels, value in collect())
+    for name, labels, value in gauges:
+        full_name = PREFIX + name
+        if name not in described:
+            described.add(name)
+            lines.append(f"# HELP {full_name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {full_name} gauge")
+        lines.append(f"{full_name}{_format_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
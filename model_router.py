@@ -0,0 +1,157 @@
+import os
+import json
+import time
+import threading
+from langchain_openai import ChatOpenAI
+from langchain_core.messages import HumanMessage
+from dotenv import load_dotenv
+import usage_tracker
+import tracing
+import admission
+
+load_dotenv()
+
+# Model settings per generation stage. "models" is the fallback chain, tried in order when a
+# model errors or times out.
+DEFAULT_ROUTES = {
+    "product": {"models": ["gpt-4o", "gpt-4o-mini"], "max_tokens": 1024, "temperature": 0.5, "detail": "auto", "timeout": 90},
+    "description": {"models": ["gpt-4o-mini", "gpt-4o"], "max_tokens": 400, "temperature": 0.5, "detail": "low", "timeout": 30},
+    "review": {"models": ["gpt-4o-mini", "gpt-4o"], "max_tokens": 400, "temperature": 0.5, "detail": "low", "timeout": 30},
+    "repair": {"models": ["gpt-4o-mini", "gpt-4o"], "max_tokens": 1024, "temperature": 0.3, "timeout": 30},
+    "blog": {"models": ["gpt-4o", "gpt-4o-mini"], "max_tokens": 1024, "temperature": 0.6, "timeout": 90},
+}
+
+# Overrides as JSON keyed by "stage" or "stage:template_id", e.g.
+# MODEL_ROUTES='{"review": {"models": ["gpt-4o"]}, "product:5": {"max_tokens": 1500}}'
+ENV_ROUTES = json.loads(os.getenv('MODEL_ROUTES', '{}'))
+
+_lock = threading.Lock()
+_template_routes = {}
+_stats = {}
+
+
+def set_template_routes(template_id, routes):
+    """Register the per-stage overrides stored in a template's template_schema ("routes" key)."""
+    with _lock:
+        _template_routes[str(template_id)] = routes or {}
+
+
+def get_route(stage, template_id=None):
+    """Resolve the settings for a stage: defaults, then MODEL_ROUTES, then the template's own routes."""
+    route = dict(DEFAULT_ROUTES.get(stage, DEFAULT_ROUTES["product"]))
+    route.update(ENV_ROUTES.get(stage, {}))
+    if template_id is not None:
+        route.update(ENV_ROUTES.get(f"{stage}:{template_id}", {}))
+        with _lock:
+            route.update(_template_routes.get(str(template_id), {}).get(stage, {}))
+    return route
+
+
+def _with_detail(content, detail):
+    if not detail:
+        return content
+    return [
+        {**part, "image_url": {**part["image_url"], "detail": detail}} if part.get("type") == "image_url" else part
+        for part in content
+    ]
+
+
+def _record(stage, template_id, model_name, latency, cost=0.0, success=True, fallback=False):
+    key = (stage, str(template_id), model_name)
+    with _lock:
+        stats = _stats.setdefault(key, {"calls": 0, "errors": 0, "fallbacks": 0, "latency": 0.0, "cost": 0.0})
+        stats["calls"] += 1
+        stats["errors"] += 0 if success else 1
+        stats["fallbacks"] += 1 if fallback else 0
+        stats["latency"] += latency
+        stats["cost"] += cost
+
+
+def _get_model(route, model_name):
+    return ChatOpenAI(
+        model=model_name,
+        temperature=route["temperature"],
+        max_tokens=route["max_tokens"],
+        timeout=route.get("timeout"),
+        max_retries=0
+    )
+
+
+def _finish(llm_span, token, stage, template_id, model_name, start, fallback, msg=None, error=None):
+    """Close the span of one model attempt and record its latency and cost."""
+    if error is not None:
+        tracing.finish(llm_span, token, error)
+        _record(stage, template_id, model_name, time.time() - start, success=False, fallback=fallback)
+        print(f"Error from {model_name} on {stage}: {error}")
+        return
+    prompt_tokens, completion_tokens = usage_tracker.get_usage(msg)
+    llm_span.set(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+    tracing.finish(llm_span, token)
+    _record(stage, template_id, model_name, time.time() - start,
+            usage_tracker.get_cost(model_name, prompt_tokens, completion_tokens), fallback=fallback)
+
+
+def invoke(stage, content, template_id=None, language=None, images=None):
+    """Send one HumanMessage with the given content parts through the route of the stage.
+
+    Falls back to the next model of the route when a model errors or times out.
+    """
+    route = get_route(stage, template_id)
+    messages = [HumanMessage(content=_with_detail(content, route.get("detail")))]
+
+    # waits for a free call slot, or raises admission.Rejected for the API to answer 429
+    with admission.slot("llm"):
+        error = None
+        for i, model_name in enumerate(route["models"]):
+            start = time.time()
+            llm_span, token = tracing.start("llm", stage=stage, model=model_name, template=template_id,
+                                            images=len(images or []), fallback=i > 0)
+            try:
+                msg = usage_tracker.invoke(_get_model(route, model_name), messages, stage, template_id, language,
+                                           images, route.get("retries"))
+            except Exception as e:
+                _finish(llm_span, token, stage, template_id, model_name, start, i > 0, error=e)
+                error = e
+                continue
+            _finish(llm_span, token, stage, template_id, model_name, start, i > 0, msg=msg)
+            return msg
+
+        raise error
+
+
+async def ainvoke(stage, content, template_id=None, language=None, images=None):
+    """invoke() for coroutines: same routes, fallbacks and accounting, awaiting the model."""
+    route = get_route(stage, template_id)
+    messages = [HumanMessage(content=_with_detail(content, route.get("detail")))]
+
+    async with admission.aslot("llm"):
+        error = None
+        for i, model_name in enumerate(route["models"]):
+            start = time.time()
+            llm_span, token = tracing.start("llm", stage=stage, model=model_name, template=template_id,
+                                            images=len(images or []), fallback=i > 0)
+            try:
+                msg = await usage_tracker.ainvoke(_get_model(route, model_name), messages, stage, template_id,
+                                                  language, images, route.get("retries"))
+            except Exception as e:
+                _finish(llm_span, token, stage, template_id, model_name, start, i > 0, error=e)
+                error = e
+                continue
+            _finish(llm_span, token, stage, template_id, model_name, start, i > 0, msg=msg)
+            return msg
+
+        raise error
+
+
+def get_stats():
+    """Return latency and cost per route (stage, template, model) to tune the table."""
+    with _lock:
+        items = [(key, dict(stats)) for key, stats in _stats.items()]
+
+    stats = []
+    for (stage, template_id, model_name), totals in items:
+        totals["avg_latency"] = round(totals["latency"] / totals["calls"], 3)
+        totals["latency"] = round(totals["latency"], 3)
+        totals["cost"] = round(totals["cost"], 6)
+        stats.append({"stage": stage, "template_id": template_id, "model": model_name, **totals})
+    return stats
@@ -0,0 +1,162 @@
+import os
+import sys
+import time
+import zlib
+import sqlite3
+import argparse
+import importlib
+from concurrent.futures import ProcessPoolExecutor
+from dotenv import load_dotenv
+import canonical_url
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+load_dotenv()
+
+PAGE_ARCHIVE_PATH = os.getenv('PAGE_ARCHIVE_PATH', 'page_archive.sqlite3')
+PAGE_ARCHIVE_ENABLED = os.getenv('PAGE_ARCHIVE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+ZSTD_LEVEL = int(os.getenv('PAGE_ARCHIVE_ZSTD_LEVEL', 10))
+
+# Parser of each store: (module, function) taking the archived page body and its product URL
+PARSERS = {
+    "amazon": ("amazon", "parse_amazon_html"),
+    "aliexpress": ("aliexpress", "parse_aliexpress_html"),
+    "alibaba": ("alibaba", "parse_alibaba_html"),
+    "shopify": ("shopify", "parse_shopify_json"),
+}
+
+
+def get_connection():
+    connection = sqlite3.connect(PAGE_ARCHIVE_PATH, timeout=30, isolation_level=None)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS pages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_key TEXT NOT NULL,
+            store_name TEXT NOT NULL,
+            product_url TEXT NOT NULL,
+            fetched_at REAL NOT NULL,
+            codec TEXT NOT NULL,
+            body BLOB NOT NULL
+        )
+    """)
+    connection.execute("CREATE INDEX IF NOT EXISTS pages_product ON pages (product_key, fetched_at)")
+    return connection
+
+
+def compress(text):
+    """Return (codec, bytes); zstd when the zstandard package is installed, zlib otherwise."""
+    data = text.encode('utf-8')
+    if zstandard:
+        return "zstd", zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return "zlib", zlib.compress(data, 9)
+
+
+def decompress(codec, body):
+    if codec == "zstd":
+        return zstandard.ZstdDecompressor().decompress(body).decode('utf-8')
+    return zlib.decompress(body).decode('utf-8')
+
+
+def save(store_name, product_url, body):
+    """Archive a fetched page (HTML, or the Shopify JSON body). Never fails the scrape."""
+    if not PAGE_ARCHIVE_ENABLED or not body:
+        return
+    try:
+        codec, compressed = compress(body)
+        connection = get_connection()
+        connection.execute(
+            "INSERT INTO pages (product_key, store_name, product_url, fetched_at, codec, body) VALUES (?, ?, ?, ?, ?, ?)",
+            (canonical_url.canonicalize(product_url, store_name), store_name, product_url, time.time(), codec, compressed)
+        )
+        connection.close()
+    except Exception as e:
+        print(f"Error archiving page {product_url}: {e}")
+
+
+def load(product_key, fetched_at=None):
+    """Return the body of the latest archived page of a product (or the one fetched at fetched_at)."""
+    connection = get_connection()
+    if fetched_at is None:
+        row = connection.execute(
+            "SELECT codec, body FROM pages WHERE product_key = ? ORDER BY fetched_at DESC LIMIT 1", (product_key,)
+        ).fetchone()
+    else:
+        row = connection.execute(
+            "SELECT codec, body FROM pages WHERE product_key = ? AND fetched_at = ?", (product_key, fetched_at)
+        ).fetchone()
+    connection.close()
+    return decompress(*row) if row else None
+
+
+def get_parser(store_name):
+    module_name, function_name = PARSERS[store_name]
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def _parse(page):
+    product_key, store_name, product_url, codec, body, fetched_at = page
+    try:
+        return product_key, store_name, product_url, fetched_at, get_parser(store_name)(decompress(codec, body), product_url), None
+    except Exception as e:
+        return product_key, store_name, product_url, fetched_at, None, str(e)
+
+
+def latest_pages(store_name=None):
+    """Yield (product_key, store, url, codec, body, fetched_at) of the latest page of every archived product."""
+    connection = get_connection()
+    sql = """
+        SELECT p.product_key, p.store_name, p.product_url, p.codec, p.body, p.fetched_at FROM pages p
+        JOIN (SELECT product_key, MAX(fetched_at) AS fetched_at FROM pages GROUP BY product_key) latest
+          ON latest.product_key = p.product_key AND latest.fetched_at = p.fetched_at
+    """
+    params = ()
+    if store_name:
+        sql += " WHERE p.store_name = ?"
+        params = (store_name,)
+    for row in connection.execute(sql, params):
+        yield row
+    connection.close()
+
+
+def reparse(store_name=None, workers=None, dry_run=False):
+    """Run the current parsers over the archived pages and update the scrape cache. No network is used."""
+    import scrape_cache
+
+    start = time.time()
+    parsed = failed = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for product_key, store, product_url, fetched_at, data, error in executor.map(_parse, latest_pages(store_name), chunksize=16):
+            if error:
+                failed += 1
+                print(f"Error parsing {product_key}: {error}")
+                continue
+            parsed += 1
+            if not dry_run:
+                # as old as the page, so the cache still refreshes it when stale
+                scrape_cache.put(product_key, store, product_url, data, fetched_at)
+
+    elapsed = time.time() - start
+    print(f"Re-parsed {parsed} pages ({failed} failed) in {elapsed:.1f}s")
+    return parsed, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archived product pages.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    reparse_parser = subparsers.add_parser("reparse", help="re-run the parsers over the archive and update the scrape cache")
+    reparse_parser.add_argument("--store", choices=sorted(PARSERS), help="only pages of this store")
+    reparse_parser.add_argument("-w", "--workers", type=int, help="parser processes (default: CPU count)")
+    reparse_parser.add_argument("--dry-run", action="store_true", help="parse without updating the scrape cache")
+    args = parser.parse_args()
+
+    if args.command == "reparse":
+        _, failed = reparse(args.store, args.workers, args.dry_run)
+        return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,178 @@
+import os
+import re
+import hmac
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from datetime import datetime
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Requests whose header carries PROFILE_TOKEN (e.g. "X-Profile: <token>") are profiled; without a
+# configured token the header is ignored, so clients cannot profile at will
+PROFILE_HEADER = os.getenv('PROFILE_HEADER', 'X-Profile')
+PROFILE_TOKEN = os.getenv('PROFILE_TOKEN')
+# Share of requests profiled without the header, 0 disables sampling
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL', 0.005))
+PROFILED_PATHS = {'/product-details', '/generate-blog'}
+
+
+def should_profile(path, headers):
+    """Whether the request at `path` with `headers` is profiled; only a set lookup when profiling is off."""
+    if path not in PROFILED_PATHS:
+        return False
+    value = headers.get(PROFILE_HEADER)
+    if value and PROFILE_TOKEN:
+        return hmac.compare_digest(value.encode(), PROFILE_TOKEN.encode())
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def _frame_name(code):
+    # flamegraph.pl separates frames with ";", one frame per function
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+
+
+def _stack(frame):
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class Sampler:
+    """Samples the stack of one thread from a background thread.
+
+    The wall profile counts a sample per interval whatever the thread is doing (waiting on
+    OpenAI included), the CPU profile weights each sample by the CPU time the thread used
+    since the previous one (microseconds).
+    """
+
+    def __init__(self, thread_id=None, interval=PROFILE_INTERVAL):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.wall = {}
+        self.cpu = {}
+        self.samples = 0
+        self.started = None
+        self.duration = None
+        self._stop = threading.Event()
+        self._thread = None
+        try:
+            self._clock = time.pthread_getcpuclockid(self.thread_id)
+        except (AttributeError, OSError):
+            self._clock = None
+
+    def start(self):
+        self.started = time.time()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.time() - self.started
+        return self
+
+    def _cpu_time(self):
+        try:
+            return time.clock_gettime(self._clock) if self._clock is not None else None
+        except OSError:
+            return None
+
+    def _run(self):
+        last_cpu = self._cpu_time()
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                break
+            stack = _stack(frame)
+            del frame
+            self.wall[stack] = self.wall.get(stack, 0) + 1
+            self.samples += 1
+            cpu = self._cpu_time()
+            if cpu is not None and last_cpu is not None:
+                used = int((cpu - last_cpu) * 1e6)
+                if used > 0:
+                    self.cpu[stack] = self.cpu.get(stack, 0) + used
+            last_cpu = cpu
+
+    def save(self, metadata=None, directory=PROFILE_DIR):
+        """Write wall.folded, cpu.folded (collapsed stacks for flamegraph.pl / speedscope) and
+        meta.json to a new directory under `directory`; returns its path."""
+        name = re.sub(r'[^A-Za-z0-9_-]+', '-', (metadata or {}).get('path', 'profile')).strip('-')
+        path = os.path.join(directory, f"{datetime.fromtimestamp(self.started).strftime('%Y%m%d-%H%M%S')}-{name}-{os.urandom(3).hex()}")
+        os.makedirs(path, exist_ok=True)
+        for file_name, stacks in (("wall.folded", self.wall), ("cpu.folded", self.cpu)):
+            with open(os.path.join(path, file_name), "w") as f:
+                f.write("".join(f"{stack} {count}\n" for stack, count in sorted(stacks.items())))
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump({
+                **{key: value for key, value in (metadata or {}).items() if value is not None},
+                "started": datetime.fromtimestamp(self.started).isoformat(),
+                "duration": round(self.duration, 3),
+                "interval": self.interval,
+                "samples": self.samples,
+                "cpu_seconds": round(sum(self.cpu.values()) / 1e6, 3) if self._clock is not None else None,
+                "pid": os.getpid(),
+            }, f, indent=4, default=str)
+        return path
+
+
+def load_folded(path):
+    with open(path) as f:
+        return {stack: int(count) for stack, _, count in (line.rstrip("\n").rpartition(" ") for line in f) if stack}
+
+
+def top_functions(stacks, limit=20):
+    """[(function, self, total)] ordered by self weight."""
+    own = {}
+    total = {}
+    for stack, count in stacks.items():
+        frames = stack.split(";")
+        own[frames[-1]] = own.get(frames[-1], 0) + count
+        for name in set(frames):
+            total[name] = total.get(name, 0) + count
+    return sorted(((name, own.get(name, 0), total[name]) for name in total), key=lambda row: -row[1])[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Saved request profiles.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    list_parser = subparsers.add_parser("list", help="list the saved profiles")
+    list_parser.add_argument("--dir", default=PROFILE_DIR)
+    top_parser = subparsers.add_parser("top", help="print the heaviest functions of a profile")
+    top_parser.add_argument("profile", help="profile directory")
+    top_parser.add_argument("--cpu", action="store_true", help="CPU instead of wall time")
+    top_parser.add_argument("-n", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.command == "list":
+        if not os.path.isdir(args.dir):
+            return 0
+        for name in sorted(os.listdir(args.dir)):
+            meta_path = os.path.join(args.dir, name, "meta.json")
+            if os.path.exists(meta_path):
+                with open(meta_path) as f:
+                    meta = json.load(f)
+                print(f"{name}  {meta.get('duration')}s  {meta.get('store') or ''} {meta.get('template_id') or ''}")
+        return 0
+
+    if args.command == "top":
+        stacks = load_folded(os.path.join(args.profile, "cpu.folded" if args.cpu else "wall.folded"))
+        weight = sum(stacks.values()) or 1
+        print(f"{'self':>7} {'total':>7}  function")
+        for name, own, total in top_functions(stacks, args.n):
+            print(f"{own / weight:7.1%} {total / weight:7.1%}  {name}")
+        return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,185 @@
+import os
+import re
+import sys
+import json
+import importlib
+from langchain_core.output_parsers import JsonOutputParser
+from langchain_core.output_parsers.format_instructions import JSON_FORMAT_INSTRUCTIONS
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TEMPLATES = [f"template_{i}" for i in range(1, 8)]
+
+# Include the schema_extra example in the prompt (off by default, it is the bulk of the prompt)
+INCLUDE_EXAMPLE = os.getenv('PROMPT_INCLUDE_EXAMPLE', 'false').lower() in ('1', 'true', 'yes')
+
+# Matches the word / character budgets in field descriptions, e.g. "(3-5 words, 20-25 characters)"
+LENGTH_HINT_RE = re.compile(r'\(([^()]*\d+\s*-\s*\d+\s*(?:words|characters)[^()]*)\)')
+
+# JSON schema keys that carry constraints and must survive compaction
+CONSTRAINT_KEYS = ["type", "minItems", "maxItems", "minLength", "maxLength", "minimum", "maximum", "enum"]
+
+
+def get_length_hint(description):
+    """Return the "(x-y words, a-b characters)" part of a field description, if any."""
+    if not description:
+        return None
+    match = LENGTH_HINT_RE.search(description)
+    return match.group(1).strip() if match else None
+
+
+def _resolve(node, definitions):
+    if "$ref" in node:
+        return definitions[node["$ref"].split('/')[-1]]
+    if "allOf" in node and len(node["allOf"]) == 1:
+        return _resolve(node["allOf"][0], definitions)
+    return node
+
+
+def _compact_node(node, definitions, include_descriptions):
+    node = _resolve(node, definitions)
+    compact = {key: node[key] for key in CONSTRAINT_KEYS if key in node}
+
+    description = node.get("description")
+    if description:
+        if include_descriptions:
+            compact["description"] = description
+        else:
+            hint = get_length_hint(description)
+            if hint:
+                compact["description"] = f"({hint})"
+
+    if "items" in node:
+        compact["items"] = _compact_node(node["items"], definitions, include_descriptions)
+
+    if "properties" in node:
+        compact["type"] = "object"
+        compact["properties"] = {
+            name: _compact_node(prop, definitions, include_descriptions)
+            for name, prop in node["properties"].items()
+        }
+        if node.get("required"):
+            compact["required"] = node["required"]
+
+    return compact
+
+
+def compile_schema(schema_class, include_example=False, include_descriptions=True):
+    """Build a compact JSON schema for a template model.
+
+    Titles are dropped and definitions are inlined. With include_descriptions=False only
+    the length hints of the descriptions are kept.
+    """
+    schema = schema_class.schema()
+    definitions = schema.get("definitions", {})
+    compact = _compact_node(schema, definitions, include_descriptions)
+    compact.pop("type", None)
+
+    if include_example:
+        example = schema.get("example")
+        if example:
+            compact["example"] = example
+
+    return compact
+
+
+def get_format_instructions(schema_class, include_example=False, include_descriptions=True):
+    schema = compile_schema(schema_class, include_example, include_descriptions)
+    schema_str = json.dumps(schema, ensure_ascii=False, separators=(',', ':'))
+    return JSON_FORMAT_INSTRUCTIONS.format(schema=schema_str)
+
+
+class CompactJsonOutputParser(JsonOutputParser):
+    """JsonOutputParser that sends the compact schema instead of the full pydantic schema."""
+    include_example: bool = INCLUDE_EXAMPLE
+    include_descriptions: bool = True
+
+    def get_format_instructions(self) -> str:
+        if self.pydantic_object is None:
+            return "Return a JSON object."
+        return get_format_instructions(self.pydantic_object, self.include_example, self.include_descriptions)
+
+
+def count_tokens(text, model="gpt-4o"):
+    """Count tokens with tiktoken when it is usable, otherwise estimate 4 characters per token."""
+    try:
+        import tiktoken
+        try:
+            encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            encoding = tiktoken.get_encoding("o200k_base")
+        return len(encoding.encode(text))
+    except Exception:
+        # tiktoken missing, or its encoding files cannot be downloaded
+        return (len(text) + 3) // 4
+
+
+def _collect_constraints(node, definitions, path, out):
+    node = _resolve(node, definitions)
+    constraints = {key: node[key] for key in CONSTRAINT_KEYS if key in node}
+    constraints["length_hint"] = get_length_hint(node.get("description"))
+    out[path] = constraints
+
+    for name in node.get("required", []):
+        out[f"{path}.{name}"] = {"required": True}
+    if "items" in node:
+        _collect_constraints(node["items"], definitions, f"{path}[]", out)
+    for name, prop in node.get("properties", {}).items():
+        _collect_constraints(prop, definitions, f"{path}.{name}", out)
+
+
+def check_schema(schema_class, include_descriptions=True):
+    """Compare the compact schema with the full one.
+
+    Returns a list of problems: every field, type, required flag, item constraint and length
+    hint of the full schema has to be present in the compact schema, otherwise the model is
+    no longer told the same thing and output quality can drop.
+    """
+    full_schema = schema_class.schema()
+    full, compact = {}, {}
+    _collect_constraints(full_schema, full_schema.get("definitions", {}), "$", full)
+    _collect_constraints(compile_schema(schema_class, include_descriptions=include_descriptions), {}, "$", compact)
+    # the root type is implied by the instructions
+    full["$"].pop("type", None)
+
+    problems = []
+    for path, constraints in full.items():
+        if path not in compact:
+            problems.append(f"{path}: missing")
+            continue
+        for key, value in constraints.items():
+            if value is not None and compact[path].get(key) != value:
+                problems.append(f"{path}: {key} {value!r} != {compact[path].get(key)!r}")
+    return problems
+
+
+def get_template_classes(file_name):
+    """Return the pydantic classes a template module exposes to the generation steps."""
+    module = importlib.import_module(file_name if '.' in file_name else f"templates.{file_name}")
+    return {name: getattr(module, name) for name in ("Product", "Description", "ProductReview") if hasattr(module, name)}
+
+
+def report(include_descriptions=True):
+    """Print prompt size per template and schema, and return the regression problems found."""
+    all_problems = []
+    print(f"{'template':<15} {'schema':<14} {'full':>6} {'compact':>8} {'+example':>9} {'saved':>6}")
+    for file_name in TEMPLATES + ["Schema.Product"]:
+        for name, schema_class in get_template_classes(file_name).items():
+            full = count_tokens(JsonOutputParser(pydantic_object=schema_class).get_format_instructions())
+            compact = count_tokens(get_format_instructions(schema_class, False, include_descriptions))
+            with_example = count_tokens(get_format_instructions(schema_class, True, include_descriptions))
+            saved = 100 - (compact * 100 // full) if full else 0
+            print(f"{file_name:<15} {name:<14} {full:>6} {compact:>8} {with_example:>9} {saved:>5}%")
+
+            for problem in check_schema(schema_class, include_descriptions):
+                all_problems.append(f"{file_name}.{name} {problem}")
+
+    for problem in all_problems:
+        print("Regression:", problem)
+    return all_problems
+
+
+if __name__ == '__main__':
+    problems = report(include_descriptions='--minimal' not in sys.argv)
+    sys.exit(1 if problems else 0)
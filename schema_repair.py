@@ -0,0 +1,106 @@
+import os
+import copy
+import json
+import threading
+from typing import get_type_hints
+from pydantic.v1 import ValidationError, create_model
+from dotenv import load_dotenv
+from prompt_compiler import CompactJsonOutputParser
+import model_router
+
+load_dotenv()
+
+# Number of repair rounds per generated object before the output is returned as it is
+REPAIR_BUDGET = int(os.getenv('REPAIR_BUDGET', 2))
+
+_lock = threading.Lock()
+_repairs = {}
+
+
+def get_failing_fields(data, schema_class):
+    """Validate data against the template class and return {field: [errors]} for top-level fields."""
+    try:
+        schema_class.parse_obj(data)
+        return {}
+    except ValidationError as e:
+        failing = {}
+        for error in e.errors():
+            loc = error.get('loc', ())
+            if not loc or loc[0] not in schema_class.__fields__:
+                continue
+            location = ".".join(str(part) for part in loc)
+            failing.setdefault(loc[0], []).append(f"{location}: {error.get('msg')}")
+        return failing
+
+
+def field_model(schema_class, field_name):
+    """Build a model holding only one field of the template class, with the same constraints."""
+    # __fields__ holds the already constrained type, the declared one is needed to re-apply min_items
+    annotation = get_type_hints(schema_class)[field_name]
+    field_info = copy.copy(schema_class.__fields__[field_name].field_info)
+    return create_model(
+        f"{schema_class.__name__}_{field_name}",
+        **{field_name: (annotation, field_info)}
+    )
+
+
+def regenerate_field(data, schema_class, field_name, errors, context="", template_id=None, language=None):
+    """Ask the model for a single field and return its new value."""
+    parser = CompactJsonOutputParser(pydantic_object=field_model(schema_class, field_name))
+    current = json.dumps(data.get(field_name), ensure_ascii=False, default=str)
+    prompt = f"""
+        The field "{field_name}" of a generated product does not match its schema.
+        Current value: {current}
+        Problems: {"; ".join(errors)}
+        {context}
+        Return only the corrected "{field_name}" field in {language or "English"} Language.
+    """
+
+    msg = model_router.invoke(
+        "repair",
+        [
+            {"type": "text", "text": prompt},
+            {"type": "text", "text": parser.get_format_instructions()}
+        ],
+        template_id=template_id,
+        language=language
+    )
+    return parser.parse(msg.content)[field_name]
+
+
+def _count(schema_class, field_name, fixed):
+    key = (schema_class.__name__, field_name)
+    with _lock:
+        counts = _repairs.setdefault(key, {"attempts": 0, "fixed": 0})
+        counts["attempts"] += 1
+        counts["fixed"] += 1 if fixed else 0
+
+
+def repair(data, schema_class, context="", template_id=None, language=None, budget=REPAIR_BUDGET):
+    """Re-ask only the fields that fail validation and merge them back into data.
+
+    Each round regenerates every failing field once; after `budget` rounds the data is
+    returned with whatever is still invalid.
+    """
+    if not isinstance(data, dict):
+        return data
+
+    for _ in range(budget):
+        failing = get_failing_fields(data, schema_class)
+        if not failing:
+            break
+
+        for field_name, errors in failing.items():
+            try:
+                data[field_name] = regenerate_field(
+                    data, schema_class, field_name, errors, context, template_id, language)
+            except Exception as e:
+                print(f"Error repairing field {field_name}: {e}")
+            _count(schema_class, field_name, field_name not in get_failing_fields(data, schema_class))
+
+    return data
+
+
+def get_repair_stats():
+    with _lock:
+        return [{"schema": schema, "field": field, **counts} for (schema, field), counts in _repairs.items()]
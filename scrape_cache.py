@@ -0,0 +1,185 @@
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import threading
+import contextvars
+from dotenv import load_dotenv
+import canonical_url
+
+load_dotenv()
+
+SCRAPE_CACHE_PATH = os.getenv('SCRAPE_CACHE_PATH', 'scrape_cache.sqlite3')
+
+# Seconds a scrape result is fresh, per store. Stale results are still served (and refreshed
+# in the background) until SCRAPE_CACHE_MAX_STALE.
+SCRAPE_CACHE_TTL = {
+    "amazon": 6 * 3600,
+    "aliexpress": 6 * 3600,
+    "alibaba": 12 * 3600,
+    "shopify": 3600,
+    "default": 3600,
+}
+SCRAPE_CACHE_TTL.update(json.loads(os.getenv('SCRAPE_CACHE_TTL', '{}')))
+SCRAPE_CACHE_MAX_STALE = int(os.getenv('SCRAPE_CACHE_MAX_STALE', 7 * 24 * 3600))
+
+_lock = threading.Lock()
+_refreshing = set()
+_background_tasks = set()
+_stats = {"hits": 0, "stale": 0, "misses": 0, "refreshes": 0, "refresh_errors": 0}
+
+
+def get_connection():
+    connection = sqlite3.connect(SCRAPE_CACHE_PATH, timeout=30, isolation_level=None)
+    connection.row_factory = sqlite3.Row
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS scrape_cache (
+            product_key TEXT PRIMARY KEY,
+            store_name TEXT NOT NULL,
+            product_url TEXT NOT NULL,
+            data TEXT NOT NULL,
+            fetched_at REAL NOT NULL
+        )
+    """)
+    return connection
+
+
+def get(product_key):
+    """Return (data, age in seconds) of a cached scrape, or (None, None)."""
+    connection = get_connection()
+    row = connection.execute(
+        "SELECT data, fetched_at FROM scrape_cache WHERE product_key = ?", (product_key,)
+    ).fetchone()
+    connection.close()
+    if not row:
+        return None, None
+    return json.loads(row['data']), time.time() - row['fetched_at']
+
+
+def put(product_key, store_name, product_url, data, fetched_at=None):
+    """Store a scrape; fetched_at (epoch seconds) defaults to now."""
+    connection = get_connection()
+    connection.execute(
+        "INSERT OR REPLACE INTO scrape_cache (product_key, store_name, product_url, data, fetched_at) "
+        "VALUES (?, ?, ?, ?, ?)",
+        (product_key, store_name, product_url, json.dumps(data), fetched_at or time.time())
+    )
+    connection.close()
+
+
+def _count(name):
+    with _lock:
+        _stats[name] += 1
+
+
+def _fetch_and_store(product_key, store_name, product_url, fetch):
+    response = fetch(store_name, product_url)
+    # failed scrapes are not cached, the next request tries again
+    if response.get('success', False):
+        put(product_key, store_name, product_url, response['data'])
+    return response
+
+
+def _refresh(product_key, store_name, product_url, fetch):
+    try:
+        _fetch_and_store(product_key, store_name, product_url, fetch)
+        _count("refreshes")
+    except Exception as e:
+        print(f"Error refreshing {product_url}: {e}")
+        _count("refresh_errors")
+    finally:
+        with _lock:
+            _refreshing.discard(product_key)
+
+
+def refresh_in_background(product_key, store_name, product_url, fetch):
+    """Start one background refresh per key; returns False if one is already running."""
+    with _lock:
+        if product_key in _refreshing:
+            return False
+        _refreshing.add(product_key)
+    context = contextvars.copy_context()
+    threading.Thread(target=context.run, args=(_refresh, product_key, store_name, product_url, fetch), daemon=True).start()
+    return True
+
+
+def _lookup(product_key, store_name):
+    """(cached data, whether it is stale) of a usable cache entry, or (None, False)."""
+    data, age = get(product_key)
+    if data is not None:
+        ttl = SCRAPE_CACHE_TTL.get(store_name, SCRAPE_CACHE_TTL["default"])
+        if age <= ttl:
+            _count("hits")
+            return data, False
+        if age <= SCRAPE_CACHE_MAX_STALE:
+            _count("stale")
+            return data, True
+    return None, False
+
+
+def get_or_fetch(store_name, product_url, fetch, force_refresh=False):
+    """Return the scrape of a product from the cache, calling fetch(store_name, product_url) on a miss.
+
+    Fresh results are returned as they are. Stale ones are returned at once and refreshed
+    in the background. force_refresh always scrapes again.
+    """
+    product_key = canonical_url.canonicalize(product_url, store_name)
+
+    if not force_refresh:
+        data, stale = _lookup(product_key, store_name)
+        if data is not None:
+            if stale:
+                refresh_in_background(product_key, store_name, product_url, fetch)
+            return {"success": 1, "data": data}
+
+    _count("misses")
+    return _fetch_and_store(product_key, store_name, product_url, fetch)
+
+
+async def _arefresh(product_key, store_name, product_url, afetch):
+    try:
+        response = await afetch(store_name, product_url)
+        if response.get('success', False):
+            put(product_key, store_name, product_url, response['data'])
+        _count("refreshes")
+    except Exception as e:
+        print(f"Error refreshing {product_url}: {e}")
+        _count("refresh_errors")
+    finally:
+        with _lock:
+            _refreshing.discard(product_key)
+
+
+async def aget_or_fetch(store_name, product_url, afetch, force_refresh=False):
+    """get_or_fetch() for coroutines: awaits afetch(store_name, product_url), refreshes in a task.
+
+    The SQLite reads and writes stay synchronous, they take milliseconds on the local file.
+    """
+    product_key = canonical_url.canonicalize(product_url, store_name)
+
+    if not force_refresh:
+        data, stale = _lookup(product_key, store_name)
+        if data is not None:
+            if stale:
+                with _lock:
+                    refresh = product_key not in _refreshing
+                    _refreshing.add(product_key)
+                if refresh:
+                    task = asyncio.create_task(_arefresh(product_key, store_name, product_url, afetch))
+                    # the loop only keeps weak references to tasks
+                    _background_tasks.add(task)
+                    task.add_done_callback(_background_tasks.discard)
+            return {"success": 1, "data": data}
+
+    _count("misses")
+    response = await afetch(store_name, product_url)
+    if response.get('success', False):
+        put(product_key, store_name, product_url, response['data'])
+    return response
+
+
+def get_stats():
+    with _lock:
+        return {**_stats, "refreshing": len(_refreshing)}
@@ -0,0 +1,159 @@
+"""Production entry point.
+
+    python serve.py web     # gunicorn, WEB_WORKERS processes of WEB_THREADS threads each
+    python serve.py jobs    # the job queue workers of /product-details?async=1
+    python serve.py asgi    # uvicorn, the async /generate-blog and /product-details of asgi.py
+
+Run both (as two services) in production. Each web and job worker builds its own resources
+through app.create_app() after the fork. Workers are recycled after WEB_MAX_REQUESTS
+requests (with jitter) or when their RSS passes WEB_MAX_RSS_MB. On SIGTERM, in-flight
+requests and jobs get WEB_GRACEFUL_TIMEOUT / JOB_DRAIN_TIMEOUT seconds to finish, then
+every Chrome of the process is quit. A job worker that dies (e.g. out of memory) is replaced.
+
+The asgi server takes the same WEB_ settings; one worker waits on hundreds of OpenAI calls,
+so WEB_THREADS does not apply. Route the other endpoints to the web server.
+"""
+import os
+import sys
+import time
+import signal
+import argparse
+from dotenv import load_dotenv
+from gunicorn.app.base import BaseApplication
+
+load_dotenv()
+
+WEB_BIND = os.getenv('WEB_BIND', '0.0.0.0:8080')
+# Every worker can hold several Chromes, size this to memory rather than to cores
+WEB_WORKERS = int(os.getenv('WEB_WORKERS', 2))
+WEB_THREADS = int(os.getenv('WEB_THREADS', 8))
+# A generation with descriptions and reviews takes minutes
+WEB_TIMEOUT = int(os.getenv('WEB_TIMEOUT', 900))
+WEB_GRACEFUL_TIMEOUT = int(os.getenv('WEB_GRACEFUL_TIMEOUT', 300))
+WEB_MAX_REQUESTS = int(os.getenv('WEB_MAX_REQUESTS', 1000))
+WEB_MAX_REQUESTS_JITTER = int(os.getenv('WEB_MAX_REQUESTS_JITTER', 100))
+# Recycle a worker after the request that takes it above this RSS, 0 disables
+WEB_MAX_RSS_MB = float(os.getenv('WEB_MAX_RSS_MB', 0))
+# Shortest time between starting a job worker and starting its replacement
+JOB_RESPAWN_DELAY = float(os.getenv('JOB_RESPAWN_DELAY', 5))
+
+
+def post_request(worker, req, environ, resp):
+    if not WEB_MAX_RSS_MB:
+        return
+    import memory_monitor
+    rss = memory_monitor.list_processes().get(os.getpid(), {}).get("rss", 0) / 1024 / 1024
+    if rss > WEB_MAX_RSS_MB and worker.alive:
+        worker.log.info("Recycling worker %s at %.0f MB RSS", worker.pid, rss)
+        # stops accepting and exits once the in-flight requests are done, the arbiter starts a fresh one
+        worker.alive = False
+
+
+def worker_exit(server, worker):
+    import memory_monitor
+    import tracing
+    memory_monitor.quit_drivers()
+    tracing.flush()
+
+
+class WebApplication(BaseApplication):
+    def __init__(self, options):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        # imported in the worker after the fork, nothing is shared with the arbiter
+        from app import create_app
+        return create_app()
+
+
+def run_web(args):
+    WebApplication({
+        "bind": args.bind,
+        "workers": args.workers,
+        "worker_class": "gthread",
+        "threads": args.threads,
+        "timeout": WEB_TIMEOUT,
+        "graceful_timeout": WEB_GRACEFUL_TIMEOUT,
+        "max_requests": WEB_MAX_REQUESTS,
+        "max_requests_jitter": WEB_MAX_REQUESTS_JITTER,
+        "post_request": post_request,
+        "worker_exit": worker_exit,
+        "accesslog": "-",
+    }).run()
+
+
+def run_asgi(args):
+    import uvicorn
+    host, _, port = args.bind.rpartition(':')
+    uvicorn.run(
+        "asgi:app",
+        host=host or '0.0.0.0',
+        port=int(port),
+        workers=args.workers,
+        timeout_graceful_shutdown=WEB_GRACEFUL_TIMEOUT,
+        limit_max_requests=WEB_MAX_REQUESTS or None,
+    )
+
+
+def run_jobs(args):
+    import job_queue
+    from app import create_app, run_product_details
+
+    # each worker initialises itself after the fork; a reaper in this supervisor would see the
+    # workers' Chromes as its own
+    workers = job_queue.start_workers(run_product_details, args.workers, initializer=create_app)
+    print(f"Started {len(workers)} job workers")
+
+    def stop(signum, frame):
+        print("Draining job workers")
+        job_queue.stop_workers()
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    while True:
+        for process in list(workers):
+            process.join(1)
+            if not process.is_alive():
+                print(f"Job worker {process.pid} exited with {process.exitcode}")
+                workers.remove(process)
+                # the job it was running goes back to the queue for the other workers
+                requeued = job_queue.requeue_interrupted()
+                if requeued:
+                    print(f"Requeued {requeued} jobs of job worker {process.pid}")
+                # a worker dying right after its start would die again, do not respawn it in a tight loop
+                time.sleep(max(0, process.started_at + JOB_RESPAWN_DELAY - time.time()))
+                replacement = job_queue.start_worker(run_product_details, initializer=create_app)
+                print(f"Started job worker {replacement.pid} in place of {process.pid}")
+        if not workers:
+            return 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Production server.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    web_parser = subparsers.add_parser("web", help="serve the API")
+    web_parser.add_argument("--bind", default=WEB_BIND)
+    web_parser.add_argument("--workers", type=int, default=WEB_WORKERS)
+    web_parser.add_argument("--threads", type=int, default=WEB_THREADS)
+    asgi_parser = subparsers.add_parser("asgi", help="serve the async endpoints")
+    asgi_parser.add_argument("--bind", default=WEB_BIND)
+    asgi_parser.add_argument("--workers", type=int, default=WEB_WORKERS)
+    jobs_parser = subparsers.add_parser("jobs", help="run the job queue workers")
+    jobs_parser.add_argument("--workers", type=int, default=int(os.getenv('JOB_WORKERS', 2)))
+    args = parser.parse_args()
+
+    if args.command == "web":
+        return run_web(args)
+    if args.command == "asgi":
+        return run_asgi(args)
+    return run_jobs(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,35 +1,73 @@
 import requests
 from urllib.parse import urlparse
 import json
+from canonical_url import get_shopify_handle
+import page_archive
+import domain_scheduler
+import proxy_pool
+import metrics
 
 def extract_domain_and_handle(product_url):
     parsed_url = urlparse(product_url)
     domain = f"{parsed_url.scheme}://{parsed_url.netloc}"
-    handle = parsed_url.path.split('/')[-1]
+    # /products/<handle> or /collections/<x>/products/<handle>, with or without trailing slash
+    handle = get_shopify_handle(parsed_url.path) or parsed_url.path.rstrip('/').split('/')[-1]
     return domain, handle
 
 
+def parse_shopify_json(body, product_url=None):
+    """Extract the product fields from a Shopify /products/<handle>.json body (its image URLs are absolute)."""
+    product = json.loads(body).get('product', {})
+
+    title = product.get('title', '')
+    price = product.get('variants', [{}])[0].get('price', '')
+    description = product.get('body_html', '')
+    images = [image.get('src', '') for image in product.get('images', [])]
+
+    return {
+        "title": title,
+        "price": price,
+        "description": description,
+        "images": images if images else []
+    }
+
+
+@metrics.timed("fetch", store="shopify")
 def fetch_shopify_product_detail(product_url):
     try:
         domain, product_handle = extract_domain_and_handle(product_url)
         product_url = f"{domain}/products/{product_handle}.json"
-        response = requests.get(product_url)
+        proxy = proxy_pool.choose(product_url)
+        with domain_scheduler.slot(product_url, proxy) as slot:
+            response = requests.get(product_url, proxies=proxy_pool.requests_proxies(proxy), timeout=proxy_pool.PROXY_TIMEOUT)
+            slot.blocked = response.status_code in (429, 503)
+
+        if response.status_code == 200:
+            page_archive.save("shopify", product_url, response.text)
+            found_data = parse_shopify_json(response.text)
+            return {'success': 1, 'data': found_data}
+        else:
+            return {'success': 0, 'message': "Product Not Found"}
+
+    except Exception as e:
+        print(f"Error occurred: {e}")
+        return {'success': 0, 'message': "Error while fetching product"}
+
+
+@metrics.timed("fetch", store="shopify")
+async def afetch_shopify_product_detail(product_url):
+    """fetch_shopify_product_detail() for coroutines."""
+    try:
+        domain, product_handle = extract_domain_and_handle(product_url)
+        product_url = f"{domain}/products/{product_handle}.json"
+        proxy = proxy_pool.choose(product_url)
+        async with domain_scheduler.aslot(product_url, proxy) as slot:
+            response = await proxy_pool.get_async_client(proxy).get(product_url)
+            slot.blocked = response.status_code in (429, 503)
 
         if response.status_code == 200:
-            product = response.json().get('product', {})
-
-            title = product.get('title', '')
-            price = product.get('variants', [{}])[0].get('price', '')
-            description = product.get('body_html', '')
-            images = [image.get('src', '') for image in product.get('images', [])]
-
-            # Return custom data
-            found_data = {
-                "title": title,
-                "price": price,
-                "description": description,
-                "images": images if images else []
-            }
+            page_archive.save("shopify", product_url, response.text)
+            found_data = parse_shopify_json(response.text)
             return {'success': 1, 'data': found_data}
         else:
             return {'success': 0, 'message': "Product Not Found"}
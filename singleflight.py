@@ -0,0 +1,119 @@
+import copy
+import asyncio
+import threading
+import canonical_url
+
+_lock = threading.Lock()
+_calls = {}
+_stats = {}
+_async_calls = {}
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class _AsyncCall:
+    def __init__(self):
+        self.task = None
+        self.waiters = 0
+        # callers still awaiting the task
+        self.pending = 0
+
+
+def product_key(store_name, product_url):
+    """Identity of a product page, see canonical_url.canonicalize."""
+    return canonical_url.canonicalize(product_url, store_name)
+
+
+def do(key, fn, *args, **kwargs):
+    """Run fn once for concurrent callers with the same key and give all of them its result.
+
+    The first caller runs fn, callers arriving while it runs wait and get their own copy of
+    the result (or the same exception). Only threads of one process are coalesced.
+    Keys are tuples whose first item names the stage the fan-out counts are kept under.
+    """
+    leader = False
+    with _lock:
+        call = _calls.get(key)
+        if call:
+            call.waiters += 1
+        else:
+            call = _calls[key] = _Call()
+            leader = True
+
+    if not leader:
+        call.done.wait()
+        if call.error:
+            raise call.error
+        return copy.deepcopy(call.result)
+
+    result = None
+    try:
+        result = fn(*args, **kwargs)
+        return result
+    except Exception as e:
+        call.error = e
+        raise
+    finally:
+        with _lock:
+            del _calls[key]
+            stats = _stats.setdefault(key[0], {"calls": 0, "shared": 0, "max_fan_out": 0})
+            stats["calls"] += 1
+            stats["shared"] += call.waiters
+            stats["max_fan_out"] = max(stats["max_fan_out"], call.waiters + 1)
+        if call.waiters:
+            # snapshot before the leader's caller starts changing the result
+            call.result = copy.deepcopy(result)
+        call.done.set()
+
+
+async def _run(key, call, fn, args, kwargs):
+    try:
+        return await fn(*args, **kwargs)
+    finally:
+        # before the task is done, later callers start a new run
+        del _async_calls[key]
+        with _lock:
+            stats = _stats.setdefault(key[0], {"calls": 0, "shared": 0, "max_fan_out": 0})
+            stats["calls"] += 1
+            stats["shared"] += call.waiters
+            stats["max_fan_out"] = max(stats["max_fan_out"], call.waiters + 1)
+
+
+async def ado(key, fn, *args, **kwargs):
+    """do() for coroutines: callers with the same key await one run of the coroutine fn.
+
+    The run is a task of its own, so a caller being cancelled does not cancel it for the
+    others; it is cancelled once no caller is left. Only tasks of one event loop are
+    coalesced, separately from the threads of do().
+    """
+    call = _async_calls.get(key)
+    if call is None:
+        call = _async_calls[key] = _AsyncCall()
+        call.task = asyncio.ensure_future(_run(key, call, fn, args, kwargs))
+        # an error nobody awaited any more is not reported as never retrieved
+        call.task.add_done_callback(lambda done: done.cancelled() or done.exception())
+    else:
+        call.waiters += 1
+
+    call.pending += 1
+    try:
+        result = await asyncio.shield(call.task)
+    except asyncio.CancelledError:
+        call.pending -= 1
+        if not call.pending:
+            call.task.cancel()
+        raise
+    # shared results are copied for every caller, any of them may change its own
+    return copy.deepcopy(result) if call.waiters else result
+
+
+def get_stats():
+    """Return per stage: calls actually run, callers that shared one, and the largest fan-out."""
+    with _lock:
+        return {stage: dict(stats) for stage, stats in _stats.items()}
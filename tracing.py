@@ -0,0 +1,241 @@
+import os
+import sys
+import json
+import time
+import atexit
+import argparse
+import threading
+import contextvars
+from contextlib import contextmanager
+import requests
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TRACING_ENABLED = os.getenv('TRACING_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+# Finished spans are appended to this JSONL file ("" to disable) and/or sent as OTLP/HTTP JSON
+# to a local collector, e.g. TRACE_OTLP_ENDPOINT=http://127.0.0.1:4318/v1/traces
+TRACE_EXPORT_PATH = os.getenv('TRACE_EXPORT_PATH', 'traces.jsonl')
+# The file is rotated to <path>.1 (replacing the previous one) once it passes this size
+TRACE_EXPORT_MAX_MB = float(os.getenv('TRACE_EXPORT_MAX_MB', 50))
+TRACE_OTLP_ENDPOINT = os.getenv('TRACE_OTLP_ENDPOINT')
+TRACE_FLUSH_INTERVAL = float(os.getenv('TRACE_FLUSH_INTERVAL', 2))
+SERVICE_NAME = os.getenv('TRACE_SERVICE_NAME', 'scrappers')
+
+_current = contextvars.ContextVar("trace_span", default=None)
+_lock = threading.Lock()
+_queue = []
+_exporter_pid = None
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "start", "end", "status", "attributes")
+
+    def __init__(self, name, trace_id, parent_id, attributes):
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.start = time.time()
+        self.end = None
+        self.status = "ok"
+        self.attributes = attributes
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration": round(self.end - self.start, 6),
+            "status": self.status,
+            "attributes": self.attributes,
+            "pid": os.getpid(),
+        }
+
+
+class _NoopSpan:
+    trace_id = None
+
+    def set(self, **attributes):
+        pass
+
+
+def parse_traceparent(header):
+    """(trace id, parent span id) of a W3C traceparent header, or None."""
+    parts = (header or "").split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    return parts[1], parts[2]
+
+
+def get_traceparent():
+    """traceparent of the current span, to continue the trace in a job or another service."""
+    current = _current.get()
+    return f"00-{current.trace_id}-{current.span_id}-01" if current else None
+
+
+def current_trace_id():
+    current = _current.get()
+    return current.trace_id if current else None
+
+
+def start(name, parent=None, **attributes):
+    """Start a span as a child of `parent` (a traceparent) or of the current span; returns (span, token)."""
+    if not TRACING_ENABLED:
+        return _NoopSpan(), None
+    current = _current.get()
+    remote = parse_traceparent(parent)
+    if remote:
+        trace_id, parent_id = remote
+    elif current:
+        trace_id, parent_id = current.trace_id, current.span_id
+    else:
+        trace_id, parent_id = os.urandom(16).hex(), None
+    new_span = Span(name, trace_id, parent_id, {key: value for key, value in attributes.items() if value is not None})
+    return new_span, _current.set(new_span)
+
+
+def finish(current, token, error=None):
+    if token is None:
+        return
+    current.end = time.time()
+    if error is not None:
+        current.status = "error"
+        current.attributes["error"] = repr(error)[:300]
+    _current.reset(token)
+    _export(current)
+
+
+@contextmanager
+def span(name, parent=None, **attributes):
+    """Run a block as a span; nested spans become its children.
+
+    New threads start without a span: submit work with contextvars.copy_context().run to keep
+    the trace, and pass get_traceparent() along to other processes.
+    """
+    current, token = start(name, parent, **attributes)
+    try:
+        yield current
+    except BaseException as e:
+        finish(current, token, e)
+        raise
+    finish(current, token)
+
+
+def _export(finished):
+    global _exporter_pid
+    with _lock:
+        _queue.append(finished.to_dict())
+        # one exporter thread per process, worker processes start their own
+        if _exporter_pid != os.getpid():
+            _exporter_pid = os.getpid()
+            threading.Thread(target=_export_loop, daemon=True).start()
+
+
+def _export_loop():
+    while True:
+        time.sleep(TRACE_FLUSH_INTERVAL)
+        flush()
+
+
+def _otlp_payload(spans):
+    def attributes(values):
+        return [{"key": key, "value": {"stringValue": str(value)}} for key, value in values.items()]
+
+    return {"resourceSpans": [{
+        "resource": {"attributes": attributes({"service.name": SERVICE_NAME})},
+        "scopeSpans": [{"scope": {"name": SERVICE_NAME}, "spans": [{
+            "traceId": s["trace_id"],
+            "spanId": s["span_id"],
+            "parentSpanId": s["parent_id"] or "",
+            "name": s["name"],
+            "kind": 1,
+            "startTimeUnixNano": str(int(s["start"] * 1e9)),
+            "endTimeUnixNano": str(int((s["start"] + s["duration"]) * 1e9)),
+            "attributes": attributes({**s["attributes"], "process.pid": s["pid"]}),
+            "status": {"code": 2 if s["status"] == "error" else 1},
+        } for s in spans]}],
+    }]}
+
+
+def _rotate(path):
+    try:
+        if os.path.getsize(path) > TRACE_EXPORT_MAX_MB * 1024 * 1024:
+            os.replace(path, f"{path}.1")
+    except OSError:
+        pass
+
+
+def flush():
+    """Write the finished spans to the exporters."""
+    global _queue
+    with _lock:
+        spans, _queue = _queue, []
+    if not spans:
+        return
+    try:
+        if TRACE_EXPORT_PATH:
+            _rotate(TRACE_EXPORT_PATH)
+            with open(TRACE_EXPORT_PATH, "a") as f:
+                f.write("".join(json.dumps(s) + "\n" for s in spans))
+        if TRACE_OTLP_ENDPOINT:
+            requests.post(TRACE_OTLP_ENDPOINT, json=_otlp_payload(spans), timeout=5)
+    except Exception as e:
+        print(f"Error exporting {len(spans)} spans: {e}")
+
+
+atexit.register(flush)
+
+
+def load_trace(trace_id, path=TRACE_EXPORT_PATH):
+    with open(path) as f:
+        return [span for span in map(json.loads, f) if span["trace_id"] == trace_id]
+
+
+def print_waterfall(spans):
+    """Print the spans of one trace as an indented timeline."""
+    if not spans:
+        print("Trace not found")
+        return
+    children = {}
+    for s in spans:
+        children.setdefault(s["parent_id"], []).append(s)
+    ids = {s["span_id"] for s in spans}
+    roots = [s for s in spans if s["parent_id"] not in ids]
+    origin = min(s["start"] for s in spans)
+    total = max(s["start"] + s["duration"] for s in spans) - origin or 1
+
+    def show(s, depth):
+        offset = s["start"] - origin
+        bar = " " * int(offset / total * 40) + "#" * max(1, int(s["duration"] / total * 40))
+        attributes = " ".join(f"{k}={v}" for k, v in s["attributes"].items())
+        status = " ERROR" if s["status"] == "error" else ""
+        print(f"{offset:8.3f}s {s['duration']:8.3f}s  {bar:<41} {'  ' * depth}{s['name']}{status} {attributes}")
+        for child in sorted(children.get(s["span_id"], []), key=lambda c: c["start"]):
+            show(child, depth + 1)
+
+    for root in sorted(roots, key=lambda r: r["start"]):
+        show(root, 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exported traces.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    show_parser = subparsers.add_parser("show", help="print the waterfall of a trace")
+    show_parser.add_argument("trace_id")
+    show_parser.add_argument("--path", default=TRACE_EXPORT_PATH, help="span file")
+    args = parser.parse_args()
+
+    if args.command == "show":
+        spans = load_trace(args.trace_id, args.path)
+        print_waterfall(spans)
+        return 0 if spans else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,190 @@
+import os
+import json
+import time
+import asyncio
+import threading
+from datetime import datetime
+import openai
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# USD per 1M tokens (input, output), used for the spend estimate
+MODEL_PRICES = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+}
+
+# Retries done here rather than inside the OpenAI client so they can be counted
+MAX_RETRIES = int(os.getenv('OPENAI_MAX_RETRIES', 2))
+
+USAGE_DUMP_PATH = os.getenv('USAGE_DUMP_PATH')
+USAGE_DUMP_INTERVAL = int(os.getenv('USAGE_DUMP_INTERVAL', 60))
+
+_lock = threading.Lock()
+_stats = {}
+_pending = []
+_dump_thread = None
+
+
+def get_usage(msg):
+    usage = getattr(msg, 'usage_metadata', None)
+    if usage:
+        return usage.get('input_tokens', 0), usage.get('output_tokens', 0)
+    token_usage = (getattr(msg, 'response_metadata', None) or {}).get('token_usage', {})
+    return token_usage.get('prompt_tokens', 0), token_usage.get('completion_tokens', 0)
+
+
+def get_cost(model, prompt_tokens, completion_tokens):
+    input_price, output_price = MODEL_PRICES.get(model, MODEL_PRICES["gpt-4o"])
+    return (prompt_tokens * input_price + completion_tokens * output_price) / 1000000
+
+
+def record(stage, template_id=None, language=None, model=None, prompt_tokens=0, completion_tokens=0,
+           images=0, image_bytes=0, latency=0.0, retries=0, success=True):
+    """Add one model call to the in-memory totals and to the pending JSONL dump."""
+    event = {
+        "time": datetime.now().isoformat(),
+        "stage": stage,
+        "template_id": template_id,
+        "language": language,
+        "model": model,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "images": images,
+        "image_bytes": image_bytes,
+        "latency": round(latency, 3),
+        "retries": retries,
+        "success": success,
+        "cost": round(get_cost(model, prompt_tokens, completion_tokens), 6),
+    }
+
+    key = (stage, str(template_id), language)
+    with _lock:
+        totals = _stats.setdefault(key, {
+            "calls": 0, "errors": 0, "prompt_tokens": 0, "completion_tokens": 0, "images": 0,
+            "image_bytes": 0, "latency": 0.0, "max_latency": 0.0, "retries": 0, "cost": 0.0,
+        })
+        totals["calls"] += 1
+        totals["errors"] += 0 if success else 1
+        totals["prompt_tokens"] += prompt_tokens
+        totals["completion_tokens"] += completion_tokens
+        totals["images"] += images
+        totals["image_bytes"] += image_bytes
+        totals["latency"] += latency
+        totals["max_latency"] = max(totals["max_latency"], latency)
+        totals["retries"] += retries
+        totals["cost"] += event["cost"]
+        if USAGE_DUMP_PATH:
+            _pending.append(event)
+    return event
+
+
+def is_retryable(error):
+    """Timeouts, connection errors, 429 and 5xx; a bad request or key would only fail again."""
+    status_code = getattr(error, 'status_code', None)
+    if status_code is not None:
+        return status_code == 429 or status_code >= 500
+    return isinstance(error, (openai.APIConnectionError, TimeoutError, ConnectionError))
+
+
+def invoke(model, messages, stage, template_id=None, language=None, images=None, retries=None):
+    """Invoke a chat model and record tokens, images, latency and retries for it.
+
+    `images` is the list of base64 strings sent with the messages.
+    """
+    retries = MAX_RETRIES if retries is None else retries
+    images = [img for img in (images or []) if img]
+    image_bytes = sum(len(img) * 3 // 4 for img in images)
+    model_name = getattr(model, 'model_name', None)
+
+    start = time.time()
+    for attempt in range(retries + 1):
+        try:
+            msg = model.invoke(messages)
+            break
+        except Exception as e:
+            if attempt == retries or not is_retryable(e):
+                record(stage, template_id, language, model_name, images=len(images), image_bytes=image_bytes,
+                       latency=time.time() - start, retries=attempt, success=False)
+                raise
+            time.sleep(2 ** attempt)
+
+    prompt_tokens, completion_tokens = get_usage(msg)
+    record(stage, template_id, language, model_name, prompt_tokens, completion_tokens,
+           len(images), image_bytes, time.time() - start, attempt)
+    return msg
+
+
+async def ainvoke(model, messages, stage, template_id=None, language=None, images=None, retries=None):
+    """invoke() for coroutines, awaiting model.ainvoke."""
+    retries = MAX_RETRIES if retries is None else retries
+    images = [img for img in (images or []) if img]
+    image_bytes = sum(len(img) * 3 // 4 for img in images)
+    model_name = getattr(model, 'model_name', None)
+
+    start = time.time()
+    for attempt in range(retries + 1):
+        try:
+            msg = await model.ainvoke(messages)
+            break
+        except Exception as e:
+            if attempt == retries or not is_retryable(e):
+                record(stage, template_id, language, model_name, images=len(images), image_bytes=image_bytes,
+                       latency=time.time() - start, retries=attempt, success=False)
+                raise
+            await asyncio.sleep(2 ** attempt)
+
+    prompt_tokens, completion_tokens = get_usage(msg)
+    record(stage, template_id, language, model_name, prompt_tokens, completion_tokens,
+           len(images), image_bytes, time.time() - start, attempt)
+    return msg
+
+
+def get_stats():
+    """Return the aggregated totals, one entry per stage / template / language."""
+    with _lock:
+        items = [(key, dict(totals)) for key, totals in _stats.items()]
+
+    stats = []
+    for (stage, template_id, language), totals in items:
+        totals["avg_latency"] = round(totals["latency"] / totals["calls"], 3)
+        totals["latency"] = round(totals["latency"], 3)
+        totals["max_latency"] = round(totals["max_latency"], 3)
+        totals["cost"] = round(totals["cost"], 6)
+        stats.append({"stage": stage, "template_id": template_id, "language": language, **totals})
+    return stats
+
+
+def dump(path=None):
+    """Append the calls recorded since the last dump to a JSONL file."""
+    path = path or USAGE_DUMP_PATH
+    with _lock:
+        events = _pending[:]
+        _pending.clear()
+
+    if not path or not events:
+        return 0
+    with open(path, 'a') as f:
+        for event in events:
+            f.write(json.dumps(event) + "\n")
+    return len(events)
+
+
+def _dump_loop(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            dump()
+        except Exception as e:
+            print(f"Error writing usage dump: {e}")
+
+
+def start_dump_thread(interval=USAGE_DUMP_INTERVAL):
+    """Start the periodic JSONL dump if USAGE_DUMP_PATH is set."""
+    global _dump_thread
+    if not USAGE_DUMP_PATH or _dump_thread:
+        return None
+    _dump_thread = threading.Thread(target=_dump_loop, args=(interval,), daemon=True)
+    _dump_thread.start()
+    return _dump_thread